@@ -0,0 +1,95 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+# Benchmarks reuse the fixtures of the docker compose based tests; they must be
+# executed in their own pytest session (e.g. ``pytest benchmarks``), the
+# options of the tests being registered by this conftest module as well
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+import pytest
+
+from tests import conftest as tests_conftest
+from tests.conftest import *  # noqa: F401,F403
+from tests.synthetic import SyntheticRepository
+
+from .metrics import collect_archive_usage
+
+
+def pytest_addoption(parser):  # type: ignore[no-redef]
+    tests_conftest.pytest_addoption(parser)
+    parser.addoption(
+        "--benchmark-json",
+        metavar="FILE",
+        default="benchmark-results.json",
+        help="File in which benchmark results are written "
+        "(default: benchmark-results.json)",
+    )
+    parser.addoption(
+        "--benchmark-repos",
+        default="small",
+        help=(
+            "Comma separated names of the synthetic repositories to ingest "
+            "(see conf/origin-server.yml and the SYNTHETIC_SCALES environment "
+            "variable, e.g. small-x100; default: small)"
+        ),
+    )
+    parser.addoption(
+        "--benchmark-visit-types",
+        default="git,hg,svn",
+        help="Comma separated visit types of the synthetic repositories to ingest "
+        "(default: git,hg,svn)",
+    )
+
+
+@pytest.fixture(scope="module")
+def benchmark_origins(
+    pytestconfig, synthetic_repos
+) -> List[Tuple[str, SyntheticRepository]]:
+    names = pytestconfig.getoption("--benchmark-repos").split(",")
+    visit_types = pytestconfig.getoption("--benchmark-visit-types").split(",")
+    missing = set(names) - set(synthetic_repos)
+    assert not missing, f"Unknown synthetic repositories: {', '.join(missing)}"
+    return [
+        (visit_type, synthetic_repos[name])
+        for name in names
+        for visit_type in visit_types
+    ]
+
+
+@pytest.fixture(scope="module")
+def ingestion_start(docker_compose, compose_cmd, scheduler_host, visit_status_watcher):
+    """Archive usage and time before the origins are loaded; this fixture must
+    be requested before the origins fixture"""
+    return {
+        "monotonic": time.monotonic(),
+        "date": datetime.now(tz=timezone.utc),
+        "usage": collect_archive_usage(docker_compose, compose_cmd),
+    }
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(pytestconfig):
+    results: List[dict] = []
+    yield results
+    if not results:
+        return
+    results_file = pytestconfig.getoption("--benchmark-json")
+    with open(results_file, "w") as f:
+        json.dump(
+            {
+                "date": datetime.now(tz=timezone.utc).isoformat(),
+                "image_tag": os.environ.get("SWH_IMAGE_TAG", "latest"),
+                "synthetic_scales": os.environ.get("SYNTHETIC_SCALES"),
+                "benchmarks": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nBenchmark results written to {results_file}")
@@ -0,0 +1,300 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import json
+import re
+import shlex
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# archive object tables of the storage database
+ARCHIVE_TABLES = [
+    "content",
+    "skipped_content",
+    "directory",
+    "revision",
+    "release",
+    "snapshot",
+    "origin",
+    "origin_visit",
+    "origin_visit_status",
+]
+
+OBJECTS_DIR = "/srv/softwareheritage/objects"
+KAFKA_LOGS_DIR = "/var/lib/kafka/data/kraft-combined-logs"
+JOURNAL_TOPIC_PREFIX = "swh.journal.objects."
+
+# Executed by the python interpreter of a container of the compose session;
+# prints the number of messages (sum of high watermarks) of each journal topic.
+JOURNAL_OFFSETS_SCRIPT = """
+import json
+import sys
+
+from confluent_kafka import Consumer, TopicPartition
+
+consumer = Consumer(
+    {"bootstrap.servers": "kafka:9092", "group.id": "swh.benchmarks.offsets"}
+)
+offsets = {}
+for topic, metadata in consumer.list_topics(timeout=30).topics.items():
+    if not topic.startswith(sys.argv[1]):
+        continue
+    offsets[topic] = sum(
+        consumer.get_watermark_offsets(TopicPartition(topic, p), timeout=30)[1]
+        for p in metadata.partitions
+    )
+consumer.close()
+print(json.dumps(offsets))
+"""
+
+# nginx access log line, see the combined_with_duration format in
+# conf/nginx.conf
+NGINX_LOG_RE = re.compile(
+    r"\[(?P<time>[^\]]+)\] "
+    r'"(?P<method>\S+) (?P<path>\S+) [^"]*" (?P<status>\d+) (?P<bytes_sent>\d+) '
+    r'"[^"]*" "[^"]*" (?P<request_time>[\d.]+) (?P<request_length>\d+)'
+)
+
+
+@dataclasses.dataclass
+class ArchiveUsage:
+    """Objects and bytes stored by each backend of the archive at a given time"""
+
+    # table -> (rows, bytes on disk)
+    postgres: Dict[str, Tuple[int, int]]
+    content_bytes: int
+    objstorage_objects: int
+    objstorage_bytes: int
+    # journal topic -> (messages, bytes on disk)
+    journal: Dict[str, Tuple[int, int]]
+
+
+def psql(docker_compose, query: str) -> List[List[str]]:
+    output = docker_compose.check_compose_output(
+        "exec -T swh-storage-db psql -U postgres -d swh-storage -At -F '|' "
+        f"-c {shlex.quote(query)}"
+    )
+    return [line.split("|") for line in output.splitlines() if line]
+
+
+def collect_archive_usage(docker_compose, compose_cmd: str) -> ArchiveUsage:
+    query = " union all ".join(
+        f"select '{table}', count(*), pg_total_relation_size('{table}') "
+        f"from {table}"
+        for table in ARCHIVE_TABLES
+    )
+    postgres = {
+        table: (int(rows), int(size))
+        for table, rows, size in psql(docker_compose, query)
+    }
+    ((content_bytes,),) = psql(
+        docker_compose, "select coalesce(sum(length), 0) from content"
+    )
+
+    objstorage = docker_compose.check_compose_output(
+        "exec -T swh-objstorage sh -c "
+        f"'find {OBJECTS_DIR} -type f | wc -l; du -sb {OBJECTS_DIR} | cut -f1'"
+    ).split()
+
+    journal_bytes: Dict[str, int] = defaultdict(int)
+    du_output = docker_compose.check_compose_output(
+        f"exec -T kafka sh -c 'du -sb {KAFKA_LOGS_DIR}/{JOURNAL_TOPIC_PREFIX}*'"
+    )
+    for line in du_output.splitlines():
+        size, path = line.split(maxsplit=1)
+        # partition directories are named <topic>-<partition>
+        topic = path.rsplit("/", 1)[-1].rsplit("-", 1)[0]
+        journal_bytes[topic] += int(size)
+    offsets = subprocess.run(
+        shlex.split(compose_cmd)
+        + ["exec", "-T", "swh-storage", "python3", "-", JOURNAL_TOPIC_PREFIX],
+        input=JOURNAL_OFFSETS_SCRIPT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    journal = {
+        topic: (messages, journal_bytes.get(topic, 0))
+        for topic, messages in json.loads(offsets.splitlines()[-1]).items()
+    }
+
+    return ArchiveUsage(
+        postgres=postgres,
+        content_bytes=int(content_bytes),
+        objstorage_objects=int(objstorage[0]),
+        objstorage_bytes=int(objstorage[1]),
+        journal=journal,
+    )
+
+
+@dataclasses.dataclass
+class RpcCalls:
+    calls: int = 0
+    seconds: float = 0.0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    first: Optional[datetime] = None
+    last: Optional[datetime] = None
+
+    def add(
+        self, time: datetime, seconds: float, request_bytes: int, response_bytes: int
+    ):
+        self.calls += 1
+        self.seconds += seconds
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        if self.first is None or time < self.first:
+            self.first = time
+        if self.last is None or time > self.last:
+            self.last = time
+
+
+def parse_rpc_calls(nginx_logs: str, prefix: str) -> Dict[str, RpcCalls]:
+    """Aggregate the calls to the RPC endpoints under prefix (e.g.
+    /rpc/storage/) found in nginx access logs, indexed by endpoint"""
+    endpoints: Dict[str, RpcCalls] = defaultdict(RpcCalls)
+    for line in nginx_logs.splitlines():
+        m = NGINX_LOG_RE.search(line)
+        if not m or not m.group("path").startswith(prefix):
+            continue
+        endpoint = m.group("path")[len(prefix) :].split("?")[0]
+        endpoints[endpoint].add(
+            datetime.strptime(m.group("time"), "%d/%b/%Y:%H:%M:%S %z"),
+            float(m.group("request_time")),
+            int(m.group("request_length")),
+            int(m.group("bytes_sent")),
+        )
+    return dict(endpoints)
+
+
+def total_rpc_calls(endpoints: Dict[str, RpcCalls]) -> RpcCalls:
+    total = RpcCalls()
+    for calls in endpoints.values():
+        total.calls += calls.calls
+        total.seconds += calls.seconds
+        total.request_bytes += calls.request_bytes
+        total.response_bytes += calls.response_bytes
+        for time in (calls.first, calls.last):
+            if time is not None and (total.first is None or time < total.first):
+                total.first = time
+            if time is not None and (total.last is None or time > total.last):
+                total.last = time
+    return total
+
+
+def stage(
+    objects: int,
+    nbytes: int,
+    seconds: float,
+    breakdown: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Throughput of an ingestion stage, as reported in benchmark results"""
+    return {
+        "objects": objects,
+        "bytes": nbytes,
+        "seconds": round(seconds, 3),
+        "objects_per_second": round(objects / seconds, 2) if seconds else None,
+        "bytes_per_second": round(nbytes / seconds, 2) if seconds else None,
+        "breakdown": breakdown or {},
+    }
+
+
+def ingestion_stages(
+    before: ArchiveUsage,
+    after: ArchiveUsage,
+    wall_seconds: float,
+    storage_calls: Dict[str, RpcCalls],
+    objstorage_calls: Dict[str, RpcCalls],
+) -> Dict[str, Dict[str, Any]]:
+    """Compute the throughput of each ingestion stage from the archive usage
+    before and after the ingestion and the RPC calls done in between
+
+    - loader: archive objects ingested over the whole ingestion time (from
+      the scheduling of the loading tasks to their completion)
+    - storage_rpc: archive objects over the time spent in swh-storage RPC calls
+    - postgres: rows (and bytes on disk) added to the storage database over
+      the loading window (from the first to the last swh-storage RPC call)
+    - objstorage: objects (and bytes on disk) added to the objstorage over the
+      time spent in swh-objstorage RPC calls
+    - journal: messages (and bytes on disk) added to journal topics over the
+      loading window
+    """
+    rows = {
+        table: after.postgres[table][0] - before.postgres[table][0]
+        for table in after.postgres
+    }
+    table_bytes = {
+        table: after.postgres[table][1] - before.postgres[table][1]
+        for table in after.postgres
+    }
+    objects = sum(rows.values())
+    content_bytes = after.content_bytes - before.content_bytes
+
+    storage_total = total_rpc_calls(storage_calls)
+    objstorage_total = total_rpc_calls(objstorage_calls)
+    if storage_total.first is not None and storage_total.last is not None:
+        loading_seconds = (storage_total.last - storage_total.first).total_seconds()
+    else:
+        loading_seconds = 0.0
+
+    journal = {
+        topic: (
+            messages - before.journal.get(topic, (0, 0))[0],
+            nbytes - before.journal.get(topic, (0, 0))[1],
+        )
+        for topic, (messages, nbytes) in after.journal.items()
+    }
+
+    def rpc_breakdown(endpoints: Dict[str, RpcCalls]) -> Dict[str, Any]:
+        return {
+            endpoint: {
+                "calls": calls.calls,
+                "seconds": round(calls.seconds, 3),
+                "request_bytes": calls.request_bytes,
+                "response_bytes": calls.response_bytes,
+            }
+            for endpoint, calls in sorted(endpoints.items())
+        }
+
+    return {
+        "loader": stage(objects, content_bytes, wall_seconds),
+        "storage_rpc": stage(
+            objects,
+            storage_total.request_bytes,
+            storage_total.seconds,
+            rpc_breakdown(storage_calls),
+        ),
+        "postgres": stage(
+            objects,
+            sum(table_bytes.values()),
+            loading_seconds,
+            {
+                table: {"rows": rows[table], "bytes": table_bytes[table]}
+                for table in sorted(rows)
+            },
+        ),
+        "objstorage": stage(
+            after.objstorage_objects - before.objstorage_objects,
+            after.objstorage_bytes - before.objstorage_bytes,
+            objstorage_total.seconds,
+            rpc_breakdown(objstorage_calls),
+        ),
+        "journal": stage(
+            sum(messages for messages, _ in journal.values()),
+            sum(nbytes for _, nbytes in journal.values()),
+            loading_seconds,
+            {
+                topic[len(JOURNAL_TOPIC_PREFIX) :]: {
+                    "messages": messages,
+                    "bytes": nbytes,
+                }
+                for topic, (messages, nbytes) in sorted(journal.items())
+                if messages
+            },
+        ),
+    }
@@ -0,0 +1,92 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import time
+from datetime import timedelta
+from uuid import uuid4 as uuid
+
+import pytest
+
+from .metrics import collect_archive_usage, ingestion_stages, parse_rpc_calls
+
+COMPOSE_FILES = ["compose.yml", "compose.origins.yml"]
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "origin-server",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
+
+
+@pytest.fixture(scope="module")
+def compose_fingerprint() -> str:
+    # benchmarks must start from an empty archive: never reuse a compose session
+    return str(uuid())
+
+
+@pytest.fixture(scope="session")
+def archive_snapshots():
+    # nor restore an archive snapshot instead of loading origins
+    return None
+
+
+@pytest.fixture(scope="module")
+def origin_urls(benchmark_origins):
+    return [
+        (visit_type, repo.origin_url(visit_type))
+        for visit_type, repo in benchmark_origins
+    ]
+
+
+def test_ingestion_throughput(
+    request,
+    ingestion_start,
+    origins,
+    docker_compose,
+    compose_cmd,
+    benchmark_origins,
+    benchmark_results,
+):
+    wall_seconds = time.monotonic() - ingestion_start["monotonic"]
+    usage = collect_archive_usage(docker_compose, compose_cmd)
+    # nginx logs are timestamped with a one second resolution
+    since = ingestion_start["date"] - timedelta(seconds=1)
+    nginx_logs = docker_compose.check_compose_output(
+        f"logs --no-log-prefix --since {since.strftime('%Y-%m-%dT%H:%M:%SZ')} nginx"
+    )
+    stages = ingestion_stages(
+        ingestion_start["usage"],
+        usage,
+        wall_seconds,
+        storage_calls=parse_rpc_calls(nginx_logs, "/rpc/storage/"),
+        objstorage_calls=parse_rpc_calls(nginx_logs, "/rpc/objstorage/"),
+    )
+    benchmark_results.append(
+        {
+            "name": request.node.nodeid,
+            "origins": [
+                {"visit_type": visit_type, **dataclasses.asdict(repo)}
+                for visit_type, repo in benchmark_origins
+            ],
+            "stages": stages,
+        }
+    )
+
+    for name, result in stages.items():
+        print(
+            f"{name:>12}: {result['objects']} objects, {result['bytes']} bytes "
+            f"in {result['seconds']}s ({result['objects_per_second']} objects/s, "
+            f"{result['bytes_per_second']} bytes/s)"
+        )
+    assert stages["loader"]["objects"] > 0
+    assert stages["objstorage"]["objects"] > 0
+    assert stages["journal"]["objects"] > 0
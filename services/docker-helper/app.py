@@ -5,26 +5,48 @@
 # License: GNU Affero General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import json
 import os
+import socket
+from functools import lru_cache
 
 import requests
 from flask import Flask, abort
 
 app = Flask(__name__)
 
+# we could think about accessing the docker socket directly here instead of
+# using docker-proxy but there are permission stuff to handle, so...
+DOCKER_API_URL = "http://docker-proxy:2375"
+
+
+@lru_cache(maxsize=None)
+def get_compose_project_name():
+    # several compose projects may run concurrently on the same docker host
+    # (e.g. one per pytest-xdist worker), so use the project of the container
+    # of this service (its hostname is its container id)
+    try:
+        response = requests.get(
+            f"{DOCKER_API_URL}/containers/{socket.gethostname()}/json"
+        )
+        response.raise_for_status()
+        return response.json()["Config"]["Labels"]["com.docker.compose.project"]
+    except Exception:
+        return os.environ.get("COMPOSE_PROJECT_NAME") or "docker"
+
 
 def get_public_port_and_gateway(service="nginx"):
     # query the docker API to get the port of the edge router
-    compose_project_name = os.environ.get("COMPOSE_PROJECT_NAME", "docker")
-    # we could think about accessing the docker socket directly here instead of
-    # using docker-proxy but there are permission stuff to handle, so...
-    containers = requests.get("http://docker-proxy:2375/containers/json").json()
-    containers = [
-        container
-        for container in containers
-        if container["Labels"].get("com.docker.compose.project") == compose_project_name
-        and container["Labels"].get("com.docker.compose.service") == service
-    ]
+    compose_project_name = get_compose_project_name()
+    filters = {
+        "label": [
+            f"com.docker.compose.project={compose_project_name}",
+            f"com.docker.compose.service={service}",
+        ]
+    }
+    containers = requests.get(
+        f"{DOCKER_API_URL}/containers/json", params={"filters": json.dumps(filters)}
+    ).json()
     port = None
     gateway = None
     if len(containers) == 1:
@@ -0,0 +1,41 @@
+#!/bin/bash
+
+set -e
+
+ORIGINS_DIR=${ORIGINS_DIR:-/srv/softwareheritage/origins}
+export ORIGINS_DIR
+
+case "$1" in
+    "shell")
+      exec bash -i
+      ;;
+    "serve")
+        echo Generating synthetic repositories
+        python3 /srv/softwareheritage/generate.py \
+                /srv/softwareheritage/config.yml ${ORIGINS_DIR}
+
+        echo Starting the subversion server
+        svnserve --daemon --root ${ORIGINS_DIR}/svn
+
+        echo Starting the mercurial server
+        cat > ${ORIGINS_DIR}/hgweb.conf <<EOF
+[paths]
+/ = ${ORIGINS_DIR}/hg/*
+EOF
+        hg serve --daemon --web-conf ${ORIGINS_DIR}/hgweb.conf \
+           --address 0.0.0.0 --port 8002 \
+           --accesslog /dev/null --errorlog /dev/stderr
+
+        echo Starting the git server
+        touch ${ORIGINS_DIR}/.ready
+        exec gunicorn --bind 0.0.0.0:8001 \
+         --chdir /srv/softwareheritage \
+         --log-level ${LOG_LEVEL:-INFO} \
+         --access-logfile /dev/stdout \
+         --access-logformat "%(t)s %(r)s %(s)s %(b)s %(M)s" \
+         --threads ${GUNICORN_THREADS:-4} \
+         --workers ${GUNICORN_WORKERS:-2} \
+         --timeout ${GUNICORN_TIMEOUT:-3600} \
+         "git_server:app"
+      ;;
+esac
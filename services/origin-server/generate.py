@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU Affero General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Generate the synthetic git, mercurial and subversion repositories served by
+the origin-server service.
+
+Repositories are described in the configuration file (see
+conf/origin-server.yml) by a number of commits, files, file size, branches and
+tags; each of them is generated once per scale factor, the number of commits
+and files being multiplied by the scale factor. Generation is deterministic
+(contents, authors and dates only depend on the repository description) so
+that the same objects are archived from one run to another.
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+AUTHOR_NAME = "Synthetic Author"
+AUTHOR_EMAIL = "synthetic@example.org"
+# date of the first commit of every repository, commits are one hour apart
+BASE_TIMESTAMP = 1704067200
+FILES_PER_DIRECTORY = 100
+
+
+@dataclass
+class RepositorySpec:
+    name: str
+    commits: int = 10
+    files: int = 10
+    file_size: int = 1024
+    branches: int = 0
+    tags: int = 0
+
+    def scaled(self, scale: int) -> "RepositorySpec":
+        if scale == 1:
+            return self
+        return RepositorySpec(
+            name=f"{self.name}-x{scale}",
+            commits=self.commits * scale,
+            files=self.files * scale,
+            file_size=self.file_size,
+            branches=self.branches,
+            tags=self.tags,
+        )
+
+    def file_path(self, index: int) -> str:
+        return f"dir{index // FILES_PER_DIRECTORY:04d}/file{index:06d}.txt"
+
+    def file_content(self, index: int, commit: int) -> bytes:
+        """Deterministic text content of a file at a given commit"""
+        seed = f"{self.name}:{index}:{commit}".encode()
+        counter = 0
+        chunks = []
+        size = 0
+        while size < self.file_size:
+            block = hashlib.sha256(seed + str(counter).encode()).hexdigest().encode()
+            chunks.append(block + b"\n")
+            size += len(block) + 1
+            counter += 1
+        return b"".join(chunks)[: self.file_size]
+
+    def commit_changes(self) -> Iterator[Dict[str, bytes]]:
+        """Files changed by each commit: the first commit adds all the files,
+        each next one modifies a single file"""
+        yield {self.file_path(i): self.file_content(i, 0) for i in range(self.files)}
+        for commit in range(1, self.commits):
+            index = (commit - 1) % self.files
+            yield {self.file_path(index): self.file_content(index, commit)}
+
+    def spread(self, count: int) -> List[int]:
+        """Indexes of count commits evenly spread in the history"""
+        return [(i + 1) * self.commits // (count + 1) for i in range(count)]
+
+    def branch_points(self) -> List[Tuple[str, int]]:
+        return [(f"branch-{i}", c) for i, c in enumerate(self.spread(self.branches))]
+
+    def tag_points(self) -> List[Tuple[str, int]]:
+        return [(f"v{i}", c) for i, c in enumerate(self.spread(self.tags))]
+
+
+def commit_timestamp(commit: int) -> int:
+    return BASE_TIMESTAMP + commit * 3600
+
+
+def commit_message(commit: int) -> bytes:
+    return f"Synthetic commit {commit}\n".encode()
+
+
+def generate_git(spec: RepositorySpec, path: str) -> None:
+    """Generate a bare git repository with a single git fast-import call"""
+    subprocess.run(["git", "init", "-q", "--bare", path], check=True)
+    author = f"{AUTHOR_NAME} <{AUTHOR_EMAIL}>".encode()
+
+    def data(content: bytes) -> bytes:
+        return b"data %d\n%s\n" % (len(content), content)
+
+    proc = subprocess.Popen(
+        ["git", "-C", path, "fast-import", "--quiet"], stdin=subprocess.PIPE
+    )
+    assert proc.stdin is not None
+    stream = proc.stdin
+    for commit, changes in enumerate(spec.commit_changes()):
+        signature = b"%s %d +0000" % (author, commit_timestamp(commit))
+        stream.write(b"commit refs/heads/main\nmark :%d\n" % (commit + 1))
+        stream.write(b"author %s\ncommitter %s\n" % (signature, signature))
+        stream.write(data(commit_message(commit)))
+        for file_path, content in changes.items():
+            stream.write(b"M 100644 inline %s\n" % file_path.encode())
+            stream.write(data(content))
+        stream.write(b"\n")
+    for branch, commit in spec.branch_points():
+        stream.write(
+            b"reset refs/heads/%s\nfrom :%d\n\n" % (branch.encode(), commit + 1)
+        )
+    for tag, commit in spec.tag_points():
+        stream.write(b"tag %s\nfrom :%d\n" % (tag.encode(), commit + 1))
+        stream.write(b"tagger %s %d +0000\n" % (author, commit_timestamp(commit)))
+        stream.write(data(b"Release %s\n" % tag.encode()))
+    stream.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"git fast-import failed for {path}")
+    subprocess.run(
+        ["git", "-C", path, "symbolic-ref", "HEAD", "refs/heads/main"], check=True
+    )
+
+
+def generate_hg(spec: RepositorySpec, path: str) -> None:
+    """Generate a mercurial repository; branches are bookmarks"""
+    subprocess.run(["hg", "init", path], check=True)
+    user = f"{AUTHOR_NAME} <{AUTHOR_EMAIL}>"
+
+    def hg(*args: str) -> None:
+        subprocess.run(["hg", "--cwd", path, "--quiet", *args], check=True)
+
+    for commit, changes in enumerate(spec.commit_changes()):
+        for file_path, content in changes.items():
+            full_path = os.path.join(path, file_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(content)
+        hg("addremove")
+        hg(
+            "commit",
+            "--user",
+            user,
+            "--date",
+            f"{commit_timestamp(commit)} 0",
+            "--message",
+            commit_message(commit).decode(),
+        )
+    # tags are added once all the commits have been done, so the revision
+    # numbers of the synthetic commits are their indexes
+    for branch, commit in spec.branch_points():
+        hg("bookmark", "--rev", str(commit), branch)
+    for tag, commit in spec.tag_points():
+        hg(
+            "tag",
+            "--rev",
+            str(commit),
+            "--user",
+            user,
+            "--date",
+            f"{commit_timestamp(spec.commits)} 0",
+            tag,
+        )
+
+
+def svn_properties(props: Dict[str, bytes]) -> bytes:
+    lines = []
+    for key, value in props.items():
+        lines.append(
+            b"K %d\n%s\nV %d\n%s\n" % (len(key), key.encode(), len(value), value)
+        )
+    return b"".join(lines) + b"PROPS-END\n"
+
+
+def svn_revision(revision: int, commit: int, message: Optional[bytes]) -> bytes:
+    date = datetime.fromtimestamp(commit_timestamp(commit), tz=timezone.utc)
+    revprops = {"svn:date": date.strftime("%Y-%m-%dT%H:%M:%S.000000Z").encode()}
+    if message is not None:
+        revprops.update({"svn:log": message, "svn:author": AUTHOR_EMAIL.encode()})
+    props = svn_properties(revprops)
+    return (
+        b"Revision-number: %d\nProp-content-length: %d\nContent-length: %d\n\n%s\n"
+        % (revision, len(props), len(props), props)
+    )
+
+
+def svn_node(node_path: str, kind: str, action: str, **headers) -> bytes:
+    node = b"Node-path: %s\nNode-kind: %s\nNode-action: %s\n" % (
+        node_path.encode(),
+        kind.encode(),
+        action.encode(),
+    )
+    content = headers.pop("content", None)
+    for key, value in headers.items():
+        node += b"%s: %s\n" % (key.replace("_", "-").encode(), str(value).encode())
+    if content is None:
+        return node + b"\n"
+    props = svn_properties({})
+    return node + (
+        b"Prop-content-length: %d\nText-content-length: %d\n"
+        b"Content-length: %d\n\n%s%s\n"
+        % (len(props), len(content), len(props) + len(content), props, content)
+    )
+
+
+def svn_dump(spec: RepositorySpec) -> Iterator[bytes]:
+    """Generate a subversion dump stream of the repository, using the standard
+    trunk/branches/tags layout; branches and tags are copies of trunk done
+    after all the synthetic commits"""
+    repo_uuid = uuid.uuid5(uuid.NAMESPACE_URL, f"synthetic:{spec.name}")
+    yield b"SVN-fs-dump-format-version: 2\n\nUUID: %s\n\n" % str(repo_uuid).encode()
+    yield svn_revision(0, 0, None)
+    directories = set()
+    for commit, changes in enumerate(spec.commit_changes()):
+        yield svn_revision(commit + 1, commit, commit_message(commit))
+        if commit == 0:
+            for directory in ("trunk", "branches", "tags"):
+                yield svn_node(directory, "dir", "add")
+        for file_path, content in changes.items():
+            directory = f"trunk/{os.path.dirname(file_path)}"
+            if directory not in directories:
+                directories.add(directory)
+                yield svn_node(directory, "dir", "add")
+            yield svn_node(
+                f"trunk/{file_path}",
+                "file",
+                "add" if commit == 0 else "change",
+                content=content,
+            )
+    revision = spec.commits
+    for prefix, points in (
+        ("branches", spec.branch_points()),
+        ("tags", spec.tag_points()),
+    ):
+        for name, commit in points:
+            revision += 1
+            yield svn_revision(
+                revision,
+                spec.commits,
+                b"Create %s/%s\n" % (prefix.encode(), name.encode()),
+            )
+            yield svn_node(
+                f"{prefix}/{name}",
+                "dir",
+                "add",
+                Node_copyfrom_rev=commit + 1,
+                Node_copyfrom_path="trunk",
+            )
+
+
+def generate_svn(spec: RepositorySpec, path: str) -> None:
+    """Generate a subversion repository by loading a generated dump"""
+    subprocess.run(["svnadmin", "create", path], check=True)
+    proc = subprocess.Popen(
+        ["svnadmin", "load", "--quiet", path], stdin=subprocess.PIPE
+    )
+    assert proc.stdin is not None
+    for chunk in svn_dump(spec):
+        proc.stdin.write(chunk)
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"svnadmin load failed for {path}")
+
+
+GENERATORS = {
+    "git": (generate_git, "{}.git"),
+    "hg": (generate_hg, "{}"),
+    "svn": (generate_svn, "{}"),
+}
+
+
+def load_specs(config_path: str) -> List[RepositorySpec]:
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    scales = config.get("scales", [1])
+    if os.environ.get("SYNTHETIC_SCALES"):
+        scales = [int(s) for s in os.environ["SYNTHETIC_SCALES"].split(",")]
+    return [
+        RepositorySpec(name=name, **params).scaled(scale)
+        for name, params in config["repositories"].items()
+        for scale in scales
+    ]
+
+
+def main(config_path: str, output_dir: str) -> None:
+    for spec in load_specs(config_path):
+        for vcs, (generate, dirname) in GENERATORS.items():
+            path = os.path.join(output_dir, vcs, dirname.format(spec.name))
+            if os.path.exists(path):
+                # already generated (e.g. the service has been restarted)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            t0 = time.monotonic()
+            # generate in a temporary directory so a partially generated
+            # repository is never served
+            tmp_path = f"{path}.tmp"
+            subprocess.run(["rm", "-rf", tmp_path], check=True)
+            generate(spec, tmp_path)
+            os.rename(tmp_path, path)
+            print(
+                f"Generated {vcs} repository {spec.name} ({spec.commits} commits, "
+                f"{spec.files} files) in {time.monotonic()-t0:.2f}s",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU Affero General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+# Serve the generated git repositories over the git smart HTTP protocol, e.g.
+# http://origin-server:8001/small.git
+
+import glob
+import os
+from typing import Dict
+
+from dulwich.repo import Repo
+from dulwich.server import BackendRepo, DictBackend
+from dulwich.web import make_wsgi_chain
+
+ORIGINS_DIR = os.environ.get("ORIGINS_DIR", "/srv/softwareheritage/origins")
+
+repos: Dict[str, BackendRepo] = {
+    f"/{os.path.basename(path)}": Repo(path)
+    for path in sorted(glob.glob(os.path.join(ORIGINS_DIR, "git", "*.git")))
+}
+
+app = make_wsgi_chain(DictBackend(repos))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU Affero General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Create scheduler tasks in bulk, in a single scheduler transaction.
+
+Tasks are read from a file (or stdin), either as JSON lines::
+
+    {"type": "load-git", "kwargs": {"url": "https://..."}}
+    {"type": "load-svn", "kwargs": {"url": "svn://..."}, "policy": "oneshot"}
+
+or as CSV rows, with the same syntax as ``swh scheduler task add``::
+
+    load-git,url=https://...
+
+The ids of the created tasks are written to stdout as a JSON list, in the
+order of the input.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List
+
+import yaml
+from swh.scheduler import get_scheduler
+
+
+def read_tasks(data: str) -> Iterator[Dict[str, Any]]:
+    lines = [line for line in data.splitlines() if line.strip()]
+    if lines and lines[0].lstrip().startswith("{"):
+        for line in lines:
+            yield json.loads(line)
+        return
+    for row in csv.reader(io.StringIO("\n".join(lines))):
+        args = [value for value in row[1:] if "=" not in value]
+        kwargs = dict(value.split("=", 1) for value in row[1:] if "=" in value)
+        yield {"type": row[0], "args": args, "kwargs": kwargs}
+
+
+def make_tasks(tasks: List[Dict[str, Any]], policy: str) -> List[Any]:
+    now = datetime.now(tz=timezone.utc)
+    dicts = [
+        {
+            "type": task["type"],
+            "policy": task.get("policy", policy),
+            "priority": task.get("priority"),
+            "next_run": now,
+            "arguments": {
+                "args": task.get("args", []),
+                "kwargs": task.get("kwargs", {}),
+            },
+        }
+        for task in tasks
+    ]
+    try:
+        from swh.scheduler.model import Task, TaskArguments
+    except ImportError:
+        # scheduler versions taking tasks as dicts
+        return dicts
+    return [
+        Task(
+            type=task["type"],
+            policy=task["policy"],
+            priority=task["priority"],
+            next_run=task["next_run"],
+            arguments=TaskArguments(**task["arguments"]),
+        )
+        for task in dicts
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("file", nargs="?", default="-", help="tasks (default: stdin)")
+    parser.add_argument(
+        "--policy", choices=["recurring", "oneshot"], default="recurring"
+    )
+    args = parser.parse_args()
+
+    if args.file == "-":
+        data = sys.stdin.read()
+    else:
+        with open(args.file) as f:
+            data = f.read()
+    tasks = list(read_tasks(data))
+
+    with open(os.environ["SWH_SCHEDULER_CONFIG_FILE"]) as f:
+        config = yaml.safe_load(f)
+    scheduler = get_scheduler(**config["scheduler"])
+    # create_tasks runs in a single database transaction
+    created = scheduler.create_tasks(make_tasks(tasks, args.policy))
+    ids = [task["id"] if isinstance(task, dict) else task.id for task in created]
+    print(json.dumps(ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,31 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import functools
+import hashlib
 import http.server
 import itertools
 import json
+import os
 import sys
+import time
 from http import HTTPStatus
 from socket import socket
-from typing import Dict, Iterator, List, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import click
+import msgpack
 from confluent_kafka import Message
 
 
@@ -20,6 +36,14 @@ def cli():
     pass
 
 
+def grouper(iterable, n):
+    # copied from swh.core.utils
+    args = [iter(iterable)] * n
+    stop_value = object()
+    for _data in itertools.zip_longest(*args, fillvalue=stop_value):
+        yield (d for d in _data if d is not stop_value)
+
+
 ########################################################################
 # Mock graph
 #
@@ -74,15 +98,24 @@ def mock_graph():
 #
 
 OBJECT_TYPE_TO_POSTGRESQL_QUERY = {
-    "ori": "SELECT COUNT(id) FROM origin WHERE digest(url, 'sha1') = %s",
-    "snp": "SELECT COUNT(id) FROM snapshot WHERE id = %s",
-    "rel": "SELECT COUNT(id) FROM release WHERE id = %s",
-    "rev": "SELECT COUNT(id) FROM revision WHERE id = %s",
-    "dir": "SELECT COUNT(id) FROM directory WHERE id = %s",
-    "cnt": "SELECT COUNT(sha1) FROM content WHERE sha1_git = %s",
+    "ori": (
+        "SELECT digest(url, 'sha1') FROM origin WHERE digest(url, 'sha1') = ANY(%s)"
+    ),
+    "snp": "SELECT id FROM snapshot WHERE id = ANY(%s)",
+    "rel": "SELECT id FROM release WHERE id = ANY(%s)",
+    "rev": "SELECT id FROM revision WHERE id = ANY(%s)",
+    "dir": "SELECT id FROM directory WHERE id = ANY(%s)",
+    "cnt": "SELECT sha1_git FROM content WHERE sha1_git = ANY(%s)",
 }
 
 
+SWHID_ORDER = {"cnt": 0, "dir": 1, "rev": 2, "rel": 3, "snp": 4, "ori": 5}
+
+
+def swhid_key(swhid: str) -> str:
+    return f"{SWHID_ORDER[swhid[6:9]]}{swhid[11:]}"
+
+
 def validate_swhid(ctx, param, value):
     for swhid in value:
         if not swhid.startswith("swh:1:"):
@@ -90,6 +123,44 @@ def validate_swhid(ctx, param, value):
     return value
 
 
+swhids_file_option = click.option(
+    "--swhids-file",
+    type=click.File("r"),
+    help="Read SWHIDs (one per line) from this file, - for stdin, "
+    "in addition to the ones given as arguments",
+)
+
+
+def read_swhids(ctx, swhids: List[str], swhids_file) -> List[str]:
+    if swhids_file is None:
+        return list(swhids)
+    from_file = [line.strip() for line in swhids_file if line.strip()]
+    return list(swhids) + validate_swhid(ctx, None, from_file)
+
+
+def ids_by_object_type(swhids: Iterable[str]) -> Dict[str, Dict[bytes, str]]:
+    """Group the ids of the given SWHIDs by object type, mapping each id to
+    its SWHID"""
+    ids: Dict[str, Dict[bytes, str]] = {}
+    for swhid in swhids:
+        ids.setdefault(swhid[6:9], {})[bytes.fromhex(swhid[10:])] = swhid
+    return ids
+
+
+def report_swhids(presence: bool, searched: Set[str], found: Set[str]) -> bool:
+    """Print the SWHIDs which are not found (if presence) or found (otherwise),
+    and return whether there are some"""
+    if presence:
+        unexpected = searched - found
+        message = "{} not found"
+    else:
+        unexpected = searched & found
+        message = "{} found"
+    for swhid in sorted(unexpected, key=swhid_key):
+        click.echo(message.format(swhid))
+    return bool(unexpected)
+
+
 @cli.command()
 @click.option(
     "--presence",
@@ -98,50 +169,51 @@ def validate_swhid(ctx, param, value):
     default=False,
     help="Ensure the given SWHIDs are present instead of absent",
 )
+@click.option(
+    "--batch-size",
+    type=int,
+    default=10000,
+    show_default=True,
+    help="Number of ids looked up per query",
+)
+@swhids_file_option
 @click.argument("swhids", nargs=-1, callback=validate_swhid)
 @click.pass_context
-def query_postgresql(ctx, presence, swhids):
-    """Ensure that the given SWHIDs are absent in the PostgreSQL storage"""
+def query_postgresql(ctx, presence, batch_size, swhids_file, swhids):
+    """Ensure that the given SWHIDs are absent in the PostgreSQL storage
 
-    import psycopg
+    The ids of each object type are looked up in batches, each one with a
+    single query matching the ids against an array."""
 
-    if presence:
-        expected_count = 1
-        message = "{} not found"
-    else:
-        expected_count = 0
-        message = "{} found"
+    import psycopg
 
+    swhids = read_swhids(ctx, swhids, swhids_file)
     conn = psycopg.connect(
         "host=swh-storage-db dbname=swh-storage user=postgres password=testpassword"
     )
     cur = conn.cursor()
-    error = False
-    for object_type, grouped_swhids in itertools.groupby(
-        sorted(swhids), lambda s: s[6:9]
-    ):
-        for swhid in grouped_swhids:
-            cur.execute(
-                OBJECT_TYPE_TO_POSTGRESQL_QUERY[object_type],
-                (bytes.fromhex(swhid[10:]),),
-            )
-            if cur.fetchone()[0] != expected_count:
-                click.echo(message.format(swhid))
-                error = True
-    ctx.exit(1 if error else 0)
+    found = set()
+    for object_type, ids in ids_by_object_type(swhids).items():
+        for batch in grouper(ids, batch_size):
+            # psycopg adapts a list of bytes as a bytea[]
+            cur.execute(OBJECT_TYPE_TO_POSTGRESQL_QUERY[object_type], (list(batch),))
+            found.update(ids[row[0]] for row in cur)
+    ctx.exit(1 if report_swhids(presence, set(swhids), found) else 0)
 
 
 ########################################################################
 # Cassandra
 #
 
+# lookups by partition key, so they are routed to the replicas of the
+# partition by the token aware load balancing policy
 OBJECT_TYPE_TO_CASSANDRA_QUERY = {
-    "ori": "SELECT COUNT(*) FROM origin WHERE sha1 = %s",
-    "snp": "SELECT COUNT(*) FROM snapshot WHERE id = %s",
-    "rel": "SELECT COUNT(*) FROM release WHERE id = %s",
-    "rev": "SELECT COUNT(*) FROM revision WHERE id = %s",
-    "dir": "SELECT COUNT(*) FROM directory WHERE id = %s",
-    "cnt": "SELECT COUNT(*) FROM content_by_sha1_git WHERE sha1_git = %s",
+    "ori": "SELECT sha1 FROM origin WHERE sha1 = ?",
+    "snp": "SELECT id FROM snapshot WHERE id = ?",
+    "rel": "SELECT id FROM release WHERE id = ?",
+    "rev": "SELECT id FROM revision WHERE id = ?",
+    "dir": "SELECT id FROM directory WHERE id = ?",
+    "cnt": "SELECT sha1_git FROM content_by_sha1_git WHERE sha1_git = ? LIMIT 1",
 }
 
 
@@ -153,35 +225,55 @@ OBJECT_TYPE_TO_CASSANDRA_QUERY = {
     default=False,
     help="Ensure the given SWHIDs are present instead of absent",
 )
+@click.option(
+    "--concurrency",
+    type=int,
+    default=256,
+    show_default=True,
+    help="Maximum number of lookups in flight",
+)
+@swhids_file_option
 @click.argument("swhids", nargs=-1, callback=validate_swhid)
 @click.pass_context
-def query_cassandra(ctx, presence, swhids):
-    """Ensure that the given SWHIDs are absent in the Cassandra storage"""
+def query_cassandra(ctx, presence, concurrency, swhids_file, swhids):
+    """Ensure that the given SWHIDs are absent in the Cassandra storage
 
-    from cassandra.cluster import Cluster
+    Ids are looked up concurrently with prepared statements, routed to the
+    nodes owning them."""
 
-    if presence:
-        expected_count = 1
-        message = "{} not found"
-    else:
-        expected_count = 0
-        message = "{} found"
+    from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile
+    from cassandra.concurrent import execute_concurrent_with_args
+    from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
 
-    cluster = Cluster(["cassandra-seed"])
+    swhids = read_swhids(ctx, swhids, swhids_file)
+    profile = ExecutionProfile(
+        load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy())
+    )
+    # the other nodes (the scaled cassandra service) are discovered from the
+    # seed
+    cluster = Cluster(
+        ["cassandra-seed"], execution_profiles={EXEC_PROFILE_DEFAULT: profile}
+    )
     session = cluster.connect("swh")
-    error = False
-    for object_type, grouped_swhids in itertools.groupby(
-        sorted(swhids), lambda s: s[6:9]
-    ):
-        for swhid in grouped_swhids:
-            result = session.execute(
-                OBJECT_TYPE_TO_CASSANDRA_QUERY[object_type],
-                (bytes.fromhex(swhid[10:]),),
+    found = set()
+    try:
+        for object_type, ids in ids_by_object_type(swhids).items():
+            statement = session.prepare(OBJECT_TYPE_TO_CASSANDRA_QUERY[object_type])
+            id_list = list(ids)
+            results = execute_concurrent_with_args(
+                session,
+                statement,
+                [(id_,) for id_ in id_list],
+                concurrency=concurrency,
+                raise_on_first_error=True,
+                results_generator=True,
             )
-            if result.one().count != expected_count:
-                click.echo(message.format(swhid))
-                error = True
-    ctx.exit(1 if error else 0)
+            for id_, (_, result) in zip(id_list, results):
+                if result.one() is not None:
+                    found.add(ids[id_])
+    finally:
+        cluster.shutdown()
+    ctx.exit(1 if report_swhids(presence, set(swhids), found) else 0)
 
 
 ########################################################################
@@ -189,86 +281,384 @@ def query_cassandra(ctx, presence, swhids):
 #
 
 
-def handle_message(
-    message: Message,
-) -> Iterator[Tuple[str, Message]]:
-    import hashlib
-
-    import msgpack
-
-    msg_key = message.key()
-    assert isinstance(msg_key, bytes)
-    key = msgpack.unpackb(msg_key)
-    match message.topic():
-        case "swh.journal.objects.origin":
-            sha1 = hashlib.sha1(key["url"].encode("us-ascii")).hexdigest()
-            yield f"swh:1:ori:{sha1}", message
-        case (
-            "swh.journal.objects.origin_visit"
-            | "swh.journal.objects.origin_visit_status"
-        ):
-            # XXX: This is interesting to check absence, but for presence it
-            # might lead to bad results… not sure what is the right move.
-            sha1 = hashlib.sha1(key["origin"].encode("us-ascii")).hexdigest()
-            yield f"swh:1:ori:{sha1}", message
-        case "swh.journal.objects.snapshot":
-            yield f"swh:1:snp:{key.hex()}", message
-        case "swh.journal.objects.release" | "swh.journal.objects_privileged.release":
-            yield f"swh:1:rel:{key.hex()}", message
-        case "swh.journal.objects.revision" | "swh.journal.objects_privileged.revision":
-            yield f"swh:1:rev:{key.hex()}", message
-        case "swh.journal.objects.directory":
-            yield f"swh:1:dir:{key.hex()}", message
-        case "swh.journal.objects.content":
-            yield f"swh:1:cnt:{key['sha1_git'].hex()}", message
-        case topic:
-            print(f"unhandled topic {topic} -> {key}", file=sys.stderr)
-
-
-def lookup_kafka_messages() -> Iterator[Tuple[str, Message]]:
-    import uuid
-
-    from confluent_kafka import Consumer, KafkaException
-
-    consumer = Consumer(
+# visits and visit statuses of an origin share the same key
+@functools.lru_cache(maxsize=65536)
+def origin_swhid(url: str) -> str:
+    return f"swh:1:ori:{hashlib.sha1(url.encode('us-ascii')).hexdigest()}"
+
+
+# SWHID of the (decoded) key of the messages of each topic
+TOPIC_KEY_TO_SWHID: Dict[str, Callable[[Any], str]] = {
+    "swh.journal.objects.origin": lambda key: origin_swhid(key["url"]),
+    # XXX: This is interesting to check absence, but for presence it
+    # might lead to bad results… not sure what is the right move.
+    "swh.journal.objects.origin_visit": lambda key: origin_swhid(key["origin"]),
+    "swh.journal.objects.origin_visit_status": (
+        lambda key: origin_swhid(key["origin"])
+    ),
+    "swh.journal.objects.snapshot": lambda key: f"swh:1:snp:{key.hex()}",
+    "swh.journal.objects.release": lambda key: f"swh:1:rel:{key.hex()}",
+    "swh.journal.objects_privileged.release": lambda key: f"swh:1:rel:{key.hex()}",
+    "swh.journal.objects.revision": lambda key: f"swh:1:rev:{key.hex()}",
+    "swh.journal.objects_privileged.revision": lambda key: f"swh:1:rev:{key.hex()}",
+    "swh.journal.objects.directory": lambda key: f"swh:1:dir:{key.hex()}",
+    "swh.journal.objects.content": lambda key: f"swh:1:cnt:{key['sha1_git'].hex()}",
+}
+
+
+def handle_messages(
+    topic: str, messages: List[Message]
+) -> Iterator[Tuple[str, int, bool]]:
+    """Return the (swhid, timestamp, tombstone) state of the key of each of
+    the given messages of topic"""
+    key_to_swhid = TOPIC_KEY_TO_SWHID.get(topic)
+    if key_to_swhid is None:
+        for message in messages:
+            print(f"unhandled topic {topic} -> {message.key()!r}", file=sys.stderr)
+        return
+    keys = [msgpack.unpackb(message.key()) for message in messages]
+    for key, message in zip(keys, messages):
+        yield key_to_swhid(key), get_timestamp(message), message.value() is None
+
+
+JOURNAL_TOPICS = [
+    "swh.journal.objects.origin",
+    "swh.journal.objects.origin_visit",
+    "swh.journal.objects.origin_visit_status",
+    "swh.journal.objects.snapshot",
+    "swh.journal.objects.release",
+    "swh.journal.objects_privileged.release",
+    "swh.journal.objects.revision",
+    "swh.journal.objects_privileged.revision",
+    "swh.journal.objects.directory",
+    "swh.journal.objects.content",
+    "swh.journal.objects.skipped_content",
+    # XXX: We are not considering
+    # swh.journal.objects.extid
+    # swh.journal.objects.raw_extrinsic_metadata
+]
+
+# kept in the container as long as it lives, which is as long as the journal of
+# the compose session
+DEFAULT_JOURNAL_INDEX = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "alter-companion",
+    "journal-index.sqlite",
+)
+
+
+class JournalKeyIndex:
+    """Latest state (timestamp, tombstone) of each SWHID published in the
+    journal, kept in a SQLite database along with the offsets consumed so far,
+    so each run only consumes the messages published since the previous one.
+    """
+
+    def __init__(self, path: str):
+        import sqlite3
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY, value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS offsets (
+                topic TEXT, partition INTEGER, next_offset INTEGER,
+                PRIMARY KEY (topic, partition)
+            );
+            CREATE TABLE IF NOT EXISTS swhids (
+                swhid TEXT PRIMARY KEY, timestamp INTEGER, tombstone INTEGER
+            ) WITHOUT ROWID;
+            """)
+
+    def reset_if_stale(
+        self, cluster_id: str, high_offsets: Dict[Tuple[str, int], int]
+    ) -> None:
+        """Empty the index if it has been built from another Kafka cluster, or
+        from topics which have since been recreated"""
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = 'cluster_id'"
+        ).fetchone()
+        stale = row is None or row[0] != cluster_id
+        for partition, next_offset in self.offsets().items():
+            if next_offset > high_offsets.get(partition, next_offset):
+                stale = True
+        if stale:
+            with self.db:
+                self.db.execute("DELETE FROM offsets")
+                self.db.execute("DELETE FROM swhids")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('cluster_id', ?)",
+                    (cluster_id,),
+                )
+
+    def offsets(self) -> Dict[Tuple[str, int], int]:
+        return {
+            (topic, partition): next_offset
+            for topic, partition, next_offset in self.db.execute(
+                "SELECT topic, partition, next_offset FROM offsets"
+            )
+        }
+
+    def update(
+        self,
+        states: List[Tuple[str, int, bool]],
+        next_offsets: Dict[Tuple[str, int], int],
+    ) -> None:
+        """Record the (swhid, timestamp, tombstone) states read from the
+        journal, and the offsets to resume from, in a single transaction"""
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO swhids VALUES (?, ?, ?) ON CONFLICT (swhid) DO UPDATE "
+                "SET timestamp = excluded.timestamp, tombstone = excluded.tombstone "
+                "WHERE excluded.timestamp >= swhids.timestamp",
+                states,
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO offsets VALUES (?, ?, ?)",
+                [
+                    (topic, part, offset)
+                    for (topic, part), offset in next_offsets.items()
+                ],
+            )
+
+    def found(self, swhids: Iterable[str]) -> Set[str]:
+        """Return the given SWHIDs whose latest message is not a tombstone"""
+        with self.db:
+            self.db.execute("CREATE TEMP TABLE searched (swhid TEXT PRIMARY KEY)")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO searched VALUES (?)", ((s,) for s in swhids)
+            )
+            found = {
+                swhid
+                for swhid, in self.db.execute(
+                    "SELECT swhid FROM searched JOIN swhids USING (swhid) "
+                    "WHERE NOT tombstone"
+                )
+            }
+            self.db.execute("DROP TABLE searched")
+        return found
+
+
+# consumer of the processes of the pool of update_journal_index
+_consumer = None
+
+
+def _init_consumer() -> None:
+    from confluent_kafka import Consumer
+
+    global _consumer
+    _consumer = Consumer(
         {
             "bootstrap.servers": "kafka:9092",
-            # Use a different group ID each time so we are
-            # sure we will receive all objects
-            "group.id": f"swh.alter.companion.{uuid.uuid4()}",
-            "auto.offset.reset": "smallest",
+            # partitions are explicitly assigned and offsets are stored in
+            # the index, so the group is never joined nor committed to
+            "group.id": "swh.alter.companion",
             "enable.auto.commit": "false",
+            "enable.partition.eof": "true",
         }
     )
+
+
+# maximum time to wait for the next message of an offset range, should the
+# broker be unreachable or the partition EOF never be reported
+CONSUME_IDLE_TIMEOUT = 10.0
+
+
+def consume_range(
+    task: Tuple[str, int, int, int, int],
+) -> Tuple[str, int, int, List[Tuple[str, int, bool]]]:
+    """Consume the messages of a partition from offset start (included) to
+    end (excluded), and return the state of their keys
+
+    Messages are fetched in batches of up to batch_size messages; consumption
+    stops once the end offset (or the end of the partition) is reached, and
+    fails if no message is received for CONSUME_IDLE_TIMEOUT seconds."""
+    from confluent_kafka import KafkaError, KafkaException, TopicPartition
+
+    topic, partition, start, end, batch_size = task
+    assert _consumer is not None
+    _consumer.assign([TopicPartition(topic, partition, start)])
+    states: List[Tuple[str, int, bool]] = []
+    done = False
+    last_received = time.monotonic()
     try:
-        consumer.subscribe(
-            [
-                "swh.journal.objects.origin",
-                "swh.journal.objects.origin_visit",
-                "swh.journal.objects.origin_visit_status",
-                "swh.journal.objects.snapshot",
-                "swh.journal.objects.release",
-                "swh.journal.objects_privileged.release",
-                "swh.journal.objects.revision",
-                "swh.journal.objects_privileged.revision",
-                "swh.journal.objects.directory",
-                "swh.journal.objects.content",
-                "swh.journal.objects.skipped_content",
-                # XXX: We are not considering
-                # swh.journal.objects.extid
-                # swh.journal.objects.raw_extrinsic_metadata
-            ]
-        )
-        while True:
-            msg = consumer.poll(timeout=10.0)
-            if msg is None:
-                break
-            error = msg.error()
-            if error is not None:
-                raise KafkaException(error)
-            yield from handle_message(msg)
+        while not done:
+            batch = []
+            messages = _consumer.consume(num_messages=batch_size, timeout=1.0)
+            if messages:
+                last_received = time.monotonic()
+            elif time.monotonic() - last_received > CONSUME_IDLE_TIMEOUT:
+                raise AssertionError(
+                    f"No message received from {topic} partition {partition} "
+                    f"for {CONSUME_IDLE_TIMEOUT:.0f}s while consuming offsets "
+                    f"{start} to {end}"
+                )
+            for msg in messages:
+                error = msg.error()
+                if error is not None:
+                    if error.code() == KafkaError._PARTITION_EOF:
+                        done = True
+                        break
+                    raise KafkaException(error)
+                if msg.offset() >= end:
+                    # offsets may have gaps, in compacted topics
+                    done = True
+                    break
+                batch.append(msg)
+                if msg.offset() >= end - 1:
+                    done = True
+                    break
+            states.extend(handle_messages(topic, batch))
+    finally:
+        _consumer.unassign()
+    return topic, partition, end, states
+
+
+# journal topics holding the objects of each SWHID object type
+OBJECT_TYPE_TO_TOPICS = {
+    "ori": [
+        "swh.journal.objects.origin",
+        "swh.journal.objects.origin_visit",
+        "swh.journal.objects.origin_visit_status",
+    ],
+    "snp": ["swh.journal.objects.snapshot"],
+    "rel": [
+        "swh.journal.objects.release",
+        "swh.journal.objects_privileged.release",
+    ],
+    "rev": [
+        "swh.journal.objects.revision",
+        "swh.journal.objects_privileged.revision",
+    ],
+    "dir": ["swh.journal.objects.directory"],
+    "cnt": ["swh.journal.objects.content"],
+}
+
+# object types whose message key can be rebuilt from the SWHID (the key of
+# origins is their url, and the key of contents holds all their hashes)
+KEYED_BY_ID = {"snp", "rel", "rev", "dir"}
+
+
+def murmur2(data: bytes) -> int:
+    """The murmur2 hash of the Java Kafka client (and of the murmur2
+    partitioners of librdkafka)"""
+    seed, m, r = 0x9747B28C, 0x5BD1E995, 24
+    h = (seed ^ len(data)) & 0xFFFFFFFF
+    for i in range(0, len(data) - len(data) % 4, 4):
+        k = (int.from_bytes(data[i : i + 4], "little") * m) & 0xFFFFFFFF
+        k = ((k ^ (k >> r)) * m) & 0xFFFFFFFF
+        h = ((h * m) & 0xFFFFFFFF) ^ k
+    tail = data[len(data) - len(data) % 4 :]
+    if len(tail) >= 3:
+        h ^= tail[2] << 16
+    if len(tail) >= 2:
+        h ^= tail[1] << 8
+    if len(tail) >= 1:
+        h = ((h ^ tail[0]) * m) & 0xFFFFFFFF
+    h = ((h ^ (h >> 13)) * m) & 0xFFFFFFFF
+    return h ^ (h >> 15)
+
+
+def key_partitions(key: bytes, num_partitions: int) -> Set[int]:
+    """Return the partitions a message with the given key is produced to, by
+    the default partitioners of the Java client (murmur2) and of librdkafka
+    (CRC32); both are considered so producers of both kinds are covered"""
+    import zlib
+
+    return {
+        (murmur2(key) & 0x7FFFFFFF) % num_partitions,
+        zlib.crc32(key) % num_partitions,
+    }
+
+
+def journal_partitions(
+    partition_counts: Dict[str, int], swhids: Optional[Iterable[str]] = None
+) -> Set[Tuple[str, int]]:
+    """Return the journal partitions which may hold messages about the given
+    SWHIDs (all the partitions of the journal topics if swhids is None)
+
+    Only the topics of the object types of the SWHIDs are considered; for
+    object types whose message key is built from their id, only the
+    partitions the keys of the SWHIDs are hashed to are."""
+    if swhids is None:
+        return {
+            (topic, partition)
+            for topic in JOURNAL_TOPICS
+            for partition in range(partition_counts.get(topic, 0))
+        }
+    partitions: Set[Tuple[str, int]] = set()
+    for object_type, ids in ids_by_object_type(swhids).items():
+        for topic in OBJECT_TYPE_TO_TOPICS[object_type]:
+            num_partitions = partition_counts.get(topic, 0)
+            if not num_partitions:
+                continue
+            if object_type not in KEYED_BY_ID:
+                partitions.update((topic, p) for p in range(num_partitions))
+                continue
+            for id_ in ids:
+                partitions.update(
+                    (topic, p)
+                    for p in key_partitions(msgpack.packb(id_), num_partitions)
+                )
+    return partitions
+
+
+def update_journal_index(
+    index: JournalKeyIndex,
+    swhids: Optional[Iterable[str]] = None,
+    processes: int = 4,
+    batch_size: int = 10000,
+    range_size: int = 100000,
+) -> None:
+    """Consume the journal messages published since the last update of the
+    index, and record them in the index
+
+    If swhids is given, only the partitions which may hold messages about
+    them are consumed (see journal_partitions); the index is then up to date
+    for these SWHIDs only.
+
+    The high watermark of each partition is fetched up front, and the
+    messages up to it are split in ranges of at most range_size offsets,
+    consumed by a pool of processes (each with its own consumer); the states
+    of each range are recorded in the index in the order of the ranges, so
+    the offsets stored in the index only move forward."""
+    from multiprocessing import Pool
+
+    from confluent_kafka import TopicPartition
+
+    _init_consumer()
+    assert _consumer is not None
+    try:
+        metadata = _consumer.list_topics(timeout=10)
+        partition_counts = {
+            topic: len(metadata.topics[topic].partitions)
+            for topic in JOURNAL_TOPICS
+            if topic in metadata.topics
+        }
+        watermarks = {
+            (topic, partition): _consumer.get_watermark_offsets(
+                TopicPartition(topic, partition), timeout=10
+            )
+            for topic, partition in journal_partitions(partition_counts, swhids)
+        }
     finally:
-        consumer.close()
+        _consumer.close()
+    index.reset_if_stale(
+        metadata.cluster_id, {tp: high for tp, (_, high) in watermarks.items()}
+    )
+    offsets = index.offsets()
+    tasks = []
+    for (topic, partition), (low, high) in sorted(watermarks.items()):
+        start = max(offsets.get((topic, partition), low), low)
+        for range_start in range(start, high, range_size):
+            range_end = min(range_start + range_size, high)
+            tasks.append((topic, partition, range_start, range_end, batch_size))
+    if not tasks:
+        return
+    with Pool(min(processes, len(tasks)), initializer=_init_consumer) as pool:
+        for topic, partition, next_offset, states in pool.imap(consume_range, tasks):
+            index.update(states, {(topic, partition): next_offset})
 
 
 def get_timestamp(message: Message) -> int:
@@ -281,13 +671,6 @@ def get_timestamp(message: Message) -> int:
         return 0
 
 
-SWHID_ORDER = {"cnt": 0, "dir": 1, "rev": 2, "rel": 3, "snp": 4, "ori": 5}
-
-
-def swhid_key(swhid: str) -> str:
-    return f"{SWHID_ORDER[swhid[6:9]]}{swhid[11:]}"
-
-
 @cli.command()
 @click.option(
     "--presence",
@@ -296,20 +679,39 @@ def swhid_key(swhid: str) -> str:
     default=False,
     help="Ensure the given SWHIDs are present instead of absent",
 )
+@click.option(
+    "--index-path",
+    default=DEFAULT_JOURNAL_INDEX,
+    show_default=True,
+    help="SQLite database of the journal key index",
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of processes consuming the journal",
+)
+@swhids_file_option
 @click.argument("swhids", nargs=-1, callback=validate_swhid)
 @click.pass_context
-def query_kafka(ctx: click.Context, presence: bool, swhids: List[str]) -> None:
-    """Ensure that the given SWHIDs are absent in Kafka (swh-journal)"""
-
-    searched_swhids = set(swhids)
-    journal_swhids: Dict[str, Tuple[int, bool]] = {}
-    for key, message in lookup_kafka_messages():
-        timestamp = get_timestamp(message)
-        if key in journal_swhids and journal_swhids[key][0] > timestamp:
-            continue
-        tombstone = message.value() is None
-        journal_swhids[key] = (timestamp, tombstone)
-    found_swhids = {swhid for swhid, t in journal_swhids.items() if not t[1]}
+def query_kafka(
+    ctx: click.Context,
+    presence: bool,
+    index_path: str,
+    processes: int,
+    swhids_file,
+    swhids: List[str],
+) -> None:
+    """Ensure that the given SWHIDs are absent in Kafka (swh-journal)
+
+    The latest state of each SWHID of the journal is kept in an index, updated
+    with the messages published since the previous query."""
+
+    index = JournalKeyIndex(index_path)
+    searched_swhids = set(read_swhids(ctx, swhids, swhids_file))
+    update_journal_index(index, searched_swhids, processes=processes)
+    found_swhids = index.found(searched_swhids)
     if presence:
         if found_swhids.issuperset(searched_swhids):
             ctx.exit(0)
@@ -346,11 +748,25 @@ def validate_obj_id(ctx, param, value):
     return obj_ids
 
 
+def missing_obj_ids(objstorage, obj_ids: List[bytes]) -> Set[bytes]:
+    from swh.objstorage.interface import objid_from_dict
+
+    return {
+        obj_id["sha1"]
+        for obj_id in objstorage.missing(
+            [objid_from_dict({"sha1": obj_id}) for obj_id in obj_ids]
+        )
+    }
+
+
 @cli.command()
 @click.option(
     "--objstorage-url",
+    "objstorage_urls",
     metavar="URL",
-    help="URL for the objstorage RPC",
+    multiple=True,
+    required=True,
+    help="URL for the objstorage RPC (may be repeated)",
 )
 @click.option(
     "--presence",
@@ -359,43 +775,96 @@ def validate_obj_id(ctx, param, value):
     default=False,
     help="Ensure the given objects are present instead of absent",
 )
+@click.option(
+    "--compare",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Ensure the given objects are in the same state (present or absent) "
+    "in all the objstorages, instead of checking presence or absence",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="Number of objects checked per request",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Maximum number of requests in flight",
+)
 @click.argument("obj_ids", nargs=-1, callback=validate_obj_id)
 @click.pass_context
 def query_objstorage(
-    ctx: click.Context, objstorage_url: str, presence: bool, obj_ids: List[bytes]
+    ctx: click.Context,
+    objstorage_urls: List[str],
+    presence: bool,
+    compare: bool,
+    batch_size: int,
+    workers: int,
+    obj_ids: List[bytes],
 ) -> None:
     """Ensure that the given objects (referenced by their SHA1)
-    are absent from swh-objstorage"""
+    are absent from swh-objstorage
+
+    Objects are checked in batches, with the batch API of the objstorage;
+    batches are sent concurrently, to all the given objstorages."""
+
+    from concurrent.futures import ThreadPoolExecutor
 
-    from swh.objstorage.exc import ObjNotFoundError
     from swh.objstorage.factory import get_objstorage
-    from swh.objstorage.interface import objid_from_dict
 
-    objstorage = get_objstorage(cls="remote", url=objstorage_url)
     searched_obj_ids = set(obj_ids)
-    found_obj_ids = set()
-    for obj_id in searched_obj_ids:
-        try:
-            objstorage.check(objid_from_dict({"sha1": obj_id}))
-        except ObjNotFoundError:
-            continue
-        found_obj_ids.add(obj_id)
-    if presence:
-        if found_obj_ids.issuperset(searched_obj_ids):
+    objstorages = {
+        url: get_objstorage(cls="remote", url=url) for url in objstorage_urls
+    }
+    found_obj_ids: Dict[str, Set[bytes]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            url: [
+                executor.submit(missing_obj_ids, objstorage, list(batch))
+                for batch in grouper(sorted(searched_obj_ids), batch_size)
+            ]
+            for url, objstorage in objstorages.items()
+        }
+        for url, url_futures in futures.items():
+            missing = set().union(*(future.result() for future in url_futures))
+            found_obj_ids[url] = searched_obj_ids - missing
+
+    if compare:
+        differing = {
+            obj_id
+            for obj_id in searched_obj_ids
+            if len({obj_id in found for found in found_obj_ids.values()}) > 1
+        }
+        if not differing:
             ctx.exit(0)
-        else:
-            print("Not found:\n")
-            for obj_id in sorted(searched_obj_ids - found_obj_ids):
+        print("Differences between objstorages:\n")
+        for obj_id in sorted(differing):
+            present_in = [
+                url for url, found in found_obj_ids.items() if obj_id in found
+            ]
+            click.echo(f"{obj_id.hex()} only in {', '.join(present_in)}")
+        ctx.exit(1)
+
+    error = False
+    for url, found in found_obj_ids.items():
+        where = f" in {url}" if len(found_obj_ids) > 1 else ""
+        if presence and not found.issuperset(searched_obj_ids):
+            print(f"Not found{where}:\n")
+            for obj_id in sorted(searched_obj_ids - found):
                 click.echo(obj_id.hex())
-            ctx.exit(1)
-    else:
-        if found_obj_ids.isdisjoint(obj_ids):
-            ctx.exit(0)
-        else:
-            print("Found nonetheless:\n")
-            for obj_id in sorted(found_obj_ids & searched_obj_ids):
+            error = True
+        elif not presence and not found.isdisjoint(searched_obj_ids):
+            print(f"Found nonetheless{where}:\n")
+            for obj_id in sorted(found & searched_obj_ids):
                 click.echo(obj_id.hex())
-            ctx.exit(1)
+            error = True
+    ctx.exit(1 if error else 0)
 
 
 ########################################################################
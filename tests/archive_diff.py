@@ -0,0 +1,292 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import json
+import logging
+import shlex
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from .rpc import RpcClient
+from .utils import grouper
+
+logger = logging.getLogger(__name__)
+
+# SWHID object type -> (storage RPC endpoint enumerating the objects of a
+# partition, function returning the object id of an element of a page)
+PARTITION_ENDPOINTS: Dict[str, tuple] = {
+    "cnt": ("content/get_partition", lambda content: content["sha1_git"]),
+    "dir": ("directory/get_id_partition", lambda dir_id: dir_id),
+    "rev": ("revision/get_partition", lambda revision: revision["id"]),
+    "rel": ("release/get_partition", lambda release: release["id"]),
+    "snp": ("snapshot/get_id_partition", lambda snp_id: snp_id),
+}
+
+# SWHID object type -> web API path of the object
+OBJECT_API_PATHS = {
+    "cnt": "content/sha1_git:{}/",
+    "dir": "directory/{}/",
+    "rev": "revision/{}/",
+    "rel": "release/{}/",
+    "snp": "snapshot/{}/",
+}
+
+
+# hashes identifying a content object in an objstorage
+CONTENT_HASHES = ("sha1", "sha1_git", "sha256", "blake2s256")
+
+# Executed by the python interpreter of a container of the compose session
+# (which has swh.objstorage installed) with ``python3 -c``; arguments are the
+# batch size and the URLs of the objstorages. Each line read on stdin is a JSON
+# list of the hashes of a page of contents; for each of them, a JSON dict of
+# the sha1_git of the contents missing from each objstorage is written on
+# stdout.
+OBJSTORAGE_MISSING_SCRIPT = """
+import json
+import sys
+
+from swh.objstorage.factory import get_objstorage
+from swh.objstorage.interface import objid_from_dict
+
+batch_size = int(sys.argv[1])
+objstorages = {url: get_objstorage("remote", url=url) for url in sys.argv[2:]}
+for line in sys.stdin:
+    obj_ids = [
+        objid_from_dict({algo: bytes.fromhex(h) for algo, h in hashes.items()})
+        for hashes in json.loads(line)
+    ]
+    missing = {
+        url: [
+            obj_id["sha1_git"].hex()
+            for i in range(0, len(obj_ids), batch_size)
+            for obj_id in objstorage.missing(obj_ids[i : i + batch_size])
+        ]
+        for url, objstorage in objstorages.items()
+    }
+    print(json.dumps(missing), flush=True)
+"""
+
+
+class StorageClient(RpcClient):
+    """Minimal client of the swh-storage RPC API"""
+
+    def iter_pages(
+        self, object_type: str, nb_partitions: int = 16, page_size: int = 1000
+    ) -> Iterator[List[Any]]:
+        """Enumerate all the objects of the given type stored in the archive,
+        as returned by the partition endpoint of the type (see
+        ``PARTITION_ENDPOINTS``), by pages of at most page_size objects"""
+        endpoint, _ = PARTITION_ENDPOINTS[object_type]
+        for partition_id in range(nb_partitions):
+            page_token = None
+            while True:
+                page = self.call(
+                    endpoint,
+                    partition_id=partition_id,
+                    nb_partitions=nb_partitions,
+                    page_token=page_token,
+                    limit=page_size,
+                )
+                if page["results"]:
+                    yield page["results"]
+                page_token = page["next_page_token"]
+                if page_token is None:
+                    break
+
+
+class ObjStorages:
+    """Check the presence of contents in several objstorages of a compose
+    session
+
+    The objstorages are queried with batched ``missing`` calls by a script
+    executed in a container of the compose session, so they do not need to be
+    reachable from the host running the tests. The script is started once
+    (see :meth:`start`, or use the instance as a context manager) and checks
+    the contents a page at a time, so the contents of the whole archive are
+    never held in memory.
+
+    args:
+        compose_cmd: the docker compose command of the session (see the
+            compose_cmd fixture)
+
+        urls: the URLs of the objstorage RPC APIs, as seen from the service
+
+        service: the compose service in which the script is executed
+
+        batch_size: number of contents per ``missing`` call
+    """
+
+    def __init__(
+        self,
+        compose_cmd: str,
+        urls: Sequence[str],
+        service: str = "swh-objstorage",
+        batch_size: int = 1000,
+    ):
+        self.compose_cmd = compose_cmd
+        self.urls = list(urls)
+        self.service = service
+        self.batch_size = batch_size
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> "ObjStorages":
+        cmd = shlex.split(self.compose_cmd) + [
+            "exec",
+            "-T",
+            self.service,
+            "python3",
+            "-c",
+            OBJSTORAGE_MISSING_SCRIPT,
+            str(self.batch_size),
+            *self.urls,
+        ]
+        self.process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        return self
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        assert self.process.stdin is not None
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.process = None
+
+    def __enter__(self) -> "ObjStorages":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def missing(self, contents: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Return the SWHIDs of the given contents (dicts with their hashes, as
+        returned by the storage) missing from each objstorage, by URL"""
+        if self.process is None:
+            self.start()
+        assert self.process is not None
+        assert self.process.stdin is not None and self.process.stdout is not None
+        hashes = [
+            {algo: content[algo].hex() for algo in CONTENT_HASHES if algo in content}
+            for content in contents
+        ]
+        self.process.stdin.write(json.dumps(hashes) + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        assert line, (
+            f"Failed to query objstorages (exit code {self.process.poll()}), "
+            f"see the {self.service} logs"
+        )
+        return {
+            url: [f"swh:1:cnt:{sha1_git}" for sha1_git in missing]
+            for url, missing in json.loads(line).items()
+        }
+
+
+@dataclasses.dataclass
+class ArchiveDiff:
+    # object type -> number of objects checked
+    checked: Dict[str, int] = dataclasses.field(
+        default_factory=lambda: defaultdict(int)
+    )
+    # SWHIDs of the objects missing from the mirror
+    missing: List[str] = dataclasses.field(default_factory=list)
+    # SWHID -> object as returned by the web API of the main archive, for
+    # (some of) the missing objects
+    details: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    # objstorage URL -> SWHIDs of the contents missing from this objstorage
+    missing_contents: Dict[str, List[str]] = dataclasses.field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.missing) or any(self.missing_contents.values())
+
+    def report(self) -> str:
+        lines = [
+            f"{len(self.missing)} objects missing from the mirror (checked "
+            + ", ".join(f"{n} {t}" for t, n in sorted(self.checked.items()))
+            + ")"
+        ]
+        for swhid in self.missing:
+            lines.append(f"- {swhid}")
+            if swhid in self.details:
+                lines.append(f"  {self.details[swhid]}")
+        for url, swhids in sorted(self.missing_contents.items()):
+            if swhids:
+                lines.append(f"{len(swhids)} contents missing from objstorage {url}")
+                lines.extend(f"- {swhid}" for swhid in swhids)
+        return "\n".join(lines)
+
+
+def diff_archives(
+    main_storage: StorageClient,
+    mirror_api_get: Callable,
+    main_api_get: Optional[Callable] = None,
+    object_types: Sequence[str] = ("snp", "rel", "rev", "dir", "cnt"),
+    batch_size: int = 1000,
+    max_details: int = 20,
+    objstorages: Optional[ObjStorages] = None,
+) -> ArchiveDiff:
+    """Check every object of the main archive is known by the mirror
+
+    SWHIDs are enumerated, page by page, from the main storage and checked by
+    batches of batch_size against the ``known/`` endpoint of the mirror web
+    API; objects are only retrieved (from the main archive web API, if
+    main_api_get is given) for the first max_details missing ones, to
+    help diagnosing a replication issue.
+
+    As ``known/`` only tells whether contents are referenced by the mirror
+    storage, the presence of their data is checked, page by page, in the
+    objstorages of both archives when objstorages is given.
+
+    args:
+        main_storage: the RPC client of the main storage
+
+        mirror_api_get: the api_get function of the mirror web API
+
+        main_api_get: the api_get function of the main archive web API
+
+        object_types: SWHID object types of the objects to check
+
+        batch_size: number of SWHIDs per query of the ``known/`` endpoint
+            (the web API does not accept more than 1000 SWHIDs per query)
+
+        max_details: maximum number of missing objects to retrieve
+
+        objstorages: the objstorages in which the data of every content of the
+            main archive must be present
+    """
+    diff = ArchiveDiff()
+    t0 = time.monotonic()
+    for object_type in object_types:
+        _, get_id = PARTITION_ENDPOINTS[object_type]
+        for objects in main_storage.iter_pages(object_type, page_size=batch_size):
+            if object_type == "cnt" and objstorages is not None:
+                for url, swhids in objstorages.missing(objects).items():
+                    diff.missing_contents.setdefault(url, []).extend(swhids)
+            page = [f"swh:1:{object_type}:{get_id(obj).hex()}" for obj in objects]
+            for batch in grouper(page, batch_size):
+                swhids = list(batch)
+                known = mirror_api_get("known/", verb="POST", json=swhids)
+                diff.checked[object_type] += len(swhids)
+                diff.missing.extend(
+                    swhid for swhid in swhids if not known[swhid]["known"]
+                )
+        print(
+            f"Checked {diff.checked[object_type]} {object_type} objects "
+            f"({time.monotonic()-t0:.2f}s)"
+        )
+    if main_api_get is not None:
+        for swhid in diff.missing[:max_details]:
+            _, _, object_type, object_id = swhid.split(":")
+            diff.details[swhid] = main_api_get(
+                OBJECT_API_PATHS[object_type].format(object_id)
+            )
+    return diff
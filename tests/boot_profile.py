@@ -0,0 +1,253 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# helpers of the entrypoints waiting for another service to be ready, see
+# utils/swhutils.sh
+WAIT_FOR_IT_RE = re.compile(r"wait-for-it(?:\.sh)?\b[^\n]*?\s([\w.${}-]+):\S+")
+WAIT_FOR_URL_RE = re.compile(r"wait-for-(?:http|topic)\s+(\S+)")
+ENV_VAR_RE = re.compile(r"\$\{?(\w+)\}?")
+
+
+@dataclasses.dataclass
+class ServiceBoot:
+    """Boot timestamps of the container of a compose service, in seconds since
+    the start of the boot (None if the event has not been seen)"""
+
+    service: str
+    created: Optional[float] = None
+    started: Optional[float] = None
+    healthy: Optional[float] = None
+    # services this one waits for, from compose depends_on and the wait-for-*
+    # calls of its entrypoint
+    depends_on: Set[str] = dataclasses.field(default_factory=set)
+
+    @property
+    def ready(self) -> Optional[float]:
+        """Time at which the service is considered ready by dependent services"""
+        return self.healthy if self.healthy is not None else self.started
+
+
+def entrypoint_dependencies(
+    entrypoint: str, environment: Dict[str, str], services: Set[str]
+) -> Set[str]:
+    """Return the services an entrypoint script waits for"""
+
+    def expand(value: str) -> str:
+        return ENV_VAR_RE.sub(lambda m: environment.get(m.group(1)) or "", value)
+
+    hosts = {expand(host) for host in WAIT_FOR_IT_RE.findall(entrypoint)}
+    hosts.update(
+        urlparse(expand(url)).hostname or ""
+        for url in WAIT_FOR_URL_RE.findall(entrypoint)
+    )
+    # variables may hold urls (e.g. SWH_SCHEDULER_INSTANCE)
+    hosts = {urlparse(h).hostname or "" if "://" in h else h for h in hosts}
+    return hosts & services
+
+
+def compose_dependencies(compose_config: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Return the dependencies of each service of a compose configuration (as
+    returned by ``docker compose config --format json``)"""
+    services = compose_config.get("services", {})
+    dependencies = {}
+    for name, service in services.items():
+        depends_on = set(service.get("depends_on") or {})
+        environment = service.get("environment") or {}
+        for volume in service.get("volumes") or []:
+            if (
+                isinstance(volume, dict)
+                and volume.get("target", "").endswith("entrypoint.sh")
+                and os.path.isfile(volume.get("source", ""))
+            ):
+                with open(volume["source"]) as f:
+                    depends_on |= entrypoint_dependencies(
+                        f.read(), environment, set(services)
+                    )
+        depends_on.discard(name)
+        dependencies[name] = depends_on
+    return dependencies
+
+
+class BootProfiler:
+    """Record the boot of the containers of a compose project
+
+    ``docker events`` is tailed while the compose project is started, to
+    record when the container of each service is created, started and
+    reported healthy. Combined with the dependencies between services, this
+    gives the critical path of the boot: the chain of services which had to
+    wait for each other, ending with the last service to get ready.
+
+    args:
+        docker_host: the testinfra host on which docker commands are executed
+
+        project_name: the compose project name
+
+        compose_cmd: the docker compose command of the project
+    """
+
+    def __init__(self, docker_host, project_name: str, compose_cmd: str):
+        self.docker_host = docker_host
+        self.project_name = project_name
+        self.compose_cmd = compose_cmd
+        self.t0 = 0.0
+        self.services: Dict[str, ServiceBoot] = {}
+        self.lock = threading.Lock()
+        self.process: Optional[subprocess.Popen] = None
+        self.reader: Optional[threading.Thread] = None
+
+    def start(self) -> "BootProfiler":
+        self.t0 = time.time()
+        cmd = [
+            "docker",
+            "events",
+            "--since",
+            f"{self.t0:.3f}",
+            "--filter",
+            "type=container",
+            "--filter",
+            f"label=com.docker.compose.project={self.project_name}",
+            "--format",
+            "{{json .}}",
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        self.reader = threading.Thread(
+            target=self._read_events, name="boot-profiler", daemon=True
+        )
+        self.reader.start()
+        return self
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            # let docker events flush the last events
+            time.sleep(1)
+            self.process.terminate()
+            self.process.wait(timeout=10)
+        if self.reader is not None:
+            self.reader.join(timeout=10)
+
+    def _read_events(self) -> None:
+        assert self.process is not None and self.process.stdout is not None
+        for line in self.process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            service = (
+                event.get("Actor", {})
+                .get("Attributes", {})
+                .get("com.docker.compose.service")
+            )
+            if not service:
+                continue
+            timestamp = event.get("timeNano", 0) / 1e9 - self.t0
+            action = event.get("Action", "")
+            field = {
+                "create": "created",
+                "start": "started",
+                "health_status: healthy": "healthy",
+            }.get(action)
+            if field is None:
+                continue
+            with self.lock:
+                boot = self.services.setdefault(service, ServiceBoot(service))
+                # only keep the first boot of each container
+                if getattr(boot, field) is None:
+                    setattr(boot, field, timestamp)
+
+    def set_dependencies(self) -> None:
+        config = json.loads(
+            self.docker_host.check_output(f"{self.compose_cmd} config --format json")
+        )
+        with self.lock:
+            for service, dependencies in compose_dependencies(config).items():
+                if service in self.services:
+                    self.services[service].depends_on = dependencies
+
+    def critical_path(self) -> List[ServiceBoot]:
+        """Return the chain of services ending with the last one to get ready,
+        each one being preceded by its latest ready dependency"""
+        ready = {s: b for s, b in self.services.items() if b.ready is not None}
+        if not ready:
+            return []
+        boot = max(ready.values(), key=lambda b: b.ready or 0.0)
+        path = [boot]
+        seen = {boot.service}
+        while True:
+            deps = [ready[d] for d in boot.depends_on if d in ready and d not in seen]
+            if not deps:
+                break
+            boot = max(deps, key=lambda b: b.ready or 0.0)
+            seen.add(boot.service)
+            path.append(boot)
+        return path[::-1]
+
+    def report(self) -> Dict[str, Any]:
+        path = self.critical_path()
+        steps = []
+        previous_ready = 0.0
+        for boot in path:
+            created = boot.created or 0.0
+            # a container may be created before its dependencies are ready, but
+            # its entrypoint then waits for them
+            waited_until = max(created, previous_ready)
+            steps.append(
+                {
+                    "service": boot.service,
+                    "waited_for_dependencies": round(waited_until - created, 3),
+                    "time_to_ready": round((boot.ready or 0.0) - waited_until, 3),
+                }
+            )
+            previous_ready = boot.ready or 0.0
+        return {
+            "project_name": self.project_name,
+            "boot_seconds": round(previous_ready, 3),
+            "critical_path": steps,
+            "services": {
+                service: {
+                    "created": boot.created,
+                    "started": boot.started,
+                    "healthy": boot.healthy,
+                    "depends_on": sorted(boot.depends_on),
+                }
+                for service, boot in sorted(self.services.items())
+            },
+        }
+
+    def text_report(self, report: Optional[Dict[str, Any]] = None) -> str:
+        if report is None:
+            report = self.report()
+        lines = [
+            f"Boot of {report['project_name']} took {report['boot_seconds']:.2f}s, "
+            "critical path:"
+        ]
+        for step in report["critical_path"]:
+            lines.append(
+                f"  {step['service']:<40} "
+                f"waited {step['waited_for_dependencies']:7.2f}s  "
+                f"ready in {step['time_to_ready']:7.2f}s"
+            )
+        return "\n".join(lines)
+
+    def write_report(self, path: str) -> Dict[str, Any]:
+        """Write the JSON report to path, and return it"""
+        self.set_dependencies()
+        report = self.report()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
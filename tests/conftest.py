@@ -4,14 +4,15 @@
 # See top-level LICENSE file for more information
 
 import atexit
+import json
 import logging
 import os
-import re
 import shutil
 import time
-from functools import partial
+from datetime import datetime, timezone
+from functools import lru_cache, partial
 from subprocess import CalledProcessError, check_output
-from typing import Iterable, List, Tuple, Union
+from typing import Iterable, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 from uuid import uuid4 as uuid
 
@@ -19,16 +20,49 @@ import pytest
 import requests
 import testinfra
 
+from .archive_diff import StorageClient
+from .boot_profile import BootProfiler
+from .container_stats import ContainerStatsSampler
+from .failure_logs import dump_logs
+from .journal import JournalBarrier, OriginVisitStatusWatcher
+from .resources import ResourceBudget, StackCost, host_capacity, pack_modules
+from .resources import stack_cost as stack_cost_func
+from .retry import RECORDER as RETRY_RECORDER
+from .scheduler import SchedulerClient, TaskStatusTracker, create_tasks
+from .snapshots import ArchiveSnapshots
+from .stackpool import StackPool
+from .stacks import (
+    ComposeStack,
+    ComposeStackRegistry,
+    TeardownReaper,
+    compose_images,
+    image_digests,
+    stack_fingerprint,
+    stop_compose_session,
+)
+from .synthetic import ORIGIN_SERVER, synthetic_repositories
+from .tokens import BearerTokens
+from .utils import HTTPSessions
 from .utils import api_get as api_get_func
 from .utils import api_get_directory as api_get_directory_func
 from .utils import api_poll as api_poll_func
-from .utils import compose_host_for_service, retry_until_success
+from .utils import compose_host_for_service
 
 logger = logging.getLogger(__name__)
 
 # wait-for-it timeout
 WFI_TIMEOUT = 120
 
+# journal clients rebuilding their state from the journal of a compose session
+# whose archive has been restored from a snapshot (see the origins fixture), by
+# compose service, with their consumer group
+REPLAYING_JOURNAL_CLIENTS = {
+    "swh-scheduler-journal-client": "swh.scheduler.journal_client",
+    "swh-counters-journal-client": "swh.counters.journal_client",
+    "swh-search-journal-client-objects": "swh.search.journal_client",
+    "swh-search-journal-client-indexed": "swh.search.journal_client",
+}
+
 
 def pytest_collection_modifyitems(config, items):
     """Tests for swh-environment require docker compose (v2 or v1) so skip them
@@ -53,6 +87,118 @@ def pytest_collection_modifyitems(config, items):
     if skipper is not None:
         for item in items:
             item.add_marker(skipper)
+    elif config.getoption("numprocesses", None):
+        pack_test_modules(config, items)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "reusable_stack: the tests of the module only load origins in the "
+        "archive and do not depend on its exact content, so their compose "
+        "session can be shared with other test modules marked as well",
+    )
+    if config.getoption("dist", "no") == "load":
+        # the tests of a module share a compose session, distributing them
+        # among several pytest-xdist workers would boot one per worker
+        config.option.dist = "loadfile"
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    # waits of retry_until_success are attributed to the test being executed
+    # (including the setup and teardown of the fixtures it uses)
+    RETRY_RECORDER.current_test = item.nodeid
+    yield
+    RETRY_RECORDER.current_test = None
+
+
+def pytest_sessionfinish(session):
+    report_path = session.config.getoption("--retry-report")
+    if report_path and RETRY_RECORDER.records:
+        worker_id = xdist_worker_id()
+        if worker_id is not None:
+            # one report per pytest-xdist worker
+            root, ext = os.path.splitext(report_path)
+            report_path = f"{root}.{worker_id}{ext}"
+        with open(report_path, "w") as f:
+            json.dump(RETRY_RECORDER.report(), f, indent=2)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if RETRY_RECORDER.records:
+        terminalreporter.write_line(RETRY_RECORDER.text_report())
+
+
+def xdist_worker_id() -> Optional[str]:
+    """Return the id of the pytest-xdist worker executing the tests (None if
+    tests are not executed by pytest-xdist)"""
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+@lru_cache(maxsize=None)
+def pull_images(compose_files: Tuple[str, ...]) -> None:
+    """Pull the docker images used by compose files, once per test session"""
+    compose_file_cmd = "".join(f" -f {fname} " for fname in compose_files)
+    testinfra.get_host("local://").check_output(
+        f"docker compose {compose_file_cmd} pull --ignore-pull-failures"
+    )
+
+
+@lru_cache(maxsize=None)
+def compose_config(compose_files: Tuple[str, ...]) -> dict:
+    compose_file_args = [arg for fname in compose_files for arg in ("-f", fname)]
+    return json.loads(
+        check_output(
+            ["docker", "compose", *compose_file_args, "config", "--format", "json"]
+        )
+    )
+
+
+def module_compose_stack(item) -> Tuple[List[str], List[str]]:
+    """Return the compose files and services of the stack of a test item,
+    without setting up any fixture: they are read from the COMPOSE_FILES and
+    COMPOSE_SERVICES constants of its module, or from the parameter of the
+    compose_files fixture when it is parametrized"""
+    callspec = getattr(item, "callspec", None)
+    files = callspec.params.get("compose_files") if callspec is not None else None
+    if files is None:
+        files = getattr(item.module, "COMPOSE_FILES", ["compose.yml"])
+    return files, getattr(item.module, "COMPOSE_SERVICES", [])
+
+
+def pack_test_modules(config, items) -> None:
+    """Reorder test modules (the unit of distribution of the loadfile mode of
+    pytest-xdist) so that heavy compose stacks (e.g. mirror, graph) are
+    executed alongside light ones (e.g. smtp, keycloak), see pack_modules"""
+    capacity = budget_capacity(config)
+    module_items: dict = {}
+    costs = {}
+    for item in items:
+        module = item.nodeid.split("::")[0]
+        module_items.setdefault(module, []).append(item)
+        if module in costs:
+            continue
+        costs[module] = 0.0
+        if "docker_compose" not in item.fixturenames:
+            continue
+        try:
+            files, services = module_compose_stack(item)
+            costs[module] = stack_cost_func(
+                compose_config(tuple(files)), services
+            ).weight(capacity)
+        except Exception as exc:
+            print(f"Failed to estimate the cost of the stack of {module}: {exc}")
+            costs[module] = 1.0
+    items[:] = [item for module in pack_modules(costs) for item in module_items[module]]
+
+
+def budget_capacity(config) -> StackCost:
+    capacity = host_capacity()
+    return StackCost(
+        config.getoption("--stack-budget-cpus") or capacity.cpus,
+        config.getoption("--stack-budget-memory") or capacity.memory,
+    )
 
 
 def pytest_addoption(parser):
@@ -64,6 +210,111 @@ def pytest_addoption(parser):
             "used by tests, useful for tests development"
         ),
     )
+    parser.addoption(
+        "--reuse-compose-stacks",
+        action="store_true",
+        help=(
+            "Keep compose sessions running at the end of a test module so they "
+            "can be reused by next test modules using the same compose files, "
+            "services and docker images; only test modules marked with "
+            "reusable_stack reuse or leave behind a running compose session"
+        ),
+    )
+    parser.addoption(
+        "--archive-snapshots-dir",
+        metavar="DIR",
+        help=(
+            "Directory in which snapshots of the archive volumes are stored once "
+            "origins of a test module have been ingested; when a snapshot exists "
+            "for the origins of a test module, it is restored instead of loading "
+            "these origins again"
+        ),
+    )
+    parser.addoption(
+        "--stack-pool",
+        metavar="DIR",
+        help=(
+            "Directory of a pool of booted compose sessions (see "
+            "tests/stackpool.py); test modules lease a compose session from "
+            "the pool when one with the same compose files, services and "
+            "docker images is ready, instead of booting a new one"
+        ),
+    )
+    parser.addoption(
+        "--max-idle-compose-stacks",
+        type=int,
+        default=2,
+        help=(
+            "Maximum number of unused compose sessions kept running when "
+            "--reuse-compose-stacks is set (default: 2)"
+        ),
+    )
+    parser.addoption(
+        "--max-concurrent-teardowns",
+        type=int,
+        default=2,
+        help=(
+            "Maximum number of compose sessions being stopped concurrently, in "
+            "background of the next test modules (default: 2)"
+        ),
+    )
+    parser.addoption(
+        "--failure-logs-window",
+        type=int,
+        metavar="SECONDS",
+        help=(
+            "Only dump the logs of the last SECONDS seconds of the compose "
+            "services when tests of a module fail (default: dump all the logs)"
+        ),
+    )
+    parser.addoption(
+        "--http-pool-size",
+        type=int,
+        default=16,
+        help=(
+            "Maximum number of connections kept alive per host by the HTTP "
+            "sessions used to query the compose services (default: 16)"
+        ),
+    )
+    parser.addoption(
+        "--retry-report",
+        metavar="PATH",
+        help=(
+            "Write the number of attempts and the time spent by each call to "
+            "retry_until_success, per test, and a histogram of the wait times "
+            "of each wait point, as JSON to PATH"
+        ),
+    )
+    parser.addoption(
+        "--container-stats-interval",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help=(
+            "Sample the resource usage of each container of the compose "
+            "sessions at this interval; sampling streams stats from the docker "
+            "daemon, with a thread per container, so it is disabled by default "
+            "(default: 0)"
+        ),
+    )
+    parser.addoption(
+        "--stack-budget-cpus",
+        type=float,
+        help=(
+            "Number of CPUs shared by the compose sessions running concurrently "
+            "(e.g. one per pytest-xdist worker); a compose session is only "
+            "started once enough CPUs are available (default: host cores)"
+        ),
+    )
+    parser.addoption(
+        "--stack-budget-memory",
+        type=int,
+        metavar="MIB",
+        help=(
+            "Memory shared by the compose sessions running concurrently "
+            "(default: 80%% of the host memory)"
+        ),
+    )
 
 
 @pytest.fixture(scope="module")
@@ -72,37 +323,145 @@ def docker_host():
 
 
 @pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    # this fixture is meant to be overloaded in test modules to include the
-    # required compose files for the test (see test_deposit.py for example)
-    return ["compose.yml"]
-
-
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    # this fixture is meant to be overloaded in test modules to explicitly
-    # specify which services to spawn in the docker compose session.
-    # If empty (the default), spawn all the services defined in the compose files.
-    return []
+def compose_files(request) -> List[str]:
+    # test modules declare the compose files required by their tests as a
+    # COMPOSE_FILES constant, from which the cost of their stack is also
+    # estimated when test modules are executed in parallel; this fixture is
+    # overloaded by test modules using several lists of compose files (as the
+    # params of the fixture, see test_deposit.py for example)
+    return list(getattr(request.module, "COMPOSE_FILES", ["compose.yml"]))
 
 
 @pytest.fixture(scope="module")
-def project_name() -> str:
-    return f"swh_test_{uuid()}"
+def compose_services(request) -> List[str]:
+    # test modules explicitly specify which services to spawn in the docker
+    # compose session as a COMPOSE_SERVICES constant. If empty (the default),
+    # spawn all the services defined in the compose files.
+    return list(getattr(request.module, "COMPOSE_SERVICES", []))
 
 
 @pytest.fixture(scope="module")
-def compose_cmd(docker_host, project_name, compose_files, pytestconfig):
+def effective_compose_files(compose_files, pytestconfig) -> List[str]:
     compose_override = "compose.override.yml"
     if (
         pytestconfig.getoption("--use-compose-override")
         and compose_override not in compose_files
         and os.path.isfile(compose_override)
     ):
-        compose_files.append(compose_override)
+        return compose_files + [compose_override]
+    return compose_files
+
+
+@pytest.fixture(scope="session")
+def resource_budget(pytestconfig, tmp_path_factory) -> ResourceBudget:
+    basetemp = tmp_path_factory.getbasetemp()
+    if xdist_worker_id() is not None:
+        # the base temporary directory of each worker is a subdirectory of the
+        # one of the test session
+        basetemp = basetemp.parent
+    return ResourceBudget(
+        os.path.join(basetemp, "stack-budget.json"), budget_capacity(pytestconfig)
+    )
+
+
+@pytest.fixture(scope="session")
+def compose_stacks(pytestconfig, resource_budget):
+    docker_host = testinfra.get_host("local://")
+
+    # compose sessions are stopped in background, while the next test module
+    # starts its own one
+    # the share of the budget of a stack is only released once its containers
+    # are gone, so stacks being stopped still count
+    reaper = TeardownReaper(
+        stop=partial(stop_compose_session, docker_host),
+        max_workers=pytestconfig.getoption("--max-concurrent-teardowns"),
+        on_done=resource_budget.release,
+    )
+
+    worker_id = xdist_worker_id()
+    registry = ComposeStackRegistry(
+        stop=reaper.submit,
+        stopping=reaper.pending,
+        enabled=pytestconfig.getoption("--reuse-compose-stacks"),
+        max_idle=pytestconfig.getoption("--max-idle-compose-stacks"),
+        project_prefix=f"swh_test_{worker_id}_" if worker_id else "swh_test_",
+        pool=(
+            StackPool(pytestconfig.getoption("--stack-pool"))
+            if pytestconfig.getoption("--stack-pool")
+            else None
+        ),
+    )
+    # register exit handlers to ensure started containers will be stopped if any
+    # keyboard interruption or unhandled exception occurs (handlers are called
+    # in reverse order of registration)
+    join_reaper_func = atexit.register(reaper.shutdown)
+    stop_stacks_func = atexit.register(registry.stop_all)
+    yield registry
+    atexit.unregister(stop_stacks_func)
+    atexit.unregister(join_reaper_func)
+    registry.stop_all()
+    errors = reaper.shutdown()
+    assert not errors, "\n".join(errors)
+
+
+@pytest.fixture(scope="module")
+def compose_fingerprint(
+    docker_host, compose_stacks, effective_compose_files, compose_services
+) -> str:
+    if not compose_stacks.enabled and compose_stacks.pool is None:
+        # no need to pay for inspecting images
+        return str(uuid())
+    # images must be pulled for their digests to be known
+    pull_images(tuple(effective_compose_files))
+    return stack_fingerprint(
+        effective_compose_files,
+        compose_services,
+        image_digests(
+            docker_host, compose_images(docker_host, effective_compose_files)
+        ),
+    )
+
+
+@pytest.fixture(scope="session")
+def archive_snapshots(pytestconfig) -> Optional[ArchiveSnapshots]:
+    snapshots_dir = pytestconfig.getoption("--archive-snapshots-dir")
+    if not snapshots_dir:
+        return None
+    os.makedirs(snapshots_dir, exist_ok=True)
+    return ArchiveSnapshots(
+        testinfra.get_host("local://"),
+        snapshots_dir,
+        image=f"swh/stack:{os.environ.get('SWH_IMAGE_TAG', 'latest')}",
+    )
+
+
+@pytest.fixture(scope="module")
+def stack_cost(effective_compose_files, compose_services) -> StackCost:
+    return stack_cost_func(
+        compose_config(tuple(effective_compose_files)), compose_services
+    )
+
+
+@pytest.fixture(scope="module")
+def compose_stack(request, compose_stacks, compose_fingerprint) -> ComposeStack:
+    # nothing resets the archive, the journal or the search index of a stack
+    # between test modules, so only modules opting in share their stacks
+    return compose_stacks.acquire(
+        compose_fingerprint,
+        reuse=request.node.get_closest_marker("reusable_stack") is not None,
+    )
+
+
+@pytest.fixture(scope="module")
+def project_name(compose_stack) -> str:
+    return compose_stack.project_name
+
+
+@pytest.fixture(scope="module")
+def compose_cmd(docker_host, project_name, effective_compose_files):
     print(f"COMPOSE_PROJECT_NAME={project_name}", end=" ")
-    print(f"COMPOSE_FILE={':'.join(compose_files)}")
-    compose_file_cmd = "".join(f" -f {fname} " for fname in compose_files)
+    print(f"COMPOSE_FILE={':'.join(effective_compose_files)}")
+    compose_file_cmd = "".join(f" -f {fname} " for fname in effective_compose_files)
     try:
         docker_host.check_output("docker compose version")
         return f"docker compose -p {project_name} {compose_file_cmd} "
@@ -111,59 +470,104 @@ def compose_cmd(docker_host, project_name, compose_files, pytestconfig):
         return f"docker-compose -p {project_name} {compose_file_cmd} "
 
 
-def stop_compose_session(docker_host, project_name, compose_cmd):
-    print(f"\nStopping the compose session {project_name}...", end=" ", flush=True)
-    # first kill all the containers (brutal but much faster than a proper shutdown)
-    containers = docker_host.check_output(f"{compose_cmd} ps -q").replace("\n", " ")
-    if containers:
-        try:
-            docker_host.check_output(f"docker kill {containers}")
-        except AssertionError:
-            # may happen if a container is killed as a result of another one
-            # being shut down...
-            pass
-        # and gently stop the cluster
-        docker_host.check_output(f"{compose_cmd} down --volumes --remove-orphans")
-        print("OK")
-        retry_until_success(
-            lambda: not docker_host.check_output(f"{compose_cmd} ps -q"),
-            error_message="Failed to shut compose down",
-            max_attempts=30,
-        )
-        print("... All the services are stopped")
-
-
 # scope='module' so we use the same container for all the tests in a test file
 @pytest.fixture(scope="module")
 def docker_compose(
-    request, docker_host, project_name, compose_cmd, compose_services, tmp_path_factory
+    request,
+    docker_host,
+    compose_stacks,
+    compose_stack,
+    compose_cmd,
+    compose_services,
+    effective_compose_files,
+    archive_snapshots,
+    origin_urls,
+    resource_budget,
+    stack_cost,
+    tmp_path_factory,
 ):
-    # register an exit handler to ensure started containers will be stopped if any
-    # keyboard interruption or unhandled exception occurs
-    stop_compose_func = atexit.register(
-        stop_compose_session, docker_host, project_name, compose_cmd
-    )
+    project_name = compose_stack.project_name
     failed_tests_count = request.node.session.testsfailed
     got_exception = False
-    print(f"Starting the compose session {project_name} ...", end=" ", flush=True)
+    stats_interval = request.config.getoption("--container-stats-interval")
+    sampler = None
     try:
-        # pull required docker images
-        docker_host.check_output(f"{compose_cmd} pull --ignore-pull-failures")
+        if compose_stack.booted:
+            # the stack has been left running by a previous test module (or
+            # leased from the stack pool), just ensure all its services are
+            # (still) up; stacks of test modules altering the archive are not
+            # reused, so the archive only holds origins loaded by previous
+            # test modules (see ComposeStack.loaded_origins)
+            compose_stack.compose_cmd = compose_cmd
+            print(
+                f"Reusing the compose session {project_name} ...",
+                end=" ",
+                flush=True,
+            )
+            if stats_interval:
+                sampler = ContainerStatsSampler(project_name, stats_interval).start()
+            docker_host.check_output(
+                f"{compose_cmd} up --wait -d {' '.join(compose_services)}"
+            )
+        else:
+            # wait for the compose sessions started by other test modules (or
+            # pytest-xdist workers) to leave enough resources for this one
+            # (idle stacks kept running by this process for later reuse are
+            # stopped rather than waited for)
+            resource_budget.acquire(
+                project_name, stack_cost, evict=compose_stacks.evict_idle
+            )
+            if stats_interval:
+                sampler = ContainerStatsSampler(project_name, stats_interval).start()
+            print(
+                f"Starting the compose session {project_name} ...",
+                end=" ",
+                flush=True,
+            )
+            compose_stack.compose_cmd = compose_cmd
+            # pull required docker images (if not done yet to compute the
+            # fingerprint of the stack)
+            pull_images(tuple(effective_compose_files))
+
+            if archive_snapshots is not None:
+                compose_stack.snapshot = archive_snapshots.get(
+                    origin_urls, effective_compose_files
+                )
+                if compose_stack.snapshot and compose_stack.snapshot.exists():
+                    # populate the archive volumes before starting the services
+                    compose_stack.snapshot.restore(project_name)
+                    compose_stack.restored = True
 
-        # start the whole cluster
-        for i in range(3):
+            # start the whole cluster, recording when each service gets ready
+            profiler = BootProfiler(docker_host, project_name, compose_cmd).start()
             try:
-                docker_host.check_output(
-                    f"{compose_cmd} up --wait -d {' '.join(compose_services)}"
+                for i in range(3):
+                    try:
+                        docker_host.check_output(
+                            f"{compose_cmd} up --wait -d {' '.join(compose_services)}"
+                        )
+                        break
+                    except Exception as exc:
+                        print(f"Failed to converge ({exc})")
+                        if i == 2:
+                            print("Giving up!")
+                            raise
+                        else:
+                            print("Retrying...")
+            finally:
+                profiler.stop()
+                report_path = os.path.join(
+                    tmp_path_factory.getbasetemp(),
+                    "docker",
+                    request.node.name.replace(".py", ".boot.json"),
                 )
-                break
-            except Exception as exc:
-                print(f"Failed to converge ({exc})")
-                if i == 2:
-                    print("Giving up!")
-                    raise
-                else:
-                    print("Retrying...")
+                try:
+                    report = profiler.write_report(report_path)
+                    print(f"\n{profiler.text_report(report)}")
+                    print(f"Boot profile written to {report_path}")
+                except Exception as exc:
+                    print(f"Failed to write the boot profile: {exc}")
+            compose_stack.booted = True
 
         print("OK")
 
@@ -179,23 +583,47 @@ def docker_compose(
         got_exception = True
         raise
     finally:
+        if sampler is not None:
+            sampler.stop()
+            stats_path = os.path.join(
+                tmp_path_factory.getbasetemp(),
+                "docker",
+                request.node.name.replace(".py", ".stats"),
+            )
+            try:
+                summary = sampler.write(stats_path)
+                print(f"\n{sampler.text_summary(summary)}")
+                print(f"Container stats written to {stats_path}.jsonl")
+            except Exception as exc:
+                print(f"Failed to write the container stats: {exc}")
         if got_exception or request.node.session.testsfailed != failed_tests_count:
-            logs_filename = request.node.name.replace(".py", ".logs")
-            logs_dir = os.path.join(tmp_path_factory.getbasetemp(), "docker")
-            os.makedirs(logs_dir, exist_ok=True)
-            logs_filepath = os.path.join(logs_dir, logs_filename)
-            print(
-                f"Tests failed in {request.node.name}, "
-                f"dumping logs to {logs_filepath}"
+            logs_dir = os.path.join(
+                tmp_path_factory.getbasetemp(),
+                "docker",
+                request.node.name.replace(".py", ".logs"),
             )
+            window = request.config.getoption("--failure-logs-window")
+            print(f"Tests failed in {request.node.name}, dumping logs to {logs_dir}")
             services = docker_host.check_output(f"{compose_cmd} ps --services --all")
-            for service in services.splitlines():
-                logs = docker_host.check_output(f"{compose_cmd} logs -t {service}")
-                with open(logs_filepath, "a") as logs_file:
-                    logs_file.write(logs)
+            index = dump_logs(
+                compose_cmd,
+                services.splitlines(),
+                logs_dir,
+                since=f"{window}s" if window else None,
+            )
+            print(
+                f"Dumped logs of {len(index['services'])} services "
+                f"in {index['seconds']:.2f}s"
+            )
 
-        atexit.unregister(stop_compose_func)
-        stop_compose_session(docker_host, project_name, compose_cmd)
+        # a stack in which tests failed is not reused, its state is unknown,
+        # nor is a stack used by a module not marked with reusable_stack
+        compose_stacks.release(
+            compose_stack,
+            reusable=not got_exception
+            and request.node.session.testsfailed == failed_tests_count
+            and request.node.get_closest_marker("reusable_stack") is not None,
+        )
 
 
 def service_port(docker_compose_host, service, port=80) -> int:
@@ -244,9 +672,34 @@ def scheduler_host(request, docker_compose):
 
 
 @pytest.fixture(scope="module")
-def http_session():
-    with requests.Session() as session:
-        yield session
+def scheduler_rpc_url(nginx_url) -> str:
+    return f"{nginx_url}/rpc/scheduler/"
+
+
+@pytest.fixture(scope="session")
+def http_sessions(pytestconfig):
+    sessions = HTTPSessions(pool_size=pytestconfig.getoption("--http-pool-size"))
+    yield sessions
+    sessions.close()
+
+
+@pytest.fixture(scope="module")
+def module_http_sessions(http_sessions):
+    # connections are kept alive for the whole test session, but the cookies
+    # set by a test module must not be sent by the next ones
+    http_sessions.clear_cookies()
+    yield http_sessions
+    http_sessions.clear_cookies()
+
+
+@pytest.fixture(scope="module")
+def http_session(module_http_sessions):
+    return module_http_sessions.plain
+
+
+@pytest.fixture(scope="module")
+def poll_session(module_http_sessions):
+    return module_http_sessions.polling
 
 
 @pytest.fixture(scope="module")
@@ -260,13 +713,48 @@ def api_get(api_url, http_session):
 
 
 @pytest.fixture(scope="module")
-def api_poll(api_url, http_session):
-    return partial(api_poll_func, api_url, session=http_session)
+def api_poll(api_url, poll_session):
+    return partial(api_poll_func, api_url, session=poll_session)
 
 
 @pytest.fixture(scope="module")
 def api_get_directory(api_url, http_session):
-    return partial(api_get_directory_func, api_url, session=http_session)
+    # directories are immutable, so their listings are cached for the module
+    return partial(api_get_directory_func, api_url, session=http_session, cache={})
+
+
+@pytest.fixture(scope="module")
+def scheduler_client(scheduler_rpc_url, http_session):
+    return SchedulerClient(scheduler_rpc_url, session=http_session)
+
+
+@pytest.fixture(scope="session")
+def bearer_tokens(http_sessions):
+    # tokens are cached for the whole test session
+    return BearerTokens(session=http_sessions.plain)
+
+
+@pytest.fixture(scope="module")
+def bearer_token(bearer_tokens, nginx_url, compose_stack):
+    """Return the bearer token of a Web API user, given their username and
+    password"""
+    return partial(
+        bearer_tokens.bearer_token,
+        f"{nginx_url}/keycloak/auth/",
+        project=compose_stack.project_name,
+    )
+
+
+@pytest.fixture(scope="module")
+def bearer_auth(bearer_tokens, nginx_url, compose_stack):
+    """Return a requests authentication (to pass as the auth argument of
+    api_get) with the bearer token of a Web API user, given their username and
+    password; the token is minted again if the Web API rejects it"""
+    return partial(
+        bearer_tokens.auth,
+        f"{nginx_url}/keycloak/auth/",
+        project=compose_stack.project_name,
+    )
 
 
 @pytest.fixture(scope="module")
@@ -289,6 +777,14 @@ def tiny_git_repo():
     return "https://gitlab.softwareheritage.org/swh/devel/swh-py-template.git"
 
 
+@pytest.fixture(scope="module")
+def synthetic_repos():
+    """Synthetic repositories served by the origin-server service, indexed by
+    name; test modules using them must include compose.origins.yml in their
+    compose files"""
+    return synthetic_repositories()
+
+
 @pytest.fixture(scope="module")
 def origin_urls(tiny_git_repo) -> List[Tuple[str, Union[str, Iterable[str]]]]:
     # This fixture is meant to be overloaded in test modules to initialize the
@@ -305,6 +801,9 @@ def filter_origins(origin_urls: Iterable[str]) -> str:
 
     for origin_url in origin_urls:
         parsed_url = urlparse(origin_url)
+        if parsed_url.hostname == ORIGIN_SERVER:
+            # synthetic origin, only reachable from the compose session
+            return origin_url
         if parsed_url.scheme in ("http", "https"):
             try:
                 requests.head(origin_url, timeout=5).raise_for_status()
@@ -319,59 +818,132 @@ def filter_origins(origin_urls: Iterable[str]) -> str:
 
 
 @pytest.fixture(scope="module")
-def origins(docker_compose, scheduler_host, origin_urls: List[Tuple[str, str]]):
+def visit_status_watcher(compose_cmd, scheduler_host):
+    """Tail the origin_visit_status journal topic to be notified as soon as
+    origin visits complete (see OriginVisitStatusWatcher)"""
+    with OriginVisitStatusWatcher(compose_cmd) as watcher:
+        yield watcher
+
+
+@pytest.fixture(scope="module")
+def journal_barrier(docker_compose, compose_cmd) -> JournalBarrier:
+    """Wait for journal consumer groups to catch up (see JournalBarrier)"""
+    return JournalBarrier(compose_cmd)
+
+
+@pytest.fixture(scope="module")
+def origins(
+    docker_compose,
+    compose_stack,
+    compose_cmd,
+    compose_services,
+    scheduler_host,
+    scheduler_client,
+    visit_status_watcher,
+    journal_barrier,
+    nginx_url,
+    http_session,
+    origin_urls: List[Tuple[str, str]],
+):
     """A fixture that ingest origins from origin_urls in the storage
 
     For each origin url listed in origin_urls, scheduler a loading task and
-    wait for all the loading tasks to finish. Check these are in the 'eventful'
-    state.
+    wait for the final status of the visits of these tasks to be published in
+    the journal. Check these are 'full' or 'partial' visits.
+
+    Origins already ingested in a compose session reused from a previous test
+    module are not loaded again.
+
+    If the archive volumes of the compose session (including the scheduler
+    database) have been restored from a snapshot (see the
+    --archive-snapshots-dir option), origins are not loaded again; we just
+    wait for the journal clients rebuilding their state from the archive
+    (see REPLAYING_JOURNAL_CLIENTS) to consume the whole journal. Otherwise a
+    snapshot of the archive is taken once origins are loaded.
     """
+    snapshot = compose_stack.snapshot
+    if compose_stack.restored:
+        assert snapshot is not None
+        # next test modules reusing this compose session load their origins
+        compose_stack.restored = False
+        origin_urls = snapshot.origins()
+        # the databases must have been restored too, not only the journal
+        storage = StorageClient(f"{nginx_url}/rpc/storage/", session=http_session)
+        restored = storage.call("origin/get", origins=[url for _, url in origin_urls])
+        missing = [url for (_, url), origin in zip(origin_urls, restored) if not origin]
+        assert not missing, (
+            f"Origins missing from the storage restored from {snapshot.path}: "
+            + ", ".join(missing)
+        )
+        running_services = docker_compose.check_compose_output(
+            "ps --services --status running"
+        ).split()
+        consumer_groups = sorted(
+            {
+                group_id
+                for service, group_id in REPLAYING_JOURNAL_CLIENTS.items()
+                if service in running_services
+            }
+        )
+        if consumer_groups:
+            journal_barrier.wait(consumer_groups, timeout=600)
+        compose_stack.loaded_origins.update(origin_urls)
+        return origin_urls
+
+    take_snapshot = (
+        snapshot is not None
+        and not snapshot.exists()
+        and not compose_stack.loaded_origins
+    )
     origin_urls = [(otype, filter_origins(urls)) for (otype, urls) in origin_urls]
-    task_ids = {}
-
+    to_load = []
     for origin_type, origin_url in origin_urls:
+        if (origin_type, origin_url) in compose_stack.loaded_origins:
+            print(f"{origin_type} origin {origin_url} already loaded")
+            continue
         print(f"Scheduling {origin_type} loading task for {origin_url}")
-        task = scheduler_host.check_output(
-            f"swh scheduler task add load-{origin_type} url={origin_url}"
-        )
-        m = re.search(r"^Task (?P<id>\d+)$", task, flags=re.MULTILINE)
-        assert m
-        taskid = m.group("id")
-        assert int(taskid) > 0
-        task_ids[origin_url] = taskid
-
-    # ids of the tasks still running
-    ids = list(task_ids.values())
-    t0 = time.time()
-
-    def check_origins_load_statuses():
-        taskid = ids.pop(0)
-        origin_url = next(k for k, v in task_ids.items() if v == taskid)
-        status = scheduler_host.check_output(
-            f"swh scheduler task list --list-runs --task-id {taskid}"
+        to_load.append((origin_type, origin_url))
+    # visits which completed before the tasks are created (e.g. in a compose
+    # session reused from a previous test module) are ignored
+    since = datetime.now(tz=timezone.utc)
+    # all the loading tasks are created at once
+    created = create_tasks(
+        compose_cmd,
+        [
+            {"type": f"load-{origin_type}", "kwargs": {"url": origin_url}}
+            for origin_type, origin_url in to_load
+        ],
+    )
+    task_ids = {url: task_id for (_, url), task_id in zip(to_load, created)}
+
+    def loader_logs():
+        return "loader logs: " + docker_compose.check_compose_output("logs swh-loader")
+
+    # wake up as soon as the final status of each visit is published in the
+    # journal
+    visit_statuses = visit_status_watcher.wait_for(task_ids, since=since)
+    for origin_url, visit_status in visit_statuses.items():
+        assert visit_status["status"] in ("full", "partial"), (
+            f"Loading of {origin_url} (task {task_ids[origin_url]}) failed\n"
+            f"visit status: {visit_status}\n" + loader_logs()
         )
-        if "Executions:" in status:
-            if "[eventful]" in status:
-                print(f"Loading of {origin_url} is done (took {time.time() - t0:.2f}s)")
-            elif "[started]" in status or "[scheduled]" in status:
-                ids.append(taskid)
-            elif "[failed]" in status:
-                loader_logs = docker_compose.check_compose_output("logs swh-loader")
-                raise AssertionError(
-                    "Loading execution failed\n"
-                    f"status: {status}\n"
-                    f"loader logs: " + loader_logs
-                )
-            else:
-                raise AssertionError(
-                    f"Loading execution failed, task status is {status}"
-                )
-        else:
-            ids.append(taskid)
-
-        return not ids
 
-    retry_until_success(check_origins_load_statuses)
+    # check the loading tasks and report their timings, from their runs
+    # retrieved in a single scheduler RPC call; runs are recorded by the
+    # scheduler listener asynchronously, those not reported ended yet are not
+    # waited for since the visits are known to be complete
+    tracker = TaskStatusTracker(
+        scheduler_client, task_ids, on_failure=loader_logs, created=since
+    )
+    if not tracker.check():
+        pending = sorted(tracker.labels[task_id] for task_id in tracker.pending)
+        print(f"Runs of the loading tasks of {', '.join(pending)} not ended yet")
+    compose_stack.loaded_origins.update(origin_urls)
+
+    if take_snapshot:
+        snapshot.take(
+            compose_stack.project_name, compose_cmd, origin_urls, compose_services
+        )
 
     return origin_urls
 
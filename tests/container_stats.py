@@ -0,0 +1,328 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import http.client
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def docker_api_connection(
+    timeout: Optional[float] = None,
+) -> http.client.HTTPConnection:
+    """Return a connection to the docker API of the docker daemon used by the
+    docker commands (see DOCKER_HOST)"""
+    docker_host = urlparse(os.environ.get("DOCKER_HOST", "unix:///var/run/docker.sock"))
+    if docker_host.scheme == "unix":
+        return UnixHTTPConnection(docker_host.path, timeout=timeout)
+    return http.client.HTTPConnection(
+        docker_host.hostname or "localhost", docker_host.port or 2375, timeout=timeout
+    )
+
+
+def docker_api_get(path: str) -> Any:
+    conn = docker_api_connection(timeout=30)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        assert response.status == 200, f"GET {path}: {response.status}"
+        return json.loads(response.read())
+    finally:
+        conn.close()
+
+
+@dataclasses.dataclass
+class StatsSample:
+    """Resource usage of a container at a given time (in seconds since the
+    start of the sampling); I/O and network counters are cumulative"""
+
+    time: float
+    service: str
+    container: str
+    cpu_percent: float
+    memory_bytes: int
+    blkio_read_bytes: int
+    blkio_write_bytes: int
+    net_rx_bytes: int
+    net_tx_bytes: int
+
+
+def parse_stats(stats: Dict[str, Any]) -> Tuple[float, int, int, int, int, int]:
+    """Extract (cpu percent, resident memory, block I/O read and written bytes,
+    network received and sent bytes) from a sample of the docker stats API"""
+    cpu_stats = stats.get("cpu_stats") or {}
+    precpu_stats = stats.get("precpu_stats") or {}
+    cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - (
+        precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+    )
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get(
+        "system_cpu_usage", 0
+    )
+    online_cpus = cpu_stats.get("online_cpus") or len(
+        cpu_stats.get("cpu_usage", {}).get("percpu_usage") or [1]
+    )
+    cpu_percent = (
+        cpu_delta / system_delta * online_cpus * 100.0
+        if cpu_delta > 0 and system_delta > 0
+        else 0.0
+    )
+
+    memory_stats = stats.get("memory_stats") or {}
+    memory = memory_stats.get("stats") or {}
+    if "anon" in memory:
+        # cgroup v2
+        rss = memory["anon"]
+    elif "rss" in memory:
+        # cgroup v1
+        rss = memory["rss"]
+    else:
+        rss = memory_stats.get("usage", 0) - memory.get(
+            "inactive_file", memory.get("total_inactive_file", 0)
+        )
+
+    blkio_read = blkio_write = 0
+    for entry in (stats.get("blkio_stats") or {}).get(
+        "io_service_bytes_recursive"
+    ) or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            blkio_read += entry.get("value", 0)
+        elif op == "write":
+            blkio_write += entry.get("value", 0)
+
+    networks = (stats.get("networks") or {}).values()
+    return (
+        round(cpu_percent, 2),
+        max(rss, 0),
+        blkio_read,
+        blkio_write,
+        sum(n.get("rx_bytes", 0) for n in networks),
+        sum(n.get("tx_bytes", 0) for n in networks),
+    )
+
+
+class ContainerStatsSampler:
+    """Sample the resource usage of the containers of a compose project
+
+    The containers of the project are listed every interval seconds, and the
+    stats of each new container are streamed from the docker stats API (which
+    publishes a sample per second) in a dedicated thread until the container
+    stops or the sampler is stopped; a sample is kept every interval seconds
+    per container.
+
+    args:
+        project_name: the compose project name
+
+        interval: seconds between two samples of a container
+    """
+
+    def __init__(self, project_name: str, interval: float = 1.0):
+        self.project_name = project_name
+        self.interval = interval
+        self.t0 = 0.0
+        self.samples: List[StatsSample] = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.connections: Dict[str, http.client.HTTPConnection] = {}
+        self.threads: List[threading.Thread] = []
+        self.watcher: Optional[threading.Thread] = None
+
+    def start(self) -> "ContainerStatsSampler":
+        self.t0 = time.time()
+        self.watcher = threading.Thread(
+            target=self._watch_containers, name="stats-sampler", daemon=True
+        )
+        self.watcher.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join(timeout=10)
+        with self.lock:
+            connections = list(self.connections.values())
+        for conn in connections:
+            # unblock the threads reading the stats streams
+            try:
+                if conn.sock is not None:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self.threads:
+            thread.join(timeout=10)
+
+    def _watch_containers(self) -> None:
+        filters = json.dumps(
+            {"label": [f"com.docker.compose.project={self.project_name}"]}
+        )
+        path = f"/containers/json?filters={quote(filters)}"
+        while not self.stopped.is_set():
+            try:
+                containers = docker_api_get(path)
+            except Exception as exc:
+                logger.debug("Failed to list the containers: %s", exc)
+                containers = []
+            for container in containers:
+                container_id = container["Id"]
+                with self.lock:
+                    if container_id in self.connections:
+                        continue
+                    self.connections[container_id] = docker_api_connection()
+                thread = threading.Thread(
+                    target=self._stream_stats,
+                    args=(
+                        container_id,
+                        container["Labels"].get("com.docker.compose.service", ""),
+                        container["Names"][0].lstrip("/"),
+                    ),
+                    name=f"stats-{container_id[:12]}",
+                    daemon=True,
+                )
+                self.threads.append(thread)
+                thread.start()
+            self.stopped.wait(self.interval)
+
+    def _stream_stats(self, container_id: str, service: str, name: str) -> None:
+        conn = self.connections[container_id]
+        last_sample = 0.0
+        try:
+            conn.request("GET", f"/containers/{container_id}/stats?stream=true")
+            response = conn.getresponse()
+            while not self.stopped.is_set():
+                line = response.readline()
+                if not line:
+                    # the container stopped
+                    break
+                now = time.time()
+                if now - last_sample < self.interval * 0.9:
+                    continue
+                last_sample = now
+                sample = StatsSample(
+                    round(now - self.t0, 3),
+                    service,
+                    name,
+                    *parse_stats(json.loads(line)),
+                )
+                with self.lock:
+                    self.samples.append(sample)
+        except Exception as exc:
+            if not self.stopped.is_set():
+                logger.debug("Stopped sampling the stats of %s: %s", name, exc)
+        finally:
+            conn.close()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Return the peak and average usage of each service; I/O and network
+        usage is the total over the sampling of all the containers of the
+        service"""
+        with self.lock:
+            samples = list(self.samples)
+        by_container: Dict[str, List[StatsSample]] = defaultdict(list)
+        for sample in samples:
+            by_container[sample.container].append(sample)
+        services: Dict[str, Dict[str, Any]] = {}
+        for container_samples in by_container.values():
+            first, last = container_samples[0], container_samples[-1]
+            service = services.setdefault(
+                first.service,
+                {
+                    "samples": 0,
+                    "cpu_percent_peak": 0.0,
+                    "cpu_percent_sum": 0.0,
+                    "memory_bytes_peak": 0,
+                    "memory_bytes_sum": 0,
+                    "blkio_read_bytes": 0,
+                    "blkio_write_bytes": 0,
+                    "net_rx_bytes": 0,
+                    "net_tx_bytes": 0,
+                },
+            )
+            for sample in container_samples:
+                service["samples"] += 1
+                service["cpu_percent_sum"] += sample.cpu_percent
+                service["memory_bytes_sum"] += sample.memory_bytes
+                service["cpu_percent_peak"] = max(
+                    service["cpu_percent_peak"], sample.cpu_percent
+                )
+                service["memory_bytes_peak"] = max(
+                    service["memory_bytes_peak"], sample.memory_bytes
+                )
+            for counter in (
+                "blkio_read_bytes",
+                "blkio_write_bytes",
+                "net_rx_bytes",
+                "net_tx_bytes",
+            ):
+                service[counter] += getattr(last, counter) - getattr(first, counter)
+        for service in services.values():
+            samples_count = service["samples"]
+            service["cpu_percent_avg"] = round(
+                service.pop("cpu_percent_sum") / samples_count, 2
+            )
+            service["memory_bytes_avg"] = (
+                service.pop("memory_bytes_sum") // samples_count
+            )
+        return dict(sorted(services.items()))
+
+    def text_summary(
+        self, summary: Optional[Dict[str, Dict[str, Any]]] = None, top: int = 10
+    ) -> str:
+        if summary is None:
+            summary = self.summary()
+        lines = [f"Services of {self.project_name} using the most memory:"]
+        for service, usage in sorted(
+            summary.items(), key=lambda item: -item[1]["memory_bytes_peak"]
+        )[:top]:
+            lines.append(
+                f"  {service:<40} "
+                f"peak {usage['memory_bytes_peak'] / 2**20:8.1f} MiB "
+                f"{usage['cpu_percent_peak']:6.1f}% CPU  "
+                f"avg {usage['memory_bytes_avg'] / 2**20:8.1f} MiB "
+                f"{usage['cpu_percent_avg']:6.1f}% CPU"
+            )
+        return "\n".join(lines)
+
+    def write(self, path_prefix: str) -> Dict[str, Dict[str, Any]]:
+        """Write the time series (as JSON lines, to <path_prefix>.jsonl) and the
+        summary (to <path_prefix>.summary.json) of the sampling, and return the
+        summary"""
+        os.makedirs(os.path.dirname(path_prefix), exist_ok=True)
+        with self.lock:
+            samples = sorted(self.samples, key=lambda s: s.time)
+        with open(f"{path_prefix}.jsonl", "w") as f:
+            for sample in samples:
+                f.write(json.dumps(dataclasses.asdict(sample)) + "\n")
+        summary = self.summary()
+        with open(f"{path_prefix}.summary.json", "w") as f:
+            json.dump(
+                {
+                    "project_name": self.project_name,
+                    "interval": self.interval,
+                    "services": summary,
+                },
+                f,
+                indent=2,
+            )
+        return summary
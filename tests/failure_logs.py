@@ -0,0 +1,104 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import gzip
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _dump_service_logs(
+    compose_cmd: str,
+    service: str,
+    logs_dir: str,
+    since: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Stream the logs of a compose service to a compressed file
+
+    Logs are compressed by the zstd command if available, with gzip otherwise.
+    """
+    t0 = time.monotonic()
+    cmd = shlex.split(compose_cmd) + ["logs", "-t", "--no-color"]
+    if since:
+        cmd += ["--since", since]
+    cmd.append(service)
+    logs = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert logs.stdout is not None
+    if shutil.which("zstd"):
+        filename = f"{service}.log.zst"
+        compressor = subprocess.Popen(
+            ["zstd", "-q", "-f", "-o", os.path.join(logs_dir, filename)],
+            stdin=logs.stdout,
+        )
+        # so the logs command gets a SIGPIPE if the compressor dies
+        logs.stdout.close()
+        compressor.wait()
+    else:
+        filename = f"{service}.log.gz"
+        with gzip.open(os.path.join(logs_dir, filename), "wb", compresslevel=5) as f:
+            shutil.copyfileobj(logs.stdout, f)
+        logs.stdout.close()
+    return {
+        "file": filename,
+        "returncode": logs.wait(),
+        "compressed_bytes": os.path.getsize(os.path.join(logs_dir, filename)),
+        "seconds": round(time.monotonic() - t0, 3),
+    }
+
+
+def dump_logs(
+    compose_cmd: str,
+    services: Iterable[str],
+    logs_dir: str,
+    since: Optional[str] = None,
+    max_workers: int = 8,
+) -> Dict[str, Any]:
+    """Dump the logs of compose services, one compressed file per service
+
+    Logs of up to max_workers services are retrieved concurrently. An
+    ``index.json`` file describing the dumped files is written in logs_dir
+    and returned.
+
+    args:
+        compose_cmd: the docker compose command of the session
+
+        services: the compose services whose logs are dumped
+
+        logs_dir: the directory in which logs are written
+
+        since: only dump logs more recent than this (a timestamp or a
+            relative time like ``10m``, see ``docker compose logs --since``)
+
+        max_workers: maximum number of services whose logs are retrieved
+            concurrently
+    """
+    os.makedirs(logs_dir, exist_ok=True)
+    t0 = time.monotonic()
+    services = sorted(set(services))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            service: executor.submit(
+                _dump_service_logs, compose_cmd, service, logs_dir, since
+            )
+            for service in services
+        }
+    index: Dict[str, Any] = {"since": since, "services": {}}
+    for service, future in futures.items():
+        try:
+            index["services"][service] = future.result()
+        except Exception as exc:
+            index["services"][service] = {"error": str(exc)}
+    index["seconds"] = round(time.monotonic() - t0, 3)
+    with open(os.path.join(logs_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
@@ -0,0 +1,364 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import json
+import logging
+import shlex
+import subprocess
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, wait
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4 as uuid
+
+logger = logging.getLogger(__name__)
+
+ORIGIN_VISIT_STATUS_TOPIC = "swh.journal.objects.origin_visit_status"
+
+# statuses after which an origin visit will not be updated anymore
+FINAL_VISIT_STATUSES = ("full", "partial", "failed", "not_found")
+
+# Executed by the python interpreter of a container of the compose session
+# (which has confluent_kafka and swh.journal installed, and can reach the kafka
+# broker); origin visit statuses are written as JSON lines on stdout.
+TAIL_VISIT_STATUSES_SCRIPT = """
+import json
+import sys
+
+from confluent_kafka import Consumer, KafkaException
+from swh.journal.serializers import kafka_to_value
+
+consumer = Consumer(
+    {
+        "bootstrap.servers": "kafka:9092",
+        "group.id": sys.argv[1],
+        "auto.offset.reset": "earliest",
+        "enable.auto.commit": "false",
+    }
+)
+consumer.subscribe([sys.argv[2]])
+print(json.dumps({"ready": True}), flush=True)
+try:
+    while True:
+        msg = consumer.poll(timeout=1.0)
+        if msg is None:
+            continue
+        if msg.error() is not None:
+            raise KafkaException(msg.error())
+        status = kafka_to_value(msg.value())
+        print(json.dumps(status, default=str), flush=True)
+finally:
+    consumer.close()
+"""
+
+
+class OriginVisitStatusWatcher:
+    """Tail the origin_visit_status journal topic of a compose session
+
+    A consumer is started in a container of the compose session and streams
+    every origin visit status published in the journal. Callers get a
+    :class:`concurrent.futures.Future` per origin url, resolved with the
+    origin visit status (as a dict) as soon as a final status (see
+    ``FINAL_VISIT_STATUSES``) is published for this origin, so waiting for
+    an ingestion to complete does not involve any polling.
+
+    The topic is consumed from the beginning, so visits that completed before
+    the watcher was started are reported as well; callers waiting for the
+    visits of the tasks they create should only consider the visit statuses
+    dated after the creation of these tasks (see the since argument of
+    :meth:`wait_for`).
+
+    args:
+        compose_cmd: the docker compose command of the session (see the
+            compose_cmd fixture)
+
+        service: the compose service in which the consumer is executed
+    """
+
+    def __init__(self, compose_cmd: str, service: str = "swh-scheduler"):
+        self.compose_cmd = compose_cmd
+        self.service = service
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        # origin url -> final visit statuses seen so far
+        self.final_statuses: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # origin url -> (since, future) waiting for a final visit status
+        self.waiters: Dict[str, List[Tuple[Optional[datetime], Future]]] = defaultdict(
+            list
+        )
+        self.error: Optional[Exception] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.reader: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 120) -> "OriginVisitStatusWatcher":
+        group_id = f"swh.tests.visit-status-watcher.{uuid()}"
+        cmd = shlex.split(self.compose_cmd) + [
+            "exec",
+            "-T",
+            self.service,
+            "python3",
+            "-u",
+            "-",
+            group_id,
+            ORIGIN_VISIT_STATUS_TOPIC,
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        assert self.process.stdin is not None
+        self.process.stdin.write(TAIL_VISIT_STATUSES_SCRIPT)
+        self.process.stdin.close()
+        self.reader = threading.Thread(
+            target=self._read_statuses, name="visit-status-watcher", daemon=True
+        )
+        self.reader.start()
+        if not self.ready.wait(timeout):
+            self.stop()
+            raise AssertionError("Failed to start the origin visit status watcher")
+        if self.error is not None:
+            raise AssertionError(f"Origin visit status watcher failed: {self.error}")
+        return self
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.reader is not None:
+            self.reader.join(timeout=10)
+
+    def __enter__(self) -> "OriginVisitStatusWatcher":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _read_statuses(self) -> None:
+        assert self.process is not None and self.process.stdout is not None
+        try:
+            for line in self.process.stdout:
+                try:
+                    status = json.loads(line)
+                except ValueError:
+                    logger.debug("Ignoring watcher output %r", line)
+                    continue
+                if status.get("ready"):
+                    self.ready.set()
+                elif status.get("status") in FINAL_VISIT_STATUSES:
+                    self._resolve(status)
+            self.error = AssertionError(
+                f"watcher process exited with code {self.process.wait()}"
+            )
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.ready.set()
+            with self.lock:
+                for waiters in self.waiters.values():
+                    for _, future in waiters:
+                        if not future.done():
+                            future.set_exception(self.error)
+                self.waiters.clear()
+
+    def _resolve(self, status: Dict[str, Any]) -> None:
+        status["date"] = datetime.fromisoformat(status["date"])
+        with self.lock:
+            self.final_statuses[status["origin"]].append(status)
+            still_waiting: List[Tuple[Optional[datetime], Future]] = []
+            for since, future in self.waiters.pop(status["origin"], []):
+                if since is None or status["date"] >= since:
+                    future.set_result(status)
+                else:
+                    still_waiting.append((since, future))
+            if still_waiting:
+                self.waiters[status["origin"]] = still_waiting
+
+    def future(self, origin_url: str, since: Optional[datetime] = None) -> Future:
+        """Return a future resolved with the first final status of a visit of
+        origin_url (dated after since, a timezone aware datetime, if given)"""
+        future: Future = Future()
+        with self.lock:
+            for status in self.final_statuses.get(origin_url, []):
+                if since is None or status["date"] >= since:
+                    future.set_result(status)
+                    return future
+            if self.error is not None:
+                future.set_exception(self.error)
+            else:
+                self.waiters[origin_url].append((since, future))
+        return future
+
+    def wait_for(
+        self,
+        origin_urls: Iterable[str],
+        timeout: Optional[float] = 600,
+        since: Optional[datetime] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Wait for a final visit status of each origin in origin_urls
+
+        Return the final visit statuses indexed by origin url, or raise an
+        AssertionError if some visits did not complete before timeout.
+        """
+        futures = {url: self.future(url, since=since) for url in origin_urls}
+        done, not_done = wait(futures.values(), timeout=timeout)
+        if not_done:
+            missing = sorted(url for url, f in futures.items() if f in not_done)
+            raise AssertionError(
+                f"No final visit status received for {', '.join(missing)}"
+            )
+        return {url: f.result() for url, f in futures.items()}
+
+
+# Executed by the python interpreter of a container of the compose session;
+# arguments are the timeout (in seconds) and the consumer groups. Progress is
+# written as JSON lines on stdout, the last one reporting either the time it
+# took each group to get past the barrier, or the lag of the groups which did
+# not.
+JOURNAL_BARRIER_SCRIPT = """
+import json
+import sys
+import time
+
+from confluent_kafka import Consumer, ConsumerGroupTopicPartitions, TopicPartition
+from confluent_kafka.admin import AdminClient
+
+t0 = time.monotonic()
+deadline = t0 + float(sys.argv[1])
+groups = sys.argv[2:]
+config = {"bootstrap.servers": "kafka:9092"}
+admin = AdminClient(config)
+
+
+def committed(group):
+    request = [ConsumerGroupTopicPartitions(group)]
+    result = admin.list_consumer_group_offsets(request)[group].result(timeout=30)
+    # offsets are negative for partitions without committed offset
+    return {(tp.topic, tp.partition): tp.offset for tp in result.topic_partitions}
+
+
+def consumed_topics(group):
+    topics = {topic for topic, _ in committed(group)}
+    description = admin.describe_consumer_groups([group])[group].result(timeout=30)
+    for member in description.members:
+        if member.assignment is not None:
+            topics.update(tp.topic for tp in member.assignment.topic_partitions)
+    return topics
+
+
+# the barrier: the end offsets of the partitions of the topics consumed by
+# each group, when the barrier is set
+consumer = Consumer(dict(config, **{"group.id": "swh.tests.journal-barrier"}))
+metadata = consumer.list_topics(timeout=30).topics
+markers = {}
+for group in groups:
+    topics = consumed_topics(group)
+    while not topics and time.monotonic() < deadline:
+        # the group did not join the cluster yet
+        time.sleep(0.2)
+        topics = consumed_topics(group)
+    if not topics:
+        print(json.dumps({"done": {}, "lags": {group: "unknown group"}}))
+        sys.exit(1)
+    markers[group] = {}
+    for topic in topics:
+        for partition in metadata[topic].partitions:
+            end = consumer.get_watermark_offsets(
+                TopicPartition(topic, partition), timeout=30
+            )[1]
+            if end > 0:
+                markers[group][(topic, partition)] = end
+consumer.close()
+print(
+    json.dumps({"markers": {g: sum(m.values()) for g, m in markers.items()}}),
+    flush=True,
+)
+
+done = {}
+lags = {}
+delay = 0.05
+while True:
+    for group in groups:
+        if group in done:
+            continue
+        offsets = committed(group)
+        lags[group] = {
+            f"{topic}/{partition}": end - max(offsets.get((topic, partition), 0), 0)
+            for (topic, partition), end in markers[group].items()
+            if offsets.get((topic, partition), -1) < end
+        }
+        if not lags[group]:
+            done[group] = round(time.monotonic() - t0, 3)
+            del lags[group]
+    if len(done) == len(groups):
+        print(json.dumps({"done": done}), flush=True)
+        sys.exit(0)
+    if time.monotonic() > deadline:
+        print(json.dumps({"done": done, "lags": lags}), flush=True)
+        sys.exit(1)
+    time.sleep(delay)
+    delay = min(delay * 1.5, 0.5)
+"""
+
+
+class JournalBarrier:
+    """Wait for consumer groups to consume everything published in the journal
+    so far
+
+    When waiting, the end offsets of the partitions of the topics consumed by
+    each consumer group are snapshotted (the barrier), then the committed
+    offsets of the groups are polled (every 50ms at first, backing off to
+    500ms) until they are past the barrier. Unlike waiting for a null lag,
+    this is not fooled by a consumer catching up with a producer that is
+    still writing, nor delayed by messages published after the barrier.
+
+    args:
+        compose_cmd: the docker compose command of the session (see the
+            compose_cmd fixture)
+
+        service: the compose service in which the offsets are polled
+    """
+
+    def __init__(self, compose_cmd: str, service: str = "swh-storage"):
+        self.compose_cmd = compose_cmd
+        self.service = service
+
+    def wait(
+        self, consumer_groups: Iterable[str], timeout: float = 60
+    ) -> Dict[str, float]:
+        """Wait for the consumer groups to get past a barrier set now
+
+        Return the number of seconds it took each consumer group, or raise an
+        AssertionError with the remaining lag of each partition if some did
+        not get past the barrier before timeout."""
+        groups = list(consumer_groups)
+        print(f"Waiting for {', '.join(groups)} to consume the journal")
+        cmd = shlex.split(self.compose_cmd) + [
+            "exec",
+            "-T",
+            self.service,
+            "python3",
+            "-",
+            str(timeout),
+            *groups,
+        ]
+        proc = subprocess.run(
+            cmd, input=JOURNAL_BARRIER_SCRIPT, capture_output=True, text=True
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        result = json.loads(lines[-1]) if lines else {}
+        if proc.returncode != 0 or "lags" in result:
+            raise AssertionError(
+                f"Consumer groups did not get past the journal barrier in "
+                f"{timeout}s: {result.get('lags')}\n{proc.stderr}"
+            )
+        for group, seconds in result["done"].items():
+            print(f"{group} got past the journal barrier in {seconds:.2f}s")
+        return result["done"]
@@ -0,0 +1,294 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class StackCost:
+    """Resources (CPUs and MiB of memory) used by a compose stack"""
+
+    cpus: float = 0.0
+    memory: int = 0
+
+    def __add__(self, other: "StackCost") -> "StackCost":
+        return StackCost(self.cpus + other.cpus, self.memory + other.memory)
+
+    def fits(self, capacity: "StackCost") -> bool:
+        return self.cpus <= capacity.cpus and self.memory <= capacity.memory
+
+    def weight(self, capacity: "StackCost") -> float:
+        """Share of the capacity used by the most constrained resource"""
+        return max(self.cpus / capacity.cpus, self.memory / capacity.memory)
+
+
+# rough estimates of the resources used by a running service, when busy
+SERVICE_COSTS = {
+    "cassandra": StackCost(2, 4096),
+    "cassandra-seed": StackCost(2, 4096),
+    "elasticsearch": StackCost(1, 2048),
+    "swh-graph": StackCost(2, 4096),
+    "kafka": StackCost(1, 1024),
+    "keycloak": StackCost(1, 1024),
+    "grafana": StackCost(0.25, 256),
+    "prometheus": StackCost(0.25, 512),
+    "amqp": StackCost(0.5, 512),
+    "amqp-mirror": StackCost(0.5, 512),
+    "swh-web": StackCost(0.5, 512),
+    "swh-mirror-web": StackCost(0.5, 512),
+    "swh-loader": StackCost(1, 1024),
+    "swh-vault-worker": StackCost(1, 512),
+    "swh-mirror-vault-worker": StackCost(1, 512),
+}
+# postgresql databases (services named *-db)
+DATABASE_COST = StackCost(0.5, 256)
+DEFAULT_SERVICE_COST = StackCost(0.25, 192)
+
+
+def service_cost(service: str) -> StackCost:
+    if service in SERVICE_COSTS:
+        return SERVICE_COSTS[service]
+    if service.endswith("-db"):
+        return DATABASE_COST
+    return DEFAULT_SERVICE_COST
+
+
+def started_services(
+    compose_config: Dict[str, Any], compose_services: Iterable[str]
+) -> Set[str]:
+    """Return the services started by ``docker compose up`` for the given
+    services (all the services if empty) of a compose configuration (as
+    returned by ``docker compose config --format json``): the services and
+    their dependencies"""
+    all_services = compose_config.get("services", {})
+    pending = list(compose_services) or list(all_services)
+    services: Set[str] = set()
+    while pending:
+        service = pending.pop()
+        if service in services or service not in all_services:
+            continue
+        services.add(service)
+        pending.extend(all_services[service].get("depends_on") or {})
+    return services
+
+
+def stack_cost(
+    compose_config: Dict[str, Any], compose_services: Iterable[str]
+) -> StackCost:
+    """Estimate the resources used by a compose stack"""
+    cost = StackCost()
+    for service in started_services(compose_config, compose_services):
+        cost += service_cost(service)
+    return cost
+
+
+def host_capacity(memory_ratio: float = 0.8) -> StackCost:
+    """Resources of the host available to compose stacks: all its cores and
+    memory_ratio of its memory"""
+    memory = 0
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    return StackCost(float(os.cpu_count() or 1), int(memory * memory_ratio))
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def locked_json(path: str) -> Iterator[Dict[str, Any]]:
+    """Load the JSON object stored in path (empty if the file does not exist)
+    under an exclusive lock of a companion lock file, and write it back (even
+    if left unchanged) when done; this makes a file a state shared by several
+    processes"""
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state: Dict[str, Any] = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    state = json.load(f)
+            yield state
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.rename(tmp_path, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class ResourceBudget:
+    """Counting semaphore shared by all the processes of a test session (e.g.
+    pytest-xdist workers), bounding the resources used by the compose stacks
+    running concurrently
+
+    The stacks holding a share of the budget are recorded in a JSON file,
+    updated under an exclusive lock of a companion lock file. The cost of a
+    stack more expensive than the whole budget is capped to the budget, so
+    such a stack still runs (alone). Stacks recorded by a dead process (e.g. a
+    crashed worker) are ignored.
+
+    args:
+        path: the JSON file recording the stacks holding a share of the budget
+
+        capacity: the resources shared by all the stacks
+
+        poll_interval: seconds between two attempts to get a share of the budget
+
+        timeout: default number of seconds after which to give up waiting for
+            a share of the budget
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: StackCost,
+        poll_interval: float = 2.0,
+        timeout: float = 1800,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def _locked_holders(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        with locked_json(self.path) as holders:
+            for name, holder in list(holders.items()):
+                if not pid_alive(holder["pid"]):
+                    del holders[name]
+            yield holders
+
+    def _try_acquire(
+        self, name: str, cost: StackCost
+    ) -> Tuple[bool, StackCost, List[str]]:
+        with self._locked_holders() as holders:
+            used = StackCost()
+            for holder in holders.values():
+                used += StackCost(holder["cpus"], holder["memory"])
+            if not (used + cost).fits(self.capacity):
+                return False, used, sorted(holders)
+            holders[name] = {
+                "cpus": cost.cpus,
+                "memory": cost.memory,
+                "pid": os.getpid(),
+            }
+            return True, used, sorted(holders)
+
+    def acquire(
+        self,
+        name: str,
+        cost: StackCost,
+        timeout: Optional[float] = None,
+        evict: Optional[Callable[[], bool]] = None,
+    ) -> float:
+        """Wait for a share of the budget for the stack name, and return the
+        number of seconds spent waiting
+
+        args:
+            timeout: seconds after which to give up (raising an
+                AssertionError), the timeout of the budget if None
+
+            evict: called before waiting, to release resources held by the
+                calling process which are not needed anymore (e.g. stop an
+                idle compose stack); returns whether it did, in which case
+                the budget is checked again without waiting
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if not cost.fits(self.capacity):
+            print(
+                f"{name} needs more than the whole budget ({cost.cpus:g} CPUs and "
+                f"{cost.memory} MiB), it will only run alone"
+            )
+            cost = StackCost(
+                min(cost.cpus, self.capacity.cpus),
+                min(cost.memory, self.capacity.memory),
+            )
+        t0 = time.monotonic()
+        waiting = False
+        while True:
+            acquired, used, holders = self._try_acquire(name, cost)
+            if acquired:
+                waited = time.monotonic() - t0
+                if waiting:
+                    print(f"Got resources for {name} after {waited:.2f}s")
+                return waited
+            if evict is not None and evict():
+                continue
+            if not waiting:
+                waiting = True
+                print(
+                    f"Waiting for resources to start {name} (needs {cost.cpus:g} "
+                    f"CPUs and {cost.memory} MiB, {used.cpus:g} CPUs and "
+                    f"{used.memory} MiB used out of {self.capacity.cpus:g} CPUs "
+                    f"and {self.capacity.memory} MiB)"
+                )
+            if time.monotonic() - t0 > timeout:
+                raise AssertionError(
+                    f"Timed out after {timeout:g}s waiting for resources to start "
+                    f"{name}: {used.cpus:g} CPUs and {used.memory} MiB out of "
+                    f"{self.capacity.cpus:g} CPUs and {self.capacity.memory} MiB "
+                    f"are held by {', '.join(holders)} (see the "
+                    "--stack-budget-cpus and --stack-budget-memory options)"
+                )
+            time.sleep(self.poll_interval)
+
+    def release(self, name: str) -> None:
+        with self._locked_holders() as holders:
+            holders.pop(name, None)
+
+
+def pack_modules(costs: Dict[str, float]) -> List[str]:
+    """Order test modules so that modules executed concurrently mix heavy and
+    light stacks: the heaviest module first, then the lightest one, then the
+    second heaviest one, and so on
+
+    Starting heavy modules first also avoids ending the session with a heavy
+    module running alone while other workers are idle.
+
+    args:
+        costs: test module -> weight of its compose stack (see
+            :meth:`StackCost.weight`)
+    """
+    modules = sorted(costs, key=lambda module: (-costs[module], module))
+    ordered = []
+    while modules:
+        ordered.append(modules.pop(0))
+        if modules:
+            ordered.append(modules.pop())
+    return ordered
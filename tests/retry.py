@@ -0,0 +1,283 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import asyncio
+import contextlib
+import dataclasses
+import inspect
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Union,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class RetrySchedule:
+    """Delays between the attempts of an operation: they start small (so fast
+    operations are not slowed down) and grow exponentially up to max_delay
+
+    args:
+        initial_delay: seconds to wait after the first attempt
+
+        factor: growth factor of the delay after each attempt
+
+        max_delay: maximum seconds to wait between two attempts
+
+        jitter: randomly spread each delay by up to this fraction of it, so
+            concurrent pollers do not hit a service at the same time
+    """
+
+    initial_delay: float = 0.1
+    factor: float = 1.5
+    max_delay: float = 1.0
+    jitter: float = 0.1
+
+    def delays(self) -> Iterator[float]:
+        delay = self.initial_delay
+        while True:
+            spread = delay * self.jitter
+            yield max(delay + random.uniform(-spread, spread), 0.0)
+            delay = min(delay * self.factor, self.max_delay)
+
+
+DEFAULT_SCHEDULE = RetrySchedule()
+
+
+@dataclasses.dataclass
+class WaitRecord:
+    """Outcome of a call to retry_until_success"""
+
+    # where retry_until_success has been called from (file:line)
+    wait_point: str
+    error_message: str
+    test: Optional[str]
+    attempts: int
+    # total time of the call, and time spent sleeping between attempts
+    seconds: float
+    sleep_seconds: float
+    succeeded: bool
+
+
+# upper bounds (in seconds) of the buckets of the histograms of wait times
+HISTOGRAM_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, math.inf]
+
+
+class RetryRecorder:
+    """Record the outcome of every wait done by retry_until_success, attributed
+    to the test being executed (see the pytest_runtest_protocol hook in
+    conftest.py), unless the waiting thread is attributed to something else
+    (see :meth:`attributed_to`)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records: List[WaitRecord] = []
+        self.current_test: Optional[str] = None
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def attributed_to(self, name: str) -> Iterator[None]:
+        """Attribute the waits of the current thread to name instead of the
+        test being executed, e.g. for background teardowns"""
+        self.local.attribution = name
+        try:
+            yield
+        finally:
+            del self.local.attribution
+
+    def attribution(self) -> Optional[str]:
+        return getattr(self.local, "attribution", self.current_test)
+
+    def add(self, record: WaitRecord) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def report(self) -> Dict[str, Any]:
+        """Return the waits of each test, and the attempts and latency
+        histogram of each wait point"""
+        with self.lock:
+            records = list(self.records)
+        tests: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        wait_points: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            tests[record.test or "<session>"].append(dataclasses.asdict(record))
+            stats = wait_points.setdefault(
+                record.wait_point,
+                {
+                    "error_message": record.error_message,
+                    "calls": 0,
+                    "failures": 0,
+                    "attempts": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "histogram": {str(b): 0 for b in HISTOGRAM_BUCKETS},
+                },
+            )
+            stats["calls"] += 1
+            stats["failures"] += not record.succeeded
+            stats["attempts"] += record.attempts
+            stats["seconds"] = round(stats["seconds"] + record.seconds, 3)
+            stats["max_seconds"] = max(stats["max_seconds"], record.seconds)
+            bucket = next(b for b in HISTOGRAM_BUCKETS if record.seconds <= b)
+            stats["histogram"][str(bucket)] += 1
+        return {
+            "tests": dict(tests),
+            "wait_points": dict(
+                sorted(wait_points.items(), key=lambda item: -item[1]["seconds"])
+            ),
+        }
+
+    def text_report(self, top: int = 10) -> str:
+        wait_points = list(self.report()["wait_points"].items())[:top]
+        lines = ["Wait points taking the most time:"]
+        for wait_point, stats in wait_points:
+            lines.append(
+                f"  {wait_point:<40} {stats['seconds']:8.2f}s in {stats['calls']} "
+                f"calls ({stats['attempts']} attempts, max "
+                f"{stats['max_seconds']:.2f}s)"
+            )
+        return "\n".join(lines)
+
+
+RECORDER = RetryRecorder()
+
+
+def _caller_location(depth: int = 2) -> str:
+    frame = sys._getframe(depth)
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+
+
+class _Attempts:
+    """Attempt accounting shared by the sync and async variants"""
+
+    def __init__(
+        self,
+        error_message: str,
+        timeout: Optional[float],
+        max_attempts: Optional[int],
+        schedule: RetrySchedule,
+        wait_point: str,
+    ):
+        self.error_message = error_message
+        self.max_attempts = max_attempts
+        self.wait_point = wait_point
+        self.t0 = time.monotonic()
+        self.deadline = self.t0 + timeout if timeout is not None else math.inf
+        self.delays = schedule.delays()
+        self.failed_attempts = 0
+        self.sleep_seconds = 0.0
+
+    def next_delay(self) -> Optional[float]:
+        """Return the delay before the next attempt (the previous one having
+        failed), None if there is none"""
+        self.failed_attempts += 1
+        if self.max_attempts is not None and self.failed_attempts >= self.max_attempts:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        delay = min(next(self.delays), remaining)
+        self.sleep_seconds += delay
+        return delay
+
+    def record(self, succeeded: bool) -> None:
+        RECORDER.add(
+            WaitRecord(
+                wait_point=self.wait_point,
+                error_message=self.error_message,
+                test=RECORDER.attribution(),
+                attempts=self.failed_attempts + succeeded,
+                seconds=round(time.monotonic() - self.t0, 3),
+                sleep_seconds=round(self.sleep_seconds, 3),
+                succeeded=succeeded,
+            )
+        )
+
+    def fail(self) -> NoReturn:
+        self.record(succeeded=False)
+        raise AssertionError(
+            f"{self.error_message} ({self.failed_attempts} attempts in "
+            f"{time.monotonic() - self.t0:.1f}s)"
+        )
+
+
+def retry_until_success(
+    operation: Callable[..., Any],
+    error_message: str = "Operation did not succeed after multiple retries",
+    timeout: Optional[float] = 180,
+    max_attempts: Optional[int] = None,
+    schedule: RetrySchedule = DEFAULT_SCHEDULE,
+) -> Any:
+    """Call operation until it returns a true value, and return that value
+
+    args:
+        operation: the callable to retry
+
+        error_message: message of the AssertionError raised when operation
+            did not succeed in time
+
+        timeout: wall-clock seconds after which to give up (the last attempt
+            happens at the deadline at the latest); None to only limit the
+            number of attempts. When converting a number of attempts with a
+            fixed 1s delay, account for the duration of the operation too
+            (about N × (duration + 1s)).
+
+        max_attempts: maximum number of attempts, None for no limit
+
+        schedule: the delays between attempts
+    """
+    attempts = _Attempts(
+        error_message, timeout, max_attempts, schedule, _caller_location()
+    )
+    while True:
+        ret = operation()
+        if ret:
+            attempts.record(succeeded=True)
+            return ret
+        delay = attempts.next_delay()
+        if delay is None:
+            attempts.fail()
+        time.sleep(delay)
+
+
+async def async_retry_until_success(
+    operation: Callable[..., Union[Any, Awaitable[Any]]],
+    error_message: str = "Operation did not succeed after multiple retries",
+    timeout: Optional[float] = 180,
+    max_attempts: Optional[int] = None,
+    schedule: RetrySchedule = DEFAULT_SCHEDULE,
+) -> Any:
+    """Async variant of retry_until_success: operation may be a coroutine
+    function, and the event loop is not blocked between attempts"""
+    attempts = _Attempts(
+        error_message, timeout, max_attempts, schedule, _caller_location()
+    )
+    while True:
+        ret = operation()
+        if inspect.isawaitable(ret):
+            ret = await ret
+        if ret:
+            attempts.record(succeeded=True)
+            return ret
+        delay = attempts.next_delay()
+        if delay is None:
+            attempts.fail()
+        await asyncio.sleep(delay)
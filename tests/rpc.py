@@ -0,0 +1,58 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import base64
+from datetime import datetime
+from typing import Any, Optional
+from urllib.parse import urljoin
+
+import requests
+
+
+def decode_rpc_data(data: Any) -> Any:
+    """Decode a JSON document returned by a swh RPC server
+
+    Values encoded by ``swh.core.api.serializers.SWHJSONEncoder`` as
+    ``{"swhtype": ..., "d": ...}`` dicts are unwrapped; datetimes and bytes
+    are converted back to :class:`datetime.datetime` and :class:`bytes`
+    objects, model objects (e.g. scheduler tasks or archive objects) and paged
+    results are returned as plain dicts.
+    """
+    if isinstance(data, list):
+        return [decode_rpc_data(v) for v in data]
+    if isinstance(data, dict):
+        if set(data) == {"swhtype", "d"}:
+            if data["swhtype"] == "datetime":
+                return datetime.fromisoformat(data["d"])
+            if data["swhtype"] == "bytes":
+                return base64.b85decode(data["d"])
+            return decode_rpc_data(data["d"])
+        return {k: decode_rpc_data(v) for k, v in data.items()}
+    return data
+
+
+class RpcClient:
+    """Minimal client of a swh RPC API
+
+    Only JSON is used for requests and responses, so there is no need for
+    the swh package of the service (nor msgpack) to be installed on the host
+    running the tests.
+    """
+
+    def __init__(self, url: str, session: Optional[requests.Session] = None):
+        if not url.endswith("/"):
+            url += "/"
+        self.url = url
+        self.session = session if session is not None else requests.Session()
+
+    def call(self, endpoint: str, **kwargs) -> Any:
+        url = urljoin(self.url, endpoint)
+        resp = self.session.post(
+            url,
+            json=kwargs,
+            headers={"Accept": "application/json"},
+        )
+        assert resp.ok, f"RPC call {url} failed: {resp.text}"
+        return decode_rpc_data(resp.json())
@@ -0,0 +1,147 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import json
+import logging
+import shlex
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+from .rpc import RpcClient
+
+logger = logging.getLogger(__name__)
+
+# task run statuses, see swh.scheduler.model.TaskRunStatus
+PENDING_TASK_RUN_STATUSES = ("scheduled", "started")
+SUCCESSFUL_TASK_RUN_STATUSES = ("eventful",)
+
+
+class SchedulerClient(RpcClient):
+    """Minimal client of the swh-scheduler RPC API"""
+
+    def get_task_runs(self, task_ids: List[int]) -> List[Dict[str, Any]]:
+        return self.call("task_run/get", task_ids=task_ids)
+
+
+def create_tasks(
+    compose_cmd: str,
+    tasks: List[Dict[str, Any]],
+    policy: str = "recurring",
+    service: str = "swh-scheduler",
+) -> List[int]:
+    """Create scheduler tasks in a single scheduler transaction, and return
+    their ids (in the order of tasks)
+
+    Tasks are given as dicts with a type, args and kwargs (and optionally a
+    policy and a priority); they are passed as JSON lines to the
+    services/swh-scheduler/create_tasks.py script, executed in the scheduler
+    container.
+    """
+    if not tasks:
+        return []
+    cmd = shlex.split(compose_cmd) + [
+        "exec",
+        "-T",
+        service,
+        "python3",
+        "/srv/softwareheritage/create_tasks.py",
+        "--policy",
+        policy,
+    ]
+    proc = subprocess.run(
+        cmd,
+        input="".join(json.dumps(task) + "\n" for task in tasks),
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, f"Failed to create tasks: {proc.stderr}"
+    task_ids = json.loads(proc.stdout.splitlines()[-1])
+    assert len(task_ids) == len(tasks), f"Unexpected task ids {task_ids}"
+    return task_ids
+
+
+class TaskStatusTracker:
+    """Track the completion of a set of scheduler tasks
+
+    Each call to :meth:`check` retrieves the runs of all the still pending
+    tasks in a single scheduler RPC call, and reports the completion time of
+    the tasks whose run ended. It can be used as the operation of
+    :func:`tests.retry.retry_until_success`, or called once completion is
+    known by other means (e.g. from the journal, see the origins fixture) to
+    check the task runs and report their timings.
+
+    args:
+        scheduler: the scheduler RPC client
+
+        task_ids: the tasks to track, indexed by a label (typically the url
+            of the origin a loading task has been created for)
+
+        on_failure: an optional callable returning extra information (e.g.
+            worker logs) to add to the error message when a task fails
+
+        created: when the tasks have been created (a timezone aware datetime);
+            completion times are computed from the end of the task runs if
+            given, from the creation of the tracker otherwise
+    """
+
+    def __init__(
+        self,
+        scheduler: SchedulerClient,
+        task_ids: Mapping[str, int],
+        on_failure=None,
+        created: Optional[datetime] = None,
+    ):
+        self.scheduler = scheduler
+        self.labels = {int(task_id): label for label, task_id in task_ids.items()}
+        self.pending = set(self.labels)
+        self.on_failure = on_failure
+        self.created = created
+        self.t0 = time.monotonic()
+        # label -> seconds between the creation of the task (or of the tracker)
+        # and its completion
+        self.completion_times: Dict[str, float] = {}
+        # label -> duration of the task run as reported by the scheduler
+        self.run_durations: Dict[str, Optional[float]] = {}
+
+    def check(self) -> bool:
+        """Retrieve the status of pending tasks; return True when all are done"""
+        if not self.pending:
+            return True
+        runs = self.scheduler.get_task_runs(sorted(self.pending))
+        latest_runs: Dict[int, Dict[str, Any]] = {}
+        for run in runs:
+            task_id = run["task"]
+            if task_id not in latest_runs or run["id"] > latest_runs[task_id]["id"]:
+                latest_runs[task_id] = run
+
+        for task_id, run in latest_runs.items():
+            status = run["status"]
+            if status in PENDING_TASK_RUN_STATUSES:
+                continue
+            label = self.labels[task_id]
+            if status not in SUCCESSFUL_TASK_RUN_STATUSES:
+                message = f"Execution of task {task_id} ({label}) failed: {run}"
+                if self.on_failure is not None:
+                    message += f"\n{self.on_failure()}"
+                raise AssertionError(message)
+            self.pending.discard(task_id)
+            if self.created is not None and run["ended"]:
+                completion_time = (run["ended"] - self.created).total_seconds()
+            else:
+                completion_time = time.monotonic() - self.t0
+            self.completion_times[label] = completion_time
+            if run["started"] and run["ended"]:
+                duration = (run["ended"] - run["started"]).total_seconds()
+            else:
+                duration = None
+            self.run_durations[label] = duration
+            print(
+                f"Task {task_id} for {label} is done "
+                f"(took {completion_time:.2f}s"
+                + (f", ran for {duration:.2f}s)" if duration is not None else ")")
+            )
+        return not self.pending
@@ -0,0 +1,202 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# version of the layout of the snapshots, part of the snapshot key; bumped when
+# the volumes or their mount points change (e.g. database volumes mounted on
+# PGDATA instead of its parent directory)
+SNAPSHOT_FORMAT = 2
+
+# compose volumes holding the archive, and the service using each of them
+# (database volumes must be mounted on the PGDATA directory of postgres)
+SNAPSHOT_VOLUMES = {
+    # the scheduler database holds the loading tasks of the ingested origins
+    "scheduler-data": "swh-scheduler-db",
+    "storage-data": "swh-storage-db",
+    "objstorage-data": "swh-objstorage",
+    "kafka-data": "kafka",
+}
+
+# kafka partitions of consumer offsets are not part of the snapshot, so journal
+# clients of a restored stack consume the journal from the beginning and
+# rebuild their own state (search index, counters...)
+KAFKA_EXCLUDED_PATHS = ["./kraft-combined-logs/__consumer_offsets-*"]
+
+
+def snapshot_key(
+    origin_urls: Iterable[Tuple[str, Union[str, Iterable[str]]]],
+    compose_files: Iterable[str],
+    image_id: str,
+) -> str:
+    """Compute the key of the archive snapshot for the given origins
+
+    Compose files are part of the key since they define which backends are
+    used to store the archive (e.g. Cassandra instead of PostgreSQL), and so
+    are the snapshotted volumes and the layout of the snapshots.
+    """
+    origins = sorted(
+        (otype, urls if isinstance(urls, str) else list(urls))
+        for otype, urls in origin_urls
+    )
+    data = {
+        "origins": origins,
+        "compose_files": list(compose_files),
+        "image": image_id,
+        "volumes": sorted(SNAPSHOT_VOLUMES),
+        "format": SNAPSHOT_FORMAT,
+    }
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+class ArchiveSnapshot:
+    """Snapshot of the docker volumes of a compose session holding the archive
+
+    A snapshot is a directory with one tar file per volume listed in
+    ``SNAPSHOT_VOLUMES`` and an ``origins.json`` file listing the ingested
+    origins. Volumes are archived and extracted by a short-lived container
+    using the swh/stack image, so no specific tooling is needed on the host.
+
+    args:
+        docker_host: the testinfra host on which docker commands are executed
+
+        path: the directory of the snapshot
+
+        image: the docker image used to archive and extract volumes
+    """
+
+    def __init__(self, docker_host, path: str, image: str):
+        self.docker_host = docker_host
+        self.path = os.path.abspath(path)
+        self.image = image
+
+    @property
+    def origins_file(self) -> str:
+        return os.path.join(self.path, "origins.json")
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.origins_file)
+
+    def origins(self) -> List[Tuple[str, str]]:
+        with open(self.origins_file) as f:
+            return [(otype, url) for otype, url in json.load(f)]
+
+    def _run_tar(self, project_name: str, volume: str, tar_args: str) -> None:
+        self.docker_host.check_output(
+            "docker run --rm --user root --entrypoint tar "
+            f"-v {project_name}_{volume}:/volume "
+            f"-v {self.path}:/snapshot "
+            f"{self.image} -C /volume {tar_args}"
+        )
+
+    def restore(self, project_name: str) -> None:
+        """Populate the volumes of a not yet started compose project"""
+        t0 = time.monotonic()
+        for volume in SNAPSHOT_VOLUMES:
+            # create the volume the way compose would do, so compose uses it
+            # without complaining
+            self.docker_host.check_output(
+                "docker volume create "
+                f"--label com.docker.compose.project={project_name} "
+                f"--label com.docker.compose.volume={volume} "
+                f"{project_name}_{volume}"
+            )
+            self._run_tar(project_name, volume, f"-xf /snapshot/{volume}.tar")
+        print(f"Restored archive snapshot {self.path} in {time.monotonic()-t0:.2f}s")
+
+    def take(
+        self,
+        project_name: str,
+        compose_cmd: str,
+        origins: List[Tuple[str, str]],
+        compose_services: Optional[List[str]] = None,
+    ) -> None:
+        """Archive the volumes of a running compose project
+
+        Services using these volumes are stopped while their volume is
+        archived, then the whole compose project is reconverged.
+        """
+        t0 = time.monotonic()
+        services = list(SNAPSHOT_VOLUMES.values())
+        # several pytest-xdist workers may take the same snapshot concurrently
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        tmp_snapshot = ArchiveSnapshot(self.docker_host, tmp_path, self.image)
+        self.docker_host.check_output(f"{compose_cmd} stop {' '.join(services)}")
+        try:
+            for volume in SNAPSHOT_VOLUMES:
+                excludes = "".join(
+                    f" --exclude '{path}'"
+                    for path in (KAFKA_EXCLUDED_PATHS if volume == "kafka-data" else [])
+                )
+                tmp_snapshot._run_tar(
+                    project_name, volume, f"-cf /snapshot/{volume}.tar{excludes} ."
+                )
+        finally:
+            self.docker_host.check_output(
+                f"{compose_cmd} up --wait -d {' '.join(compose_services or [])}"
+            )
+        # origins.json is written last and the directory renamed, so a partial
+        # snapshot is never used
+        with open(tmp_snapshot.origins_file, "w") as f:
+            json.dump(origins, f)
+        try:
+            os.rename(tmp_path, self.path)
+        except OSError:
+            if not self.exists():
+                raise
+            # taken meanwhile by another worker
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        print(f"Took archive snapshot {self.path} in {time.monotonic()-t0:.2f}s")
+
+
+class ArchiveSnapshots:
+    """Directory of archive snapshots, indexed by snapshot key
+
+    args:
+        docker_host: the testinfra host on which docker commands are executed
+
+        path: the directory in which snapshots are stored
+
+        image: the docker image used to archive and extract volumes; its id
+            is part of the snapshot key
+    """
+
+    def __init__(self, docker_host, path: str, image: str):
+        self.docker_host = docker_host
+        self.path = path
+        self.image = image
+
+    def get(
+        self,
+        origin_urls: Iterable[Tuple[str, Union[str, Iterable[str]]]],
+        compose_files: List[str],
+    ) -> Optional[ArchiveSnapshot]:
+        """Return the (possibly not existing yet) snapshot of the archive for the
+        given origins, or None if the compose files do not define the services
+        using the archive volumes"""
+        compose_file_cmd = "".join(f" -f {fname} " for fname in compose_files)
+        services = self.docker_host.check_output(
+            f"docker compose {compose_file_cmd} config --services"
+        ).split()
+        if not set(SNAPSHOT_VOLUMES.values()).issubset(services):
+            return None
+        cmd = self.docker_host.run(
+            f"docker image inspect --format '{{{{.Id}}}}' {self.image}"
+        )
+        image_id = cmd.stdout.strip() if cmd.succeeded else self.image
+        key = snapshot_key(origin_urls, compose_files, image_id)
+        return ArchiveSnapshot(
+            self.docker_host, os.path.join(self.path, key), self.image
+        )
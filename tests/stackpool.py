@@ -0,0 +1,335 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+"""Pool of pre-booted compose stacks
+
+The ``serve`` command keeps a number of booted (hence migrated) compose
+projects running for each flavor of stack described in the configuration file
+(see conf/stackpool.yml). A booted stack is leased in a couple of seconds,
+either by the test suite (see the ``--stack-pool`` option of pytest) or by
+hand (``lease`` command); once given back, it is stopped (along with its
+volumes) and replaced by a fresh one in background.
+
+Usage, from the root of the repository::
+
+    python -m tests.stackpool serve --size 2
+    python -m tests.stackpool lease search
+    python -m tests.stackpool release <project name>
+    python -m tests.stackpool status
+"""
+
+import argparse
+import dataclasses
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from uuid import uuid4 as uuid
+
+import testinfra
+import yaml
+
+from .resources import locked_json, pid_alive
+from .stacks import (
+    compose_images,
+    image_digests,
+    stack_fingerprint,
+    stop_compose_session,
+)
+
+DEFAULT_POOL_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "swh-docker-stackpool",
+)
+DEFAULT_CONFIG = "conf/stackpool.yml"
+
+# states of the stacks of the pool
+BOOTING = "booting"
+READY = "ready"
+LEASED = "leased"
+RETURNED = "returned"
+RECYCLING = "recycling"
+
+
+@dataclasses.dataclass
+class StackFlavor:
+    """A kind of stack kept in the pool; compose files and services must be
+    the ones of the test modules which should use it"""
+
+    name: str
+    compose_files: List[str]
+    compose_services: List[str] = dataclasses.field(default_factory=list)
+
+
+def load_flavors(config_path: str) -> List[StackFlavor]:
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    return [
+        StackFlavor(name=name, **flavor) for name, flavor in config["flavors"].items()
+    ]
+
+
+def compose_command(project_name: str, compose_files: List[str]) -> str:
+    compose_file_cmd = "".join(f" -f {fname} " for fname in compose_files)
+    return f"docker compose -p {project_name} {compose_file_cmd} "
+
+
+class StackPool:
+    """The stacks of a pool, recorded in a JSON file of the pool directory and
+    indexed by compose project name; used by the daemon and its clients
+
+    args:
+        pool_dir: the directory of the pool
+    """
+
+    def __init__(self, pool_dir: str = DEFAULT_POOL_DIR):
+        os.makedirs(pool_dir, exist_ok=True)
+        self.path = os.path.join(pool_dir, "pool.json")
+
+    def stacks(self) -> Dict[str, Dict[str, Any]]:
+        with locked_json(self.path) as stacks:
+            return dict(stacks)
+
+    def lease(
+        self,
+        fingerprint: Optional[str] = None,
+        flavor: Optional[str] = None,
+        pid: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Lease a ready stack with the given fingerprint or flavor
+
+        The stack is given back to the pool when the process pid dies, unless
+        pid is None (the stack must then be explicitly given back).
+
+        Return the record of the leased stack, None if no stack is ready."""
+        with locked_json(self.path) as stacks:
+            for project_name, stack in sorted(stacks.items()):
+                if stack["state"] != READY:
+                    continue
+                if fingerprint is not None and stack["fingerprint"] != fingerprint:
+                    continue
+                if flavor is not None and stack["flavor"] != flavor:
+                    continue
+                stack.update(state=LEASED, pid=pid, updated=time.time())
+                return dict(stack, project_name=project_name)
+        return None
+
+    def give_back(self, project_name: str) -> None:
+        with locked_json(self.path) as stacks:
+            if project_name in stacks:
+                stacks[project_name].update(
+                    state=RETURNED, pid=None, updated=time.time()
+                )
+
+    def update(self, project_name: str, **fields) -> None:
+        with locked_json(self.path) as stacks:
+            stacks.setdefault(project_name, {}).update(fields, updated=time.time())
+
+    def remove(self, project_name: str) -> None:
+        with locked_json(self.path) as stacks:
+            stacks.pop(project_name, None)
+
+
+class StackPoolDaemon:
+    """Keep size ready (or booting) stacks of each flavor in the pool, and
+    recycle the stacks given back
+
+    args:
+        pool: the stack pool
+
+        flavors: the flavors of stacks to keep in the pool
+
+        size: number of stacks of each flavor
+
+        max_workers: maximum number of stacks being booted or stopped
+            concurrently
+
+        poll_interval: seconds between two checks of the state of the pool
+    """
+
+    def __init__(
+        self,
+        pool: StackPool,
+        flavors: List[StackFlavor],
+        size: int = 1,
+        max_workers: int = 2,
+        poll_interval: float = 2.0,
+    ):
+        self.pool = pool
+        self.flavors = flavors
+        self.size = size
+        self.poll_interval = poll_interval
+        self.docker_host = testinfra.get_host("local://")
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="stackpool"
+        )
+        self.stopped = False
+
+    def fingerprint(self, flavor: StackFlavor) -> str:
+        """Fingerprint of the stacks of a flavor, as computed by the test suite
+        (see the compose_fingerprint fixture)"""
+        return stack_fingerprint(
+            flavor.compose_files,
+            flavor.compose_services,
+            image_digests(
+                self.docker_host, compose_images(self.docker_host, flavor.compose_files)
+            ),
+        )
+
+    def _boot(self, project_name: str, flavor: StackFlavor) -> None:
+        compose_cmd = compose_command(project_name, flavor.compose_files)
+        t0 = time.monotonic()
+        try:
+            self.docker_host.check_output(
+                f"{compose_cmd} up --wait -d {' '.join(flavor.compose_services)}"
+            )
+        except Exception as exc:
+            print(f"Failed to boot {project_name}: {exc}")
+            self.pool.update(project_name, state=RECYCLING)
+            self._recycle(project_name, compose_cmd)
+            return
+        self.pool.update(project_name, state=READY)
+        print(f"Booted {project_name} in {time.monotonic()-t0:.2f}s", flush=True)
+
+    def _recycle(self, project_name: str, compose_cmd: str) -> None:
+        try:
+            stop_compose_session(self.docker_host, project_name, compose_cmd)
+        finally:
+            self.pool.remove(project_name)
+
+    def run_once(self, fingerprints: Dict[str, str]) -> None:
+        stacks = self.pool.stacks()
+        for project_name, stack in stacks.items():
+            if (
+                stack["state"] == LEASED
+                and stack.get("pid") is not None
+                and not pid_alive(stack["pid"])
+            ):
+                # leased by a test session which did not give it back
+                self.pool.give_back(project_name)
+                stack["state"] = RETURNED
+            if stack["state"] == RETURNED:
+                print(f"Recycling {project_name}", flush=True)
+                self.pool.update(project_name, state=RECYCLING)
+                stack["state"] = RECYCLING
+                self.executor.submit(
+                    self._recycle,
+                    project_name,
+                    compose_command(project_name, stack["compose_files"]),
+                )
+        for flavor in self.flavors:
+            available = sum(
+                1
+                for stack in stacks.values()
+                if stack["flavor"] == flavor.name and stack["state"] in (BOOTING, READY)
+            )
+            for _ in range(self.size - available):
+                project_name = f"swh_pool_{flavor.name}_{uuid().hex[:12]}"
+                print(f"Booting {project_name}", flush=True)
+                self.pool.update(
+                    project_name,
+                    state=BOOTING,
+                    flavor=flavor.name,
+                    fingerprint=fingerprints[flavor.name],
+                    compose_files=flavor.compose_files,
+                    compose_services=flavor.compose_services,
+                    pid=None,
+                )
+                self.executor.submit(self._boot, project_name, flavor)
+
+    def serve(self) -> None:
+        fingerprints = {}
+        for flavor in self.flavors:
+            self.docker_host.check_output(
+                f"{compose_command('swh_pool', flavor.compose_files)} "
+                "pull --ignore-pull-failures"
+            )
+            fingerprints[flavor.name] = self.fingerprint(flavor)
+
+        def stop(signum, frame):
+            self.stopped = True
+
+        signal.signal(signal.SIGTERM, stop)
+        # stacks left booting or being stopped by a previous daemon
+        for project_name, stack in self.pool.stacks().items():
+            if stack["state"] in (BOOTING, RECYCLING):
+                self.executor.submit(
+                    self._recycle,
+                    project_name,
+                    compose_command(project_name, stack["compose_files"]),
+                )
+        try:
+            while not self.stopped:
+                self.run_once(fingerprints)
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("Stopping the stacks of the pool which are not leased...")
+            self.executor.shutdown(wait=True)
+            self.stop_all(include_leased=False)
+
+    def stop_all(self, include_leased: bool = False) -> None:
+        for project_name, stack in self.pool.stacks().items():
+            if stack["state"] == LEASED and not include_leased:
+                continue
+            self._recycle(
+                project_name, compose_command(project_name, stack["compose_files"])
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.stackpool", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--pool-dir", default=DEFAULT_POOL_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="keep booted stacks in the pool")
+    serve.add_argument("--config", default=DEFAULT_CONFIG)
+    serve.add_argument("--size", type=int, default=1, help="stacks per flavor")
+    serve.add_argument("--max-workers", type=int, default=2)
+    serve.add_argument("flavors", nargs="*", help="flavors (default: all)")
+    lease = commands.add_parser("lease", help="lease a ready stack")
+    lease.add_argument("flavor")
+    release = commands.add_parser("release", help="give a leased stack back")
+    release.add_argument("project_name")
+    commands.add_parser("status", help="list the stacks of the pool")
+    stop = commands.add_parser("stop", help="stop all the stacks of the pool")
+    stop.add_argument("--config", default=DEFAULT_CONFIG)
+    args = parser.parse_args(argv)
+
+    pool = StackPool(args.pool_dir)
+    if args.command == "serve":
+        flavors = [
+            flavor
+            for flavor in load_flavors(args.config)
+            if not args.flavors or flavor.name in args.flavors
+        ]
+        StackPoolDaemon(
+            pool, flavors, size=args.size, max_workers=args.max_workers
+        ).serve()
+    elif args.command == "lease":
+        stack = pool.lease(flavor=args.flavor)
+        if stack is None:
+            print(f"No {args.flavor} stack is ready", file=sys.stderr)
+            return 1
+        print(
+            f"export COMPOSE_PROJECT_NAME={stack['project_name']} "
+            f"COMPOSE_FILE={':'.join(stack['compose_files'])}"
+        )
+    elif args.command == "release":
+        pool.give_back(args.project_name)
+    elif args.command == "status":
+        for project_name, stack in sorted(pool.stacks().items()):
+            print(f"{project_name:<40} {stack['flavor']:<10} {stack['state']}")
+    elif args.command == "stop":
+        StackPoolDaemon(pool, load_flavors(args.config)).stop_all(include_leased=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import uuid4 as uuid
+
+from .retry import RECORDER as RETRY_RECORDER
+from .retry import retry_until_success
+from .snapshots import ArchiveSnapshot
+
+if TYPE_CHECKING:
+    from .stackpool import StackPool
+
+logger = logging.getLogger(__name__)
+
+
+def compose_images(docker_host, compose_files: Iterable[str]) -> List[str]:
+    """Return the sorted list of the docker images used by compose files"""
+    compose_file_cmd = "".join(f" -f {fname} " for fname in compose_files)
+    images = docker_host.check_output(
+        f"docker compose {compose_file_cmd} config --images"
+    )
+    return sorted(set(images.split()))
+
+
+def image_digests(docker_host, images: Iterable[str]) -> Dict[str, str]:
+    """Return the id of each local docker image (empty if not pulled yet)"""
+    digests = {}
+    for image in images:
+        cmd = docker_host.run(f"docker image inspect --format '{{{{.Id}}}}' {image}")
+        digests[image] = cmd.stdout.strip() if cmd.succeeded else ""
+    return digests
+
+
+def stack_fingerprint(
+    compose_files: Iterable[str],
+    compose_services: Iterable[str],
+    image_digests: Dict[str, str],
+) -> str:
+    """Compute a fingerprint identifying a compose stack
+
+    Two test modules with the same compose files, the same services and the
+    same docker images get the same fingerprint, so they can be executed
+    against the same running compose project.
+    """
+    data = {
+        "compose_files": list(compose_files),
+        "compose_services": sorted(compose_services),
+        "images": image_digests,
+    }
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def stop_compose_session(docker_host, project_name, compose_cmd):
+    print(f"\nStopping the compose session {project_name}...", end=" ", flush=True)
+    # first kill all the containers (brutal but much faster than a proper shutdown)
+    containers = docker_host.check_output(f"{compose_cmd} ps -q").replace("\n", " ")
+    if containers:
+        try:
+            docker_host.check_output(f"docker kill {containers}")
+        except AssertionError:
+            # may happen if a container is killed as a result of another one
+            # being shut down...
+            pass
+        # and gently stop the cluster
+        docker_host.check_output(f"{compose_cmd} down --volumes --remove-orphans")
+        print("OK")
+        retry_until_success(
+            lambda: not docker_host.check_output(f"{compose_cmd} ps -q"),
+            error_message="Failed to shut compose down",
+            timeout=45,
+        )
+        print("... All the services are stopped")
+
+
+@dataclasses.dataclass
+class ComposeStack:
+    fingerprint: str
+    project_name: str
+    # set once the stack has been successfully started
+    booted: bool = False
+    in_use: bool = False
+    last_used: float = 0.0
+    # set once the compose project has been (at least partially) started
+    compose_cmd: Optional[str] = None
+    # (origin type, origin url) already ingested in this stack
+    loaded_origins: Set[Tuple[str, str]] = dataclasses.field(default_factory=set)
+    # snapshot of the archive for the origins of the test module which booted
+    # the stack, and whether it has been restored when booting the stack
+    snapshot: Optional[ArchiveSnapshot] = None
+    restored: bool = False
+    # set if the stack has been leased from a stack pool (see stackpool.py)
+    pooled: bool = False
+
+
+class TeardownReaper:
+    """Stop compose projects in background threads
+
+    Stopping a compose project (killing its containers, removing its volumes,
+    waiting for everything to be gone) takes a while; handing it off to a
+    reaper lets the next test module start booting its own project meanwhile.
+    Since project names are unique, both do not interfere.
+
+    args:
+        stop: callable stopping a compose project, called with the project
+            name and the compose command of the stack
+
+        max_workers: maximum number of compose projects being stopped
+            concurrently
+
+        on_done: callable called with the project name once a compose
+            project is stopped (or failed to), e.g. to release its share of
+            the resource budget
+    """
+
+    def __init__(
+        self,
+        stop: Callable[[str, str], None],
+        max_workers: int = 2,
+        on_done: Optional[Callable[[str], None]] = None,
+    ):
+        self.stop = stop
+        self.on_done = on_done
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="teardown-reaper"
+        )
+        self.lock = threading.Lock()
+        self.futures: Dict[str, Future] = {}
+
+    def submit(self, project_name: str, compose_cmd: str) -> None:
+        """Schedule the teardown of a compose project
+
+        Once the interpreter is shutting down (e.g. when atexit handlers stop
+        the stacks left running after a keyboard interruption), no thread can
+        be started anymore, so the compose project is stopped synchronously.
+        """
+        try:
+            future = self.executor.submit(self._stop, project_name, compose_cmd)
+        except RuntimeError:
+            # cannot schedule new futures after (interpreter) shutdown
+            future = Future()
+            try:
+                self._stop(project_name, compose_cmd)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(None)
+        with self.lock:
+            self.futures[project_name] = future
+
+    def _stop(self, project_name: str, compose_cmd: str) -> None:
+        try:
+            # the test running meanwhile has nothing to do with this teardown
+            with RETRY_RECORDER.attributed_to(f"<teardown {project_name}>"):
+                self.stop(project_name, compose_cmd)
+        finally:
+            if self.on_done is not None:
+                self.on_done(project_name)
+
+    def pending(self) -> bool:
+        """Return whether some teardowns are still in progress"""
+        with self.lock:
+            return any(not future.done() for future in self.futures.values())
+
+    def join(self) -> List[str]:
+        """Wait for all the scheduled teardowns to complete
+
+        Return an error message for each teardown which failed."""
+        with self.lock:
+            futures = dict(self.futures)
+            self.futures.clear()
+        errors = []
+        for project_name, future in futures.items():
+            exc = future.exception()
+            if exc is not None:
+                errors.append(
+                    f"Failed to stop the compose session {project_name}: {exc}"
+                )
+        for error in errors:
+            print(error)
+        return errors
+
+    def shutdown(self) -> List[str]:
+        errors = self.join()
+        self.executor.shutdown(wait=True)
+        return errors
+
+
+class ComposeStackRegistry:
+    """Registry of the compose projects started during a test session
+
+    When enabled, a compose project is not stopped at the end of the test
+    module that started it but kept running (idle) so that another test module
+    with the same stack fingerprint can reuse it instead of booting a new
+    one. At most max_idle idle stacks are kept running, the least recently
+    used ones are stopped first.
+
+    When disabled, every test module gets its own compose project, stopped as
+    soon as the module is done.
+
+    args:
+        stop: callable stopping (or scheduling the stop of, see
+            :class:`TeardownReaper`) a compose project, called with the
+            project name and the compose command of the stack
+
+        enabled: whether stacks should be reused between test modules
+
+        max_idle: maximum number of idle stacks kept running
+
+        project_prefix: prefix of the names of the compose projects, which must
+            be unique among the registries of concurrent test sessions (e.g.
+            include the pytest-xdist worker id)
+
+        pool: the stack pool from which already booted stacks are leased
+            before booting new ones; leased stacks are given back to the pool
+            instead of being stopped
+
+        stopping: callable returning whether stopped stacks are still being
+            torn down (see :meth:`TeardownReaper.pending`), in which case no
+            idle stack is evicted, the resources of the former being about to
+            be released
+    """
+
+    def __init__(
+        self,
+        stop: Callable[[str, str], None],
+        enabled: bool = False,
+        max_idle: int = 2,
+        project_prefix: str = "swh_test_",
+        pool: Optional["StackPool"] = None,
+        stopping: Optional[Callable[[], bool]] = None,
+    ):
+        self.stop = stop
+        self.stopping = stopping
+        self.enabled = enabled
+        self.max_idle = max_idle
+        self.project_prefix = project_prefix
+        self.pool = pool
+        self.stacks: Dict[str, ComposeStack] = {}
+
+    def acquire(self, fingerprint: str, reuse: bool = True) -> ComposeStack:
+        """Return an idle running stack with the given fingerprint, or a new
+        (not booted yet) one
+
+        args:
+            reuse: whether an idle stack already used by a previous test module
+                may be returned; stacks leased from the pool are always fresh
+        """
+        if self.enabled and reuse:
+            for stack in self.stacks.values():
+                if (
+                    stack.fingerprint == fingerprint
+                    and stack.booted
+                    and not stack.in_use
+                ):
+                    print(f"Reusing the compose session {stack.project_name}")
+                    stack.in_use = True
+                    return stack
+        if self.pool is not None:
+            record = self.pool.lease(fingerprint, pid=os.getpid())
+            if record is not None:
+                print(f"Leased the compose session {record['project_name']}")
+                stack = ComposeStack(
+                    fingerprint=fingerprint,
+                    project_name=record["project_name"],
+                    booted=True,
+                    in_use=True,
+                    pooled=True,
+                )
+                self.stacks[stack.project_name] = stack
+                return stack
+        stack = ComposeStack(
+            fingerprint=fingerprint, project_name=f"{self.project_prefix}{uuid()}"
+        )
+        stack.in_use = True
+        self.stacks[stack.project_name] = stack
+        return stack
+
+    def release(self, stack: ComposeStack, reusable: bool = True) -> None:
+        """Release a stack at the end of a test module
+
+        The stack is stopped unless stack reuse is enabled and the stack is
+        reusable (e.g. it did not fail to boot)."""
+        stack.in_use = False
+        stack.last_used = time.monotonic()
+        if not (self.enabled and reusable and stack.booted):
+            self._stop(stack)
+            return
+        idle = sorted(
+            (s for s in self.stacks.values() if s.booted and not s.in_use),
+            key=lambda s: s.last_used,
+        )
+        for old_stack in idle[: max(len(idle) - self.max_idle, 0)]:
+            self._stop(old_stack)
+
+    def _stop(self, stack: ComposeStack) -> None:
+        self.stacks.pop(stack.project_name, None)
+        stack.booted = False
+        if stack.pooled:
+            # the pool recycles the stack in background
+            assert self.pool is not None
+            self.pool.give_back(stack.project_name)
+        elif stack.compose_cmd is not None:
+            self.stop(stack.project_name, stack.compose_cmd)
+            stack.compose_cmd = None
+
+    def evict_idle(self) -> bool:
+        """Stop the least recently used idle stack, if any, and return whether
+        one has been stopped"""
+        if self.stopping is not None and self.stopping():
+            return False
+        idle = sorted(
+            (s for s in self.stacks.values() if s.booted and not s.in_use),
+            key=lambda s: s.last_used,
+        )
+        if not idle:
+            return False
+        print(f"Stopping the idle compose session {idle[0].project_name}")
+        self._stop(idle[0])
+        return True
+
+    def stop_all(self) -> None:
+        """Stop all the stacks still running (e.g. at the end of the session)"""
+        for stack in list(self.stacks.values()):
+            self._stop(stack)
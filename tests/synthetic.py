@@ -0,0 +1,77 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import os
+from typing import Dict, List, Optional
+
+import yaml
+
+# compose service serving the synthetic repositories (see compose.origins.yml)
+ORIGIN_SERVER = "origin-server"
+ORIGIN_SERVER_CONFIG = "conf/origin-server.yml"
+
+
+def synthetic_origin_url(visit_type: str, name: str) -> str:
+    """Return the url of a synthetic repository, as seen from the containers of
+    the compose session"""
+    if visit_type == "git":
+        return f"http://{ORIGIN_SERVER}:8001/{name}.git"
+    if visit_type == "hg":
+        return f"http://{ORIGIN_SERVER}:8002/{name}"
+    if visit_type == "svn":
+        return f"svn://{ORIGIN_SERVER}/{name}"
+    raise ValueError(f"No synthetic repository of type {visit_type}")
+
+
+@dataclasses.dataclass
+class SyntheticRepository:
+    """Description of a repository generated by the origin-server service (see
+    services/origin-server/generate.py for how it is generated)"""
+
+    name: str
+    commits: int = 10
+    files: int = 10
+    file_size: int = 1024
+    branches: int = 0
+    tags: int = 0
+    scale: int = 1
+
+    @property
+    def content_bytes(self) -> int:
+        """Size of all the file contents of the repository (the first commit
+        adds all the files, each next one modifies a single file)"""
+        return (self.files + self.commits - 1) * self.file_size
+
+    def origin_url(self, visit_type: str) -> str:
+        return synthetic_origin_url(visit_type, self.name)
+
+
+def synthetic_repositories(
+    config_path: str = ORIGIN_SERVER_CONFIG, scales: Optional[List[int]] = None
+) -> Dict[str, SyntheticRepository]:
+    """Return the synthetic repositories generated by the origin-server service,
+    indexed by name"""
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    if scales is None:
+        if os.environ.get("SYNTHETIC_SCALES"):
+            scales = [int(s) for s in os.environ["SYNTHETIC_SCALES"].split(",")]
+        else:
+            scales = config.get("scales", [1])
+    repositories = {}
+    for base_name, params in config["repositories"].items():
+        for scale in scales:
+            name = base_name if scale == 1 else f"{base_name}-x{scale}"
+            repositories[name] = SyntheticRepository(
+                name=name,
+                commits=params.get("commits", 10) * scale,
+                files=params.get("files", 10) * scale,
+                file_size=params.get("file_size", 1024),
+                branches=params.get("branches", 0),
+                tags=params.get("tags", 0),
+                scale=scale,
+            )
+    return repositories
@@ -8,39 +8,47 @@ import logging
 from typing import List, Tuple
 
 import pytest
-import requests
 
-from .utils import RemovalOperation, retry_until_success
+from .utils import RemovalOperation
 
 logger = logging.getLogger(__name__)
 
-
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    return ["compose.yml", "compose.search.yml", "compose.alter.yml"]
-
-
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-alter",
-        "swh-search",
-        "swh-search-journal-client-objects",
-        "swh-search-journal-client-indexed",
-        "swh-storage",
-        "swh-objstorage",
-        "swh-storage-replayer",
-        "swh-extra-objstorage",
-        "swh-objstorage-replayer",
-        "swh-scheduler-runner",
-        "swh-scheduler-listener",
-        "swh-scheduler-schedule-recurrent",
-        "swh-web",
-        "swh-loader",
-        "swh-lister",
-    ]
+# journal clients propagating alterations of the archive
+CONSUMER_GROUPS = [
+    "swh.alter.storage.replayer",
+    "swh.alter.objstorage.replayer",
+    "swh.search.journal_client",
+]
+
+# the primary objstorage and the extra one fed by the objstorage replayer
+OBJSTORAGE_URL_OPTIONS = (
+    "--objstorage-url http://nginx/rpc/objstorage "
+    "--objstorage-url http://swh-extra-objstorage:5003"
+)
+
+
+COMPOSE_FILES = ["compose.yml", "compose.search.yml", "compose.alter.yml"]
+
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-alter",
+    "swh-search",
+    "swh-search-journal-client-objects",
+    "swh-search-journal-client-indexed",
+    "swh-storage",
+    "swh-objstorage",
+    "swh-storage-replayer",
+    "swh-extra-objstorage",
+    "swh-objstorage-replayer",
+    "swh-scheduler-runner",
+    "swh-scheduler-listener",
+    "swh-scheduler-schedule-recurrent",
+    "swh-web",
+    "swh-loader",
+    "swh-lister",
+]
 
 
 @pytest.fixture(scope="module")
@@ -51,45 +59,8 @@ def origin_urls() -> List[Tuple[str, str]]:
     ]
 
 
-def wait_for_replayer(docker_compose, kafka_api_url):
-    # wait until the replayer is done
-    print("Waiting for the replayer to be done")
-    cluster = requests.get(kafka_api_url).json()["data"][0]["cluster_id"]
-
-    def kget(path):
-        url = f"{kafka_api_url}/{cluster}/{path}"
-        resp = requests.get(url)
-        if resp.status_code == 200:
-            return resp.json()
-        resp.raise_for_status()
-
-    for consumer in (
-        "swh.alter.storage.replayer",
-        "swh.alter.objstorage.replayer",
-        "swh.search.journal_client",
-    ):
-
-        def check_consumer_finished_job():
-            try:
-                lag_sum = kget(f"consumer-groups/{consumer}/lag-summary")
-            except requests.exceptions.HTTPError as exc:
-                print(f"Failed to retrieve consumer status: {exc}")
-                return False
-            else:
-                return lag_sum["total_lag"] == 0
-
-        retry_until_success(
-            check_consumer_finished_job,
-            error_message=(
-                "Could not detect a condition where the "
-                f"consumer {consumer} did its job"
-            ),
-            max_attempts=30,
-        )
-
-
 @pytest.fixture(scope="module")
-def verified_origins(alter_host, docker_compose, origins, kafka_api_url):
+def verified_origins(alter_host, docker_compose, origins, journal_barrier):
     # Verify that our origins have properly been loaded in PostgreSQL
     # and Cassandra
     origin_swhids = {
@@ -106,7 +77,7 @@ def verified_origins(alter_host, docker_compose, origins, kafka_api_url):
         f"query-kafka --presence {' '.join(origin_swhids)}"
     )
 
-    wait_for_replayer(docker_compose, kafka_api_url)
+    journal_barrier.wait(CONSUMER_GROUPS)
 
     return origins
 
@@ -123,11 +94,22 @@ def fork_removed(alter_host, verified_origins):
     return op
 
 
-def test_fork_removed_in_postgresql(docker_compose, fork_removed):
-    # Ensure the SWHIDs have been removed from PostgreSQL
+@pytest.fixture(scope="module")
+def fork_swhids_file(alter_host, fork_removed) -> str:
+    # SWHIDs removed with the fork, one per line, in the swh-alter container
+    path = "/tmp/integration-test-fork.swhids"
+    alter_host.check_output(
+        f"printf '%s\\n' {' '.join(fork_removed.removed_swhids)} > {path}"
+    )
+    return path
+
+
+def test_fork_removed_in_postgresql(docker_compose, fork_removed, fork_swhids_file):
+    # Ensure the SWHIDs have been removed from PostgreSQL, looking them up
+    # in small batches to go through several queries per object type
     docker_compose.check_compose_output(
         "exec swh-alter python /src/alter_companion.py "
-        f"query-postgresql {' '.join(fork_removed.removed_swhids)}"
+        f"query-postgresql --batch-size 2 --swhids-file {fork_swhids_file}"
     )
 
 
@@ -156,20 +138,20 @@ def test_fork_removed_in_elasticsearch(docker_compose, fork_removed):
 
 
 @pytest.fixture(scope="module")
-def fork_restored(fork_removed, alter_host, docker_compose, kafka_api_url):
+def fork_restored(fork_removed, alter_host, docker_compose, journal_barrier):
     alter_host.check_output(
         f"swh alter recovery-bundle restore '{fork_removed.bundle_path}' "
         "--identity /srv/softwareheritage/age-identities.txt"
     )
-    wait_for_replayer(docker_compose, kafka_api_url)
+    journal_barrier.wait(CONSUMER_GROUPS)
     return fork_removed
 
 
-def test_fork_restored_in_postgresql(docker_compose, fork_restored):
+def test_fork_restored_in_postgresql(docker_compose, fork_restored, fork_swhids_file):
     # Ensure the SWHIDs are back in PostgreSQL
     docker_compose.check_compose_output(
-        "exec swh-alter python /src/alter_companion.py "
-        f"query-postgresql --presence {' '.join(fork_restored.removed_swhids)}"
+        "exec swh-alter python /src/alter_companion.py query-postgresql "
+        f"--presence --batch-size 2 --swhids-file {fork_swhids_file}"
     )
 
 
@@ -187,6 +169,20 @@ def test_fork_restored_in_kafka(docker_compose, fork_restored):
         "exec swh-alter python /src/alter_companion.py "
         f"query-kafka --presence {' '.join(fork_restored.removed_swhids)}"
     )
+    # Look the SWHIDs keyed by their id up again with a fresh index, which
+    # only consumes the partitions their keys are hashed to: a wrong partition
+    # would leave them not found
+    keyed_by_id = [
+        swhid
+        for swhid in fork_restored.removed_swhids
+        if swhid[6:9] in ("snp", "rel", "rev", "dir")
+    ]
+    assert keyed_by_id
+    docker_compose.check_compose_output(
+        "exec swh-alter python /src/alter_companion.py query-kafka --presence "
+        "--index-path /tmp/integration-test-fork-targeted.sqlite "
+        f"{' '.join(keyed_by_id)}"
+    )
 
 
 def test_fork_restored_in_elasticsearch(docker_compose, fork_restored):
@@ -209,24 +205,12 @@ def initial_removed(alter_host, verified_origins, fork_restored, tiny_git_repo):
     return initial_removal_op
 
 
-def test_initial_removed_in_primary_objstorage(
-    docker_compose, initial_removed, alter_host
-):
-    # Ensure objects have been removed from primary objstorage
+def test_initial_removed_in_objstorages(docker_compose, initial_removed, alter_host):
+    # Ensure objects have been removed from both the primary and the extra
+    # objstorage
     docker_compose.check_compose_output(
         "exec swh-alter python /src/alter_companion.py query-objstorage "
-        "--objstorage-url http://nginx/rpc/objstorage "
-        f"{' '.join(initial_removed.get_removed_content_sha1s(alter_host))}"
-    )
-
-
-def test_initial_removed_in_extra_objstorage(
-    docker_compose, initial_removed, alter_host
-):
-    # Ensure objects have been removed from extra objstorage
-    docker_compose.check_compose_output(
-        "exec swh-alter python /src/alter_companion.py query-objstorage "
-        "--objstorage-url http://swh-extra-objstorage:5003 "
+        f"{OBJSTORAGE_URL_OPTIONS} "
         f"{' '.join(initial_removed.get_removed_content_sha1s(alter_host))}"
     )
 
@@ -260,34 +244,27 @@ def test_fork_restored_initial_removed_fork_still_available(
 
 
 @pytest.fixture(scope="module")
-def initial_restored(initial_removed, alter_host, docker_compose, kafka_api_url):
+def initial_restored(initial_removed, alter_host, docker_compose, journal_barrier):
     alter_host.check_output(
         f"swh alter recovery-bundle restore '{initial_removed.bundle_path}' "
         "--identity /srv/softwareheritage/age-identities.txt"
     )
-    wait_for_replayer(docker_compose, kafka_api_url)
+    journal_barrier.wait(CONSUMER_GROUPS)
     return initial_removed
 
 
-def test_initial_restored_in_primary_objstorage(
-    docker_compose, initial_restored, alter_host
-):
-    # Ensure objects are back in primary objstorage
+def test_initial_restored_in_objstorages(docker_compose, initial_restored, alter_host):
+    sha1s = " ".join(initial_restored.get_removed_content_sha1s(alter_host))
+    # Ensure objects are back in the primary objstorage, and in the extra one
+    # (through the replayer)
     docker_compose.check_compose_output(
         "exec swh-alter python /src/alter_companion.py query-objstorage --presence "
-        "--objstorage-url http://nginx/rpc/objstorage "
-        f"{' '.join(initial_restored.get_removed_content_sha1s(alter_host))}"
+        f"{OBJSTORAGE_URL_OPTIONS} {sha1s}"
     )
-
-
-def test_initial_restored_in_extra_objstorage(
-    docker_compose, initial_restored, alter_host
-):
-    # Ensure objects are back in extra objstorage (through the replayer)
+    # Ensure both objstorages agree on the state of every restored object
     docker_compose.check_compose_output(
-        "exec swh-alter python /src/alter_companion.py query-objstorage --presence "
-        "--objstorage-url http://swh-extra-objstorage:5003 "
-        f"{' '.join(initial_restored.get_removed_content_sha1s(alter_host))}"
+        "exec swh-alter python /src/alter_companion.py query-objstorage --compare "
+        f"{OBJSTORAGE_URL_OPTIONS} {sha1s}"
     )
 
 
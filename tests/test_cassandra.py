@@ -4,33 +4,29 @@
 # See top-level LICENSE file for more information
 
 import re
-from typing import List
 
 import pytest
 
 from .test_git_loader import test_git_loader  # noqa
 from .utils import compose_host_for_service
 
+pytestmark = pytest.mark.reusable_stack
 
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    # overload the default list to add cassandra specific compose override
-    return ["compose.yml", "compose.cassandra.yml"]
+# add cassandra specific compose override to the default list
+COMPOSE_FILES = ["compose.yml", "compose.cassandra.yml"]
 
 
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "cassandra",
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "cassandra",
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
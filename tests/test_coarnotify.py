@@ -10,8 +10,8 @@ from http import HTTPStatus
 
 import pytest
 
+from .retry import retry_until_success
 from .utils import api_get as api_get_func
-from .utils import retry_until_success
 
 
 @pytest.fixture(scope="module")
@@ -58,27 +58,23 @@ def mention_payload(origin_url, nginx_url):
     }
 
 
-@pytest.fixture(scope="module")
-def compose_files() -> list[str]:
-    return ["compose.yml", "compose.coarnotify.yml"]
+COMPOSE_FILES = ["compose.yml", "compose.coarnotify.yml"]
 
 
-@pytest.fixture(scope="module")
-def compose_services() -> list[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-storage",
-        "swh-objstorage",
-        "swh-coarnotify",
-        "swh-scheduler",
-        "swh-scheduler-listener",
-        "swh-indexer-journal-client-oemd",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-idx-storage",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-storage",
+    "swh-objstorage",
+    "swh-coarnotify",
+    "swh-scheduler",
+    "swh-scheduler-listener",
+    "swh-indexer-journal-client-oemd",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-idx-storage",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
@@ -151,7 +147,7 @@ def test_mention(
     raw_extrinsic_metadata = retry_until_success(
         get_raw_extrinsic_metadata,
         error_message=("Could not get Raw Extrinsic MD after multiple attempts"),
-        max_attempts=30,
+        timeout=45,
     )
 
     assert raw_extrinsic_metadata[0]["format"] == "coarnotify-mention-v1"
@@ -167,7 +163,7 @@ def test_mention(
     extrinsic_metadata = retry_until_success(
         get_extrinsic_metadata,
         error_message=("Could not get Extrinsic MD after multiple attempts"),
-        max_attempts=30,
+        timeout=45,
     )
 
     assert (
@@ -10,7 +10,8 @@ from typing import List
 import pytest
 
 from .conftest import WFI_TIMEOUT
-from .utils import compose_host_for_service, retry_until_success
+from .retry import retry_until_success
+from .utils import compose_host_for_service
 
 SAMPLE_METADATA = """\
 <?xml version="1.0" encoding="utf-8"?>
@@ -88,21 +89,19 @@ def compose_files(request) -> List[str]:
     return request.param
 
 
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-deposit",
-        "swh-indexer-journal-client-remd",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-loader-deposit",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-deposit",
+    "swh-indexer-journal-client-remd",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-loader-deposit",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
 
 
 # scope='module' so we use the same container for all the tests in a given test
@@ -129,6 +128,11 @@ def deposit_host(request, docker_compose, scheduler_host):
     yield deposit_host
 
 
+# checking the status of a deposit takes a few seconds (swh deposit status is
+# executed in the container), and was retried 60 times with 1s delays
+DEPOSIT_LOADING_TIMEOUT = 240
+
+
 def check_deposit_done(deposit_host, deposit_id):
     try:
         status = json.loads(
@@ -173,7 +177,7 @@ def test_create_deposit_simple(deposit_host):
     retry_until_success(
         functools.partial(check_deposit_done, deposit_host, deposit_id),
         error_message="Deposit loading failed",
-        max_attempts=60,
+        timeout=DEPOSIT_LOADING_TIMEOUT,
     )
 
 
@@ -199,7 +203,7 @@ def test_create_deposit_with_metadata(deposit_host):
     retry_until_success(
         functools.partial(check_deposit_done, deposit_host, deposit_id),
         error_message="Deposit loading failed",
-        max_attempts=60,
+        timeout=DEPOSIT_LOADING_TIMEOUT,
     )
 
 
@@ -235,7 +239,7 @@ def test_create_deposit_multipart(deposit_host):
     retry_until_success(
         functools.partial(check_deposit_done, deposit_host, deposit_id),
         error_message="Deposit loading failed",
-        max_attempts=60,
+        timeout=DEPOSIT_LOADING_TIMEOUT,
     )
 
 
@@ -252,7 +256,7 @@ def test_create_deposit_releases(deposit_host, api_get):
     retry_until_success(
         functools.partial(check_deposit_done, deposit_host, deposit_id),
         error_message="Deposit loading failed",
-        max_attempts=60,
+        timeout=DEPOSIT_LOADING_TIMEOUT,
     )
 
     # then another one
@@ -267,7 +271,7 @@ def test_create_deposit_releases(deposit_host, api_get):
     retry_until_success(
         functools.partial(check_deposit_done, deposit_host, deposit_id),
         error_message="Deposit loading failed",
-        max_attempts=60,
+        timeout=DEPOSIT_LOADING_TIMEOUT,
     )
     status = json.loads(
         deposit_host.check_output(
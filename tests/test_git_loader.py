@@ -11,19 +11,18 @@ from dulwich.repo import MemoryRepo
 
 from .utils import grouper
 
-
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-web",
-    ]
+pytestmark = pytest.mark.reusable_stack
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
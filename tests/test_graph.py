@@ -11,41 +11,37 @@ import swh.graph.grpc.swhgraph_pb2 as swhgraph
 import swh.graph.grpc.swhgraph_pb2_grpc as swhgraph_grpc
 
 from .conftest import service_url
+from .retry import retry_until_success
 # fmt: off
 # to test vault cooking with graph use
 from .test_vault import test_vault_git_bare  # noqa
-from .utils import (compose_host_for_service, generate_bearer_token,
-                    retry_until_success)
+from .utils import compose_host_for_service
 
 # fmt: on
 
 
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    return [
-        "compose.yml",
-        "compose.graph.yml",
-        "compose.keycloak.yml",
-        "compose.vault.yml",
-    ]
+COMPOSE_FILES = [
+    "compose.yml",
+    "compose.graph.yml",
+    "compose.keycloak.yml",
+    "compose.vault.yml",
+]
 
 
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-graph",
-        "swh-web",
-        "swh-counters-journal-client",
-        "swh-vault",
-        "swh-vault-worker",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-graph",
+    "swh-web",
+    "swh-counters-journal-client",
+    "swh-vault",
+    "swh-vault-worker",
+]
 
 
 @pytest.fixture(scope="module")
@@ -152,24 +148,21 @@ def test_graph_masked_node(
     )
 
 
-def test_graph_web_api(graph_service, api_get, origins):
+def test_graph_web_api(graph_service, api_get, bearer_auth, origins):
     graph_service.check_output("wait-for-it swh-graph:50091 -s --timeout=0")
 
     # generate a token for admin user
-    bearer_token = retry_until_success(
-        lambda: generate_bearer_token(
-            graph_service,
-            # user johndoe has the swh.web.api.graph permission set
-            # see services/keycloak/keycloak_swh_setup.py script
-            username="johndoe",
-            password="johndoe-swh",
-        )
+    auth = bearer_auth(
+        # user johndoe has the swh.web.api.graph permission set
+        # see services/keycloak/keycloak_swh_setup.py script
+        username="johndoe",
+        password="johndoe-swh",
     )
 
     # Web API authentication with valid bearer token should succeed
     stats = api_get(
         "graph/stats/",
-        headers={"Authorization": f"Bearer {bearer_token}"},
+        auth=auth,
     )
 
     assert stats["num_nodes"] > 0 and stats["num_edges"] > 0
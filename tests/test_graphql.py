@@ -6,20 +6,17 @@
 import pytest
 import requests
 
-
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-graphql",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-graphql",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
@@ -3,39 +3,31 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
-from typing import List
 
 import pytest
 
-from .utils import generate_bearer_token, retry_until_success
+pytestmark = pytest.mark.reusable_stack
 
+COMPOSE_FILES = ["compose.yml", "compose.deposit.yml", "compose.keycloak.yml"]
 
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    return ["compose.yml", "compose.deposit.yml", "compose.keycloak.yml"]
 
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "keycloak",
+    "swh-web",
+]
 
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "keycloak",
-        "swh-web",
-    ]
 
-
-def test_keycloak_authentication(webapp_host, api_get):
+def test_keycloak_authentication(webapp_host, api_get, bearer_token):
     # generate a token for admin user
-    bearer_token = retry_until_success(
-        lambda: generate_bearer_token(webapp_host, username="admin", password="admin")
-    )
+    token = bearer_token(username="admin", password="admin")
 
     # Web API authentication with valid bearer token should succeed
     api_get(
         "origins/",
         verb="HEAD",
-        headers={"Authorization": f"Bearer {bearer_token}"},
+        headers={"Authorization": f"Bearer {token}"},
         raw=True,
     )
 
@@ -44,6 +36,6 @@ def test_keycloak_authentication(webapp_host, api_get):
         api_get(
             "origins/",
             verb="HEAD",
-            headers={"Authorization": f"Bearer {bearer_token[1:-1]}"},
+            headers={"Authorization": f"Bearer {token[1:-1]}"},
             raw=True,
         )
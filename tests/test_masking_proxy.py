@@ -11,19 +11,16 @@ import requests
 
 from .utils import compose_host_for_service
 
-
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
@@ -5,25 +5,21 @@
 
 import re
 
-import pytest
-
-from .utils import retry_until_success
+from .retry import retry_until_success
 
 MAVEN_REPOSITORY_BASE_URL = "https://mavenrepo.openmrs.org/releases/"
 
 
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",
-        "swh-loader",  # required for the scheduler runner to start
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-storage",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",
+    "swh-loader",  # required for the scheduler runner to start
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-storage",
+]
 
 
 def test_maven_lister(scheduler_host, docker_compose):
@@ -4,39 +4,32 @@
 # See top-level LICENSE file for more information
 
 import re
-from typing import List
+from datetime import datetime, timezone
 
 import pytest
 
-from .utils import generate_bearer_token, retry_until_success
-
-
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    return [
-        "compose.yml",
-        "compose.deposit.yml",
-        "compose.keycloak.yml",
-    ]
-
-
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-storage",
-        "swh-objstorage",
-        "swh-scheduler",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-runner",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner-first-visits",
-        "swh-web",
-        "swh-loader",
-        "swh-lister",
-        "keycloak",
-    ]
+COMPOSE_FILES = [
+    "compose.yml",
+    "compose.deposit.yml",
+    "compose.keycloak.yml",
+]
+
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-storage",
+    "swh-objstorage",
+    "swh-scheduler",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-runner",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner-first-visits",
+    "swh-web",
+    "swh-loader",
+    "swh-lister",
+    "keycloak",
+]
 
 
 @pytest.fixture(scope="module")
@@ -50,23 +43,31 @@ def origin_urls(origin_urls):
     ]
 
 
-def test_save_bulk(docker_compose, webapp_host, api_get, origin_urls):
+def test_save_bulk(
+    docker_compose,
+    webapp_host,
+    api_get,
+    bearer_auth,
+    origin_urls,
+    visit_status_watcher,
+    journal_barrier,
+):
     print("Generating a bearer token for granted user")
-    bearer_token = retry_until_success(
-        lambda: generate_bearer_token(
-            webapp_host,
-            # user johndoe has the swh.web.api.save_bulk permission set
-            # see services/keycloak/keycloak_swh_setup.py script
-            username="johndoe",
-            password="johndoe-swh",
-        )
+    auth = bearer_auth(
+        # user johndoe has the swh.web.api.save_bulk permission set
+        # see services/keycloak/keycloak_swh_setup.py script
+        username="johndoe",
+        password="johndoe-swh",
     )
 
+    # the origins may have been loaded in a compose session reused from a
+    # previous test module
+    since = datetime.now(tz=timezone.utc)
     print("Submitting origins to load through save bulk Web API endpoint")
     resp = api_get(
         "origin/save/bulk/",
         verb="POST",
-        headers={"Authorization": f"Bearer {bearer_token}"},
+        auth=auth,
         json=[
             {"visit_type": visit_type, "origin_url": origin_url}
             for visit_type, origin_url in origin_urls
@@ -77,32 +78,36 @@ def test_save_bulk(docker_compose, webapp_host, api_get, origin_urls):
 
     request_info_url = resp["request_info_url"]
 
-    def check_save_bulk_lister_execution():
-        matcher = re.compile(
-            r".*Task swh.lister.save_bulk.tasks.SaveBulkListerTask.*succeeded.*"
-        )
-        lister_logs = docker_compose.check_compose_output("logs swh-lister")
-        return any(
-            matcher.match(line)
-            for line in lister_logs.splitlines()
-            if "INFO/ForkPoolWorker" in line
-        )
+    print("Waiting for listed origins to be loaded into the archive")
+    visit_statuses = visit_status_watcher.wait_for(
+        (origin_url for _, origin_url in origin_urls), since=since
+    )
+    assert all(
+        visit_status["status"] == "full" for visit_status in visit_statuses.values()
+    ), visit_statuses
 
     print("Checking save bulk lister was successfully executed")
-    retry_until_success(check_save_bulk_lister_execution)
-
-    def check_origins_scheduled_and_visited():
-        resp = api_get(
-            request_info_url,
-            headers={"Authorization": f"Bearer {bearer_token}"},
-        )
-        assert len(resp) == len(origin_urls)
-        return all(
-            origin_info["last_visit_status"] == "successful" for origin_info in resp
-        )
+    matcher = re.compile(
+        r".*Task swh.lister.save_bulk.tasks.SaveBulkListerTask.*succeeded.*"
+    )
+    lister_logs = docker_compose.check_compose_output("logs swh-lister")
+    assert any(
+        matcher.match(line)
+        for line in lister_logs.splitlines()
+        if "INFO/ForkPoolWorker" in line
+    )
 
-    print("Checking listed origins were scheduled and loaded into the archive")
-    retry_until_success(check_origins_scheduled_and_visited)
+    print("Checking listed origins were scheduled and visited")
+    # the visits of listed origins are recorded by the scheduler journal client
+    journal_barrier.wait(["swh.scheduler.journal_client"])
+    resp = api_get(
+        request_info_url,
+        auth=auth,
+    )
+    assert len(resp) == len(origin_urls)
+    assert all(
+        origin_info["last_visit_status"] == "successful" for origin_info in resp
+    ), resp
 
     for visit_type, origin_url in origin_urls:
         resp = api_get(f"origin/{origin_url}/visit/latest/")
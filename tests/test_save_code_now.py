@@ -6,7 +6,7 @@
 
 import pytest
 
-from .utils import retry_until_success
+from .retry import retry_until_success
 
 # small git repository that takes a couple of seconds to load into the archive
 ORIGIN_URL = "https://github.com/anlambert/highlightjs-line-numbers.js"
@@ -28,22 +28,25 @@ def compose_files(request):
     return request.param
 
 
+# services common to both compose files lists
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner-priority",
+    "swh-web",
+]
+
+
 @pytest.fixture(scope="module")
 def compose_services(compose_files):
-    common_services = [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner-priority",
-        "swh-web",
-    ]
     if "compose.webhooks.yml" in compose_files:
-        return common_services + ["swh-webhooks-journal-client"]
+        return COMPOSE_SERVICES + ["swh-webhooks-journal-client"]
     else:
-        return common_services + ["swh-web-cron"]
+        return COMPOSE_SERVICES + ["swh-web-cron"]
 
 
 def test_save_code_now(webapp_host, api_get):
@@ -54,5 +57,5 @@ def test_save_code_now(webapp_host, api_get):
     retry_until_success(
         lambda: api_get(api_path)[0].get("save_task_status") == "succeeded",
         error_message="Save Code Now request did not succeed",
-        max_attempts=60,
+        timeout=90,
     )
@@ -5,31 +5,25 @@
 
 import json
 import textwrap
-from typing import List
 
 import pytest
 
 from .utils import compose_host_for_service
 
+# add scrubber compose override to the default list
+COMPOSE_FILES = ["compose.yml", "compose.scrubber.yml"]
 
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    # overload the default list to add scrubber compose override
-    return ["compose.yml", "compose.scrubber.yml"]
-
-
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-scrubber",
-    ]
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-scrubber",
+]
 
 
 @pytest.fixture(autouse=True)
@@ -4,35 +4,29 @@
 # See top-level LICENSE file for more information
 
 import re
-from typing import List
 from urllib.parse import quote_plus
 
 import pytest
 
-from .utils import retry_until_success
+from .retry import retry_until_success
 
-
-@pytest.fixture(scope="module")
-def compose_files() -> List[str]:
-    return ["compose.yml", "compose.search.yml"]
+COMPOSE_FILES = ["compose.yml", "compose.search.yml"]
 
 
-@pytest.fixture(scope="module")
-def compose_services():
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "swh-indexer-journal-client-oimd",
-        "swh-lister",  # required for the scheduler runner to start
-        "swh-loader",
-        "swh-scheduler-journal-client",
-        "swh-scheduler-listener",
-        "swh-scheduler-runner",
-        "swh-search",
-        "swh-search-journal-client-objects",
-        "swh-search-journal-client-indexed",
-        "swh-web",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "swh-indexer-journal-client-oimd",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-search",
+    "swh-search-journal-client-objects",
+    "swh-search-journal-client-indexed",
+    "swh-web",
+]
 
 
 @pytest.fixture(scope="module")
@@ -166,7 +160,7 @@ def test_origin_metadata_search(origins, docker_compose, nginx_get, api_get):
                 "swh-indexer-worker-journal(?) did not process origins with "
                 "intrinsic metadata in a timely manner"
             ),
-            max_attempts=30,
+            timeout=45,
         )
 
     # 6. Check the metadata indexer storage (!) have them indexed. Unfortunately
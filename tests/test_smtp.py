@@ -5,19 +5,15 @@
 
 import smtplib
 from email.message import EmailMessage
-from typing import List
 
 import pytest
 
-
-@pytest.fixture(scope="module")
-def compose_services() -> List[str]:
-    return [
-        "docker-helper",
-        "docker-proxy",
-        "smtp",
-        "nginx",
-    ]
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "smtp",
+    "nginx",
+]
 
 
 def test_reverse_proxy(compose_files, compose_services, nginx_get) -> None:
@@ -0,0 +1,66 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+from urllib.parse import quote_plus
+
+import pytest
+
+pytestmark = pytest.mark.reusable_stack
+
+COMPOSE_FILES = ["compose.yml", "compose.origins.yml"]
+
+
+COMPOSE_SERVICES = [
+    "docker-helper",
+    "docker-proxy",
+    "origin-server",
+    "swh-lister",  # required for the scheduler runner to start
+    "swh-loader",
+    "swh-scheduler-journal-client",
+    "swh-scheduler-listener",
+    "swh-scheduler-runner",
+    "swh-web",
+]
+
+
+@pytest.fixture(scope="module")
+def origin_urls(synthetic_repos):
+    repo = synthetic_repos["small"]
+    return [
+        (visit_type, repo.origin_url(visit_type)) for visit_type in ("git", "hg", "svn")
+    ]
+
+
+def test_synthetic_origins_loaded(origins, api_get):
+    for origin_type, url in origins:
+        visit = api_get(f"origin/{quote_plus(url)}/visit/latest/")
+        assert visit["status"] == "full", f"{origin_type} origin {url} not loaded"
+        snapshot = api_get(f'snapshot/{visit["snapshot"]}/')
+        assert "HEAD" in snapshot["branches"]
+
+
+def test_synthetic_git_origin(origins, synthetic_repos, api_get, api_get_directory):
+    repo = synthetic_repos["small"]
+    url = repo.origin_url("git")
+    visit = api_get(f"origin/{quote_plus(url)}/visit/latest/")
+    snapshot = api_get(f'snapshot/{visit["snapshot"]}/')
+
+    assert set(snapshot["branches"]) == {
+        "HEAD",
+        "refs/heads/main",
+        *(f"refs/heads/branch-{i}" for i in range(repo.branches)),
+        *(f"refs/tags/v{i}" for i in range(repo.tags)),
+    }
+    head = snapshot["branches"]["refs/heads/main"]["target"]
+    revision = api_get(f"revision/{head}/")
+    assert revision["message"] == f"Synthetic commit {repo.commits - 1}\n"
+
+    files = [
+        entry
+        for _, entry in api_get_directory(revision["directory"])
+        if entry["type"] == "file"
+    ]
+    assert len(files) == repo.files
+    assert all(entry["length"] == repo.file_size for entry in files)
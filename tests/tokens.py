@@ -0,0 +1,289 @@
+# Copyright (C) 2026  The Software Heritage developers
+# See the AUTHORS file at the top-level directory of this distribution
+# License: GNU General Public License version 3, or any later version
+# See top-level LICENSE file for more information
+
+import dataclasses
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.auth import AuthBase
+
+from .retry import retry_until_success
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REALM = "SoftwareHeritage"
+DEFAULT_CLIENT_ID = "swh-web"
+
+
+@dataclasses.dataclass
+class CachedToken:
+    # the offline token, used as bearer token by the Web API clients
+    offline_token: str
+    access_token: str
+    # monotonic times after which the tokens are expired, None if they never
+    # expire
+    access_expires_at: Optional[float]
+    offline_expires_at: Optional[float]
+
+
+class BearerTokens:
+    """Mint the bearer tokens of Web API users, with direct OIDC calls to
+    Keycloak, and cache them
+
+    The offline token of a user (the token returned by ``swh auth
+    generate-token``) is obtained once per (compose project, keycloak, realm,
+    user), with a password grant; it is refreshed with a refresh token grant
+    when it gets close to its expiry (if the offline sessions of the realm do
+    expire), and minted again if this fails. The compose project is part of
+    the key since the URL of Keycloak may be reused by the compose session
+    of another project (with another Keycloak database) once a compose
+    session is stopped.
+
+    args:
+        session: the HTTP session used to query Keycloak
+
+        client_id: the OIDC client the tokens are requested for
+
+        refresh_margin: seconds before expiry at which tokens are refreshed
+
+        timeout: seconds to wait for Keycloak (and the users created by the
+            keycloak_swh_setup.py script) to be ready when minting a token
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        client_id: str = DEFAULT_CLIENT_ID,
+        refresh_margin: float = 30,
+        timeout: float = 120,
+    ):
+        self.session = session or requests.Session()
+        self.client_id = client_id
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.tokens: Dict[Tuple[str, str, str, str], CachedToken] = {}
+        self.locks: Dict[Tuple[str, str, str, str], threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def _token_url(self, server_url: str, realm: str) -> str:
+        return f"{server_url.rstrip('/')}/realms/{realm}/protocol/openid-connect/token"
+
+    def _request(
+        self, server_url: str, realm: str, data: Dict[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            resp = self.session.post(
+                self._token_url(server_url, realm),
+                data=dict(data, client_id=self.client_id),
+                timeout=30,
+            )
+        except requests.RequestException as exc:
+            logger.debug("Keycloak token request failed: %s", exc)
+            return None
+        if resp.status_code != 200:
+            logger.debug(
+                "Keycloak token request failed: %s %s", resp.status_code, resp.text
+            )
+            return None
+        return resp.json()
+
+    def _cached(self, response: Dict[str, Any]) -> CachedToken:
+        now = time.monotonic()
+        # offline tokens have a refresh_expires_in of 0 when they never expire
+        offline_expires_in = response.get("refresh_expires_in") or 0
+        return CachedToken(
+            offline_token=response["refresh_token"],
+            access_token=response["access_token"],
+            access_expires_at=now + response.get("expires_in", 0),
+            offline_expires_at=now + offline_expires_in if offline_expires_in else None,
+        )
+
+    def _mint(
+        self, server_url: str, realm: str, username: str, password: str
+    ) -> CachedToken:
+        response = retry_until_success(
+            lambda: self._request(
+                server_url,
+                realm,
+                {
+                    "grant_type": "password",
+                    "scope": "openid offline_access",
+                    "username": username,
+                    "password": password,
+                },
+            ),
+            error_message=f"Failed to generate a bearer token for {username}",
+            timeout=self.timeout,
+        )
+        return self._cached(response)
+
+    def _refresh(
+        self, server_url: str, realm: str, token: CachedToken
+    ) -> Optional[CachedToken]:
+        response = self._request(
+            server_url,
+            realm,
+            {"grant_type": "refresh_token", "refresh_token": token.offline_token},
+        )
+        if response is None:
+            return None
+        return self._cached(response)
+
+    def _expiring(self, expires_at: Optional[float]) -> bool:
+        return (
+            expires_at is not None
+            and expires_at - self.refresh_margin <= time.monotonic()
+        )
+
+    def get(
+        self,
+        server_url: str,
+        username: str,
+        password: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+    ) -> CachedToken:
+        """Return the cached tokens of a user, minted or refreshed if needed
+
+        args:
+            server_url: the base URL of Keycloak (ending with /auth/)
+
+            project: the name of the compose project Keycloak belongs to
+        """
+        key = (project, server_url, realm, username)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            token = self.tokens.get(key)
+            if token is not None and (
+                self._expiring(token.offline_expires_at)
+                or self._expiring(token.access_expires_at)
+            ):
+                token = self._refresh(server_url, realm, token)
+            if token is None:
+                token = self._mint(server_url, realm, username, password)
+            self.tokens[key] = token
+            return token
+
+    def forget(
+        self,
+        server_url: str,
+        username: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+        offline_token: Optional[str] = None,
+    ) -> None:
+        """Remove the cached tokens of a user (only if its offline token is
+        offline_token, when given), so they are minted again"""
+        key = (project, server_url, realm, username)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            token = self.tokens.get(key)
+            if token is not None and offline_token in (None, token.offline_token):
+                del self.tokens[key]
+
+    def bearer_token(
+        self,
+        server_url: str,
+        username: str,
+        password: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+    ) -> str:
+        """Return the bearer token (offline token) of a user for the Web API"""
+        return self.get(server_url, username, password, realm, project).offline_token
+
+    def access_token(
+        self,
+        server_url: str,
+        username: str,
+        password: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+    ) -> str:
+        """Return a valid access token of a user"""
+        return self.get(server_url, username, password, realm, project).access_token
+
+    def auth(
+        self,
+        server_url: str,
+        username: str,
+        password: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+    ) -> "BearerAuth":
+        """Return a requests authentication with the bearer token of a user
+        (see BearerAuth)"""
+        return BearerAuth(self, server_url, username, password, realm, project)
+
+
+class BearerAuth(AuthBase):
+    """Authenticate requests to the Web API with the bearer token of a user
+
+    When the Web API rejects the token with a 401 response (e.g. the offline
+    session of the user has been removed from Keycloak), the token is minted
+    again and the request sent once more.
+
+    args:
+        tokens: the cache of bearer tokens
+
+        server_url, username, password, realm, project: see BearerTokens.get
+    """
+
+    def __init__(
+        self,
+        tokens: BearerTokens,
+        server_url: str,
+        username: str,
+        password: str,
+        realm: str = DEFAULT_REALM,
+        project: str = "",
+    ):
+        self.tokens = tokens
+        self.server_url = server_url
+        self.username = username
+        self.password = password
+        self.realm = realm
+        self.project = project
+
+    def _bearer_token(self) -> str:
+        return self.tokens.bearer_token(
+            self.server_url, self.username, self.password, self.realm, self.project
+        )
+
+    def handle_401(self, r: requests.Response, **kwargs) -> requests.Response:
+        if r.status_code != 401:
+            return r
+        authorization = r.request.headers["Authorization"]
+        assert isinstance(authorization, str)
+        rejected = authorization[len("Bearer ") :]
+        logger.debug("Bearer token of %s rejected, minting it again", self.username)
+        self.tokens.forget(
+            self.server_url,
+            self.username,
+            self.realm,
+            self.project,
+            offline_token=rejected,
+        )
+        # consume the content so the connection can be released
+        r.content
+        r.close()
+        prep = r.request.copy()
+        prep.headers["Authorization"] = f"Bearer {self._bearer_token()}"
+        # the token is minted again only once
+        prep.hooks = dict(prep.hooks, response=[])
+        _r = r.connection.send(prep, **kwargs)
+        _r.history.append(r)
+        _r.request = prep
+        return _r
+
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        r.headers["Authorization"] = f"Bearer {self._bearer_token()}"
+        r.register_hook("response", self.handle_401)
+        return r
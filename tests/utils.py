@@ -8,9 +8,10 @@ import hashlib
 import itertools
 import logging
 import random
-import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from os.path import join
-from typing import Any, Callable, Generator, List, Mapping, Optional, Tuple
+from typing import Dict, Generator, List, Mapping, Optional, Tuple
 from urllib.parse import urljoin
 
 import requests
@@ -75,18 +76,77 @@ def api_get(
     return resp.json()
 
 
-def retry_until_success(
-    operation: Callable[..., bool],
-    error_message="Operation did not succeed after multiple retries",
-    max_attempts: int = 120,
-) -> Any:
-    for _ in range(max_attempts):
-        ret = operation()
-        if ret:
-            return ret
-        time.sleep(1)
-    else:
-        raise AssertionError(error_message)
+# retry policy of the requests polling the API until the result is ready
+POLL_RETRY = Retry(
+    total=60,
+    backoff_factor=0.1,
+    status_forcelist=[404, 413, 429, 502, 503, 504],
+)
+
+
+def pooled_session(pool_size: int = 10, retry: Optional[Retry] = None):
+    """Return a requests.Session keeping up to pool_size connections alive per
+    host, whose requests are retried according to the retry policy"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry if retry is not None else 0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HTTPSessions:
+    """Long-lived HTTP sessions, one per retry policy
+
+    Sessions are never re-configured once created, so their connection pools
+    (and kept alive connections) are reused by all the requests using the same
+    retry policy, and they can safely be shared between threads. Their cookies
+    are not meant to outlive a test module (see :meth:`clear_cookies`).
+
+    args:
+        pool_size: maximum number of connections kept alive per host and
+            session
+
+        poll_retry: the retry policy of the polling session
+    """
+
+    def __init__(self, pool_size: int = 10, poll_retry: Retry = POLL_RETRY):
+        self.pool_size = pool_size
+        self.poll_retry = poll_retry
+        self.sessions: Dict[Optional[Retry], requests.Session] = {}
+        self.lock = threading.Lock()
+
+    def get(self, retry: Optional[Retry] = None) -> requests.Session:
+        """Return the session whose requests are retried according to retry"""
+        with self.lock:
+            if retry not in self.sessions:
+                self.sessions[retry] = pooled_session(self.pool_size, retry)
+            return self.sessions[retry]
+
+    @property
+    def plain(self) -> requests.Session:
+        """Session for requests which are not retried"""
+        return self.get()
+
+    @property
+    def polling(self) -> requests.Session:
+        """Session for requests polling the API until the result is ready"""
+        return self.get(self.poll_retry)
+
+    def clear_cookies(self) -> None:
+        """Forget the cookies (e.g. web app sessions) set in all the sessions"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.cookies.clear()
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
 
 
 def api_poll(
@@ -96,20 +156,12 @@ def api_poll(
     verb: str = "GET",
     **kwargs,
 ):
-    """Poll the API at path until it returns an OK result"""
-    session.mount(
-        "http://",
-        HTTPAdapter(
-            max_retries=Retry(
-                total=60,
-                backoff_factor=0.1,
-                status_forcelist=[404, 413, 429, 502, 503, 504],
-            )
-        ),
-    )
+    """Poll the API at path until it returns an OK result
+
+    The session is expected to retry requests until the result is ready
+    (e.g. the polling session of :class:`HTTPSessions`)."""
     url = urljoin(baseurl, path)
     resp = session.request(verb, url, **kwargs)
-    session.mount("http://", HTTPAdapter())
     if not resp.ok:
         raise AssertionError(f"Polling {url} failed")
     return resp
@@ -120,27 +172,72 @@ def api_get_directory(
     dirid: str,
     currentpath: str = "",
     session=None,
+    max_workers: int = 8,
+    cache: Optional[Dict[str, List[Mapping]]] = None,
 ) -> Generator[Tuple[str, Mapping], None, None]:
-    """Recursively retrieve directory description from the archive"""
-    directory = api_get(apiurl, f"directory/{dirid}/", session=session)
-    for direntry in directory:
-        path = join(currentpath, direntry["name"])
-        if direntry["type"] != "dir":
-            yield (path, direntry)
-        else:
-            yield from api_get_directory(
-                apiurl, direntry["target"], path, session=session
-            )
+    """Recursively retrieve directory description from the archive
+
+    The directory tree is walked breadth-first, up to max_workers directories
+    being retrieved concurrently; (path, entry) tuples of non-directory entries
+    are yielded as soon as their parent directory has been retrieved, so in no
+    particular order.
+
+    args:
+        apiurl: the base URL of the archive API
+
+        dirid: the id of the root directory
 
+        currentpath: the path of the root directory, prepended to yielded paths
+
+        session: an optional requests.Session, shared by the worker threads
+
+        max_workers: maximum number of concurrent directory queries
+
+        cache: an optional dict, indexed by directory id, in which directory
+            listings are stored; since directories are immutable, it can be
+            reused between calls querying the same archive
+    """
+    if cache is None:
+        cache = {}
+
+    def fetch(dir_id: str) -> List[Mapping]:
+        entries = cache.get(dir_id)
+        if entries is None:
+            entries = api_get(apiurl, f"directory/{dir_id}/", session=session)
+            cache[dir_id] = entries
+        return entries
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # directory id -> future of its listing, while being retrieved
+    inflight: Dict[str, Future] = {}
+    # future -> (directory id, paths of this directory in the tree)
+    pending: Dict[Future, Tuple[str, List[str]]] = {}
+
+    def walk(dir_id: str, path: str) -> None:
+        future = inflight.get(dir_id)
+        if future is None:
+            future = executor.submit(fetch, dir_id)
+            inflight[dir_id] = future
+            pending[future] = (dir_id, [])
+        pending[future][1].append(path)
 
-def generate_bearer_token(webapp_host, username, password):
     try:
-        return webapp_host.check_output(
-            f"swh auth -u http://nginx/keycloak/auth/ generate-token {username} "
-            f"-p {password}"
-        )
-    except AssertionError:
-        return False
+        walk(dirid, currentpath)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_id, paths = pending.pop(future)
+                del inflight[dir_id]
+                entries = future.result()
+                for path in paths:
+                    for direntry in entries:
+                        entry_path = join(path, direntry["name"])
+                        if direntry["type"] != "dir":
+                            yield (entry_path, direntry)
+                        else:
+                            walk(direntry["target"], entry_path)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def compose_host_for_service(docker_compose, service):